@@ -0,0 +1,985 @@
+"""
+Figma UI/UX Analysis Tool ベンチマーク
+APIキー不要で、合成したFigmaノードツリーを使ってホットパスの処理時間を計測
+"""
+
+import argparse
+import datetime
+import gc
+import importlib.util
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from main import (
+    MIN_FONT_SIZE,
+    PROMPT_FORMATS,
+    NodeTable,
+    analysis_cache_key,
+    analyze_spacing,
+    collect_text_contrast_pairs,
+    contrast_ratios,
+    count_tokens,
+    dumps_json,
+    loads_json,
+    parse_simplified_nodes,
+    plan_chunks,
+    run_accessibility_rules,
+    serialize_design,
+    simplify_node_data,
+)
+
+
+def generate_tree(node_count: int, fanout: int = 8, seed: int = 0) -> dict[str, Any]:
+    """
+    指定ノード数の合成Figmaノードツリーを生成（generate_figma_tree の既定の形状）
+
+    Args:
+        node_count: 生成するノード数
+        fanout: 1ノードあたりの最大子要素数
+        seed: 乱数シード
+
+    Returns:
+        dict: Figma APIの document と同じ形式のノードツリー
+    """
+    return generate_figma_tree(node_count, fanout=fanout, seed=seed)
+
+
+def generate_deep_tree(depth: int) -> dict[str, Any]:
+    """
+    子要素が1つずつ連なった、指定の深さの合成ノードツリーを生成
+
+    Args:
+        depth: ツリーの深さ
+
+    Returns:
+        dict: ノードツリー
+    """
+    rng = random.Random(0)
+    root = _make_node(rng, 0, "FRAME")
+    node = root
+    for i in range(1, depth):
+        child = _make_node(rng, i, "FRAME")
+        node["children"] = [child]
+        node = child
+    return root
+
+
+def _make_node(rng: random.Random, index: int, node_type: str) -> dict[str, Any]:
+    # simplify_node_data が捨てるキーも含めて、実際のレスポンスに近い形にする
+    node: dict[str, Any] = {
+        "id": f"1:{index}",
+        "name": f"{node_type.title()} {index}",
+        "type": node_type,
+        "visible": True,
+        "blendMode": "PASS_THROUGH",
+        "absoluteBoundingBox": {
+            "x": rng.uniform(0, 1440),
+            "y": rng.uniform(0, 4000),
+            "width": rng.uniform(8, 400),
+            "height": rng.uniform(8, 200),
+        },
+        "absoluteRenderBounds": {"x": 0, "y": 0, "width": 0, "height": 0},
+        "constraints": {"vertical": "TOP", "horizontal": "LEFT"},
+        "fills": [
+            {
+                "blendMode": "NORMAL",
+                "type": "SOLID",
+                "color": {
+                    "r": rng.random(),
+                    "g": rng.random(),
+                    "b": rng.random(),
+                    "a": 1,
+                },
+            }
+        ],
+        "strokes": [],
+        "effects": [],
+    }
+    if node_type == "TEXT":
+        node["characters"] = f"テキスト {index}"
+        node["style"] = {
+            "fontFamily": "Inter",
+            "fontPostScriptName": None,
+            "fontWeight": rng.choice((400, 500, 700)),
+            "fontSize": rng.choice((10, 12, 14, 16, 24)),
+            "textAlignHorizontal": "LEFT",
+            "letterSpacing": 0,
+            "lineHeightPx": 20,
+        }
+    return node
+
+
+# 繰り返し配置するインスタンス（アイコン・タイトル・説明）の子要素: (type, name, (x, y, 幅, 高さ))
+LIST_ROW_TEMPLATE = (
+    ("INSTANCE", "Icon", (16, 16, 40, 40)),
+    ("TEXT", "Title", (72, 14, 280, 24)),
+    ("TEXT", "Description", (72, 40, 280, 18)),
+)
+# インスタンス1つあたりのノード数（インスタンス自身を含む）
+LIST_ROW_SIZE = len(LIST_ROW_TEMPLATE) + 1
+
+
+def _make_list_row(
+    rng: random.Random, index: int, x: float, y: float
+) -> dict[str, Any]:
+    # 位置以外は同じ構造・名前・スタイルのインスタンス（ID は index から連番）
+    instance = _make_node(rng, index, "INSTANCE")
+    instance["name"] = "List Row"
+    instance["absoluteBoundingBox"] = {"x": x, "y": y, "width": 375, "height": 72}
+    instance["fills"][0]["color"] = {"r": 1, "g": 1, "b": 1, "a": 1}
+    instance["children"] = []
+    for node_type, name, (child_x, child_y, width, height) in LIST_ROW_TEMPLATE:
+        index += 1
+        child = _make_node(random.Random(name), index, node_type)
+        child["name"] = name
+        child["absoluteBoundingBox"] = {
+            "x": x + child_x,
+            "y": y + child_y,
+            "width": width,
+            "height": height,
+        }
+        if node_type == "TEXT":
+            child["characters"] = name
+        instance["children"].append(child)
+    return instance
+
+
+def generate_instance_frame(rows: int, seed: int = 0) -> dict[str, Any]:
+    """
+    同じ構造の行（アイコン・タイトル・説明のインスタンス）を縦に並べた合成フレームを生成
+
+    Args:
+        rows: 行の数
+        seed: 乱数シード
+
+    Returns:
+        dict: 軽量化済みと同じ形式のノードツリー
+    """
+    rng = random.Random(seed)
+    root = _make_node(rng, 0, "FRAME")
+    root["absoluteBoundingBox"] = {"x": 0, "y": 0, "width": 375, "height": rows * 72}
+    root["children"] = []
+    index = 1
+    for row in range(rows):
+        root["children"].append(_make_list_row(rng, index, 0, row * 72))
+        index += LIST_ROW_SIZE
+
+    return simplify_node_data(root)
+
+
+def generate_text_frame(text_count: int, texts_per_card: int = 10, seed: int = 0):
+    """
+    背景色付きのカードにTEXTノードを並べた、コントラスト検査用の合成フレームを生成
+
+    Args:
+        text_count: TEXTノードの数
+        texts_per_card: 1カードあたりのTEXTノード数
+        seed: 乱数シード
+
+    Returns:
+        dict: 軽量化済みと同じ形式のノードツリー
+    """
+    rng = random.Random(seed)
+    root = _make_node(rng, 0, "FRAME")
+    root["fills"][0]["color"] = {"r": 1, "g": 1, "b": 1, "a": 1}
+    root["children"] = []
+
+    for i in range(text_count):
+        if i % texts_per_card == 0:
+            card = _make_node(rng, len(root["children"]), "FRAME")
+            card["children"] = []
+            root["children"].append(card)
+        card["children"].append(_make_node(rng, text_count + i, "TEXT"))
+
+    return simplify_node_data(root)
+
+
+def generate_flat_text_frame(text_count: int, columns: int = 12, seed: int = 0):
+    """
+    背景のチップとTEXTノードを1つのフレームに兄弟として並べた、フラットなフレームを生成
+
+    Args:
+        text_count: TEXTノードの数
+        columns: 1行あたりのチップの数
+        seed: 乱数シード
+
+    Returns:
+        dict: 軽量化済みと同じ形式のノードツリー
+    """
+    rng = random.Random(seed)
+    root = _make_node(rng, 0, "FRAME")
+    root["fills"][0]["color"] = {"r": 1, "g": 1, "b": 1, "a": 1}
+    rows = -(-text_count // columns)
+    # フレーム全体を覆うセクションの背景（大きな兄弟要素）
+    background = _make_node(rng, 1, "RECTANGLE")
+    background["absoluteBoundingBox"] = {
+        "x": 0,
+        "y": 0,
+        "width": columns * 120,
+        "height": rows * 40,
+    }
+    root["children"] = [background]
+
+    for i in range(text_count):
+        x, y = (i % columns) * 120, (i // columns) * 40
+        chip = _make_node(rng, 2 + i * 2, "RECTANGLE")
+        chip["absoluteBoundingBox"] = {"x": x, "y": y, "width": 110, "height": 32}
+        text = _make_node(rng, 3 + i * 2, "TEXT")
+        text["absoluteBoundingBox"] = {
+            "x": x + 8,
+            "y": y + 6,
+            "width": 90,
+            "height": 20,
+        }
+        root["children"] += [chip, text]
+
+    return simplify_node_data(root)
+
+
+def generate_figma_tree(
+    node_count: int,
+    fanout: int = 8,
+    depth: int | None = None,
+    text_ratio: float = 0.3,
+    instance_ratio: float = 0.0,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """
+    形状を指定して、実際のファイルに近い合成Figmaノードツリーを生成（幅優先で子要素を追加）
+
+    子要素を持つのは FRAME と GROUP だけで、TEXT・RECTANGLE・インスタンスの内部には追加しない。
+
+    Args:
+        node_count: 生成するノード数
+        fanout: 1ノードあたりの最大子要素数
+        depth: ツリーの最大の深さ（ルートが1、None の場合は制限しない）
+        text_ratio: 子要素のうち TEXT ノードにする割合
+        instance_ratio: 子要素のうち、同じ構造のインスタンス（LIST_ROW_TEMPLATE）にする割合
+        seed: 乱数シード
+
+    Returns:
+        dict: Figma APIの document と同じ形式のノードツリー
+
+    Raises:
+        ValueError: depth と fanout の範囲で node_count のノードを配置できない場合
+    """
+    rng = random.Random(seed)
+    root = _make_node(rng, 0, "FRAME")
+    # (子要素を追加できるノード, 深さ)
+    queue = [(root, 1)]
+    created = 1
+    head = 0
+
+    while created < node_count:
+        if head == len(queue):
+            raise ValueError(
+                f"depth={depth}, fanout={fanout} では {node_count:,}ノードを配置できません "
+                f"({created:,}ノードで上限)"
+            )
+        parent, level = queue[head]
+        head += 1
+        if depth is not None and level >= depth:
+            continue
+        parent["children"] = []
+        bbox = parent["absoluteBoundingBox"]
+        slots = min(fanout, node_count - created)
+        for slot in range(slots):
+            # 子要素を追加できるノードが残っていなければ、最後の1つは FRAME にする
+            needs_container = slot == slots - 1 and head == len(queue)
+            if (
+                not needs_container
+                and rng.random() < instance_ratio
+                and node_count - created >= LIST_ROW_SIZE
+            ):
+                child = _make_list_row(
+                    rng, created, bbox["x"], bbox["y"] + rng.uniform(0, bbox["height"])
+                )
+                created += LIST_ROW_SIZE
+            else:
+                if needs_container:
+                    node_type = "FRAME"
+                elif rng.random() < text_ratio:
+                    node_type = "TEXT"
+                else:
+                    node_type = rng.choice(("FRAME", "GROUP", "RECTANGLE"))
+                child = _make_node(rng, created, node_type)
+                created += 1
+                if node_type in ("FRAME", "GROUP"):
+                    queue.append((child, level + 1))
+            parent["children"].append(child)
+            if created >= node_count:
+                break
+
+    return root
+
+
+def simplify_node_data_recursive(node: dict[str, Any]) -> dict[str, Any]:
+    """
+    再帰版の simplify_node_data（比較用の旧実装）
+    """
+    simplified = {}
+
+    if "id" in node:
+        simplified["id"] = node["id"]
+    if "name" in node:
+        simplified["name"] = node["name"]
+    if "type" in node:
+        simplified["type"] = node["type"]
+
+    if "absoluteBoundingBox" in node:
+        bbox = node["absoluteBoundingBox"]
+        simplified["absoluteBoundingBox"] = {
+            "x": bbox.get("x"),
+            "y": bbox.get("y"),
+            "width": bbox.get("width"),
+            "height": bbox.get("height"),
+        }
+
+    if "fills" in node:
+        simplified["fills"] = node["fills"]
+
+    if node.get("type") == "TEXT":
+        if "characters" in node:
+            simplified["characters"] = node["characters"]
+
+        if "style" in node:
+            style = node["style"]
+            simplified["style"] = {
+                "fontFamily": style.get("fontFamily"),
+                "fontWeight": style.get("fontWeight"),
+                "fontSize": style.get("fontSize"),
+                "letterSpacing": style.get("letterSpacing"),
+                "lineHeightPx": style.get("lineHeightPx"),
+            }
+
+    if "children" in node and node["children"]:
+        simplified["children"] = [
+            simplify_node_data_recursive(child) for child in node["children"]
+        ]
+
+    return simplified
+
+
+def best_of(func: Callable[[], Any], repeat: int) -> float:
+    """
+    関数を repeat 回実行し、最短の実行時間（秒）を返す
+    """
+    return min(compare(func, repeat=repeat)[0])
+
+
+def compare(*funcs: Callable[[], Any], repeat: int) -> list[list[float]]:
+    """
+    複数の関数を交互に repeat 回ずつ実行し、それぞれの実行時間（秒）を返す
+
+    交互に実行することで、計測中のCPU負荷の変動が片方に偏らないようにする。
+    """
+    timings: list[list[float]] = [[] for _ in funcs]
+    for _ in range(repeat):
+        for func, func_timings in zip(funcs, timings, strict=True):
+            started_at = time.perf_counter()
+            func()
+            func_timings.append(time.perf_counter() - started_at)
+    return timings
+
+
+def bench_simplify(args: argparse.Namespace) -> None:
+    """
+    simplify_node_data の反復版と再帰版を比較
+
+    Raises:
+        SystemExit: 出力が一致しない場合、または反復版が --max-ratio を超えて遅い場合
+    """
+    print(f"ツリーを生成中... (ノード数: {args.nodes}, fanout: {args.fanout})")
+    tree = generate_tree(args.nodes, args.fanout)
+
+    if simplify_node_data(tree) != simplify_node_data_recursive(tree):
+        print("エラー: 反復版と再帰版の出力が一致しません")
+        raise SystemExit(1)
+
+    # suite と同様に入力ツリーを GC の走査対象から外し、世代別GCの発生タイミングの差で
+    # どちらかが不利にならないようにする
+    gc.collect()
+    gc.freeze()
+    try:
+        iterative_timings, recursive_timings = compare(
+            lambda: simplify_node_data(tree),
+            lambda: simplify_node_data_recursive(tree),
+            repeat=args.repeat,
+        )
+    finally:
+        gc.unfreeze()
+    iterative = min(iterative_timings)
+    recursive = min(recursive_timings)
+    ratio = iterative / recursive
+
+    print(f"  反復版: {iterative * 1000:.1f} ms")
+    print(f"  再帰版: {recursive * 1000:.1f} ms")
+    print(f"  比率 (反復/再帰): {ratio:.2f}")
+    if args.max_ratio and ratio > args.max_ratio:
+        print(f"エラー: 反復版が再帰版の {args.max_ratio} 倍を超えて遅くなっています")
+        raise SystemExit(1)
+
+    # 再帰上限を大きく超える深さでも RecursionError が発生しないことを確認
+    deep_tree = generate_deep_tree(args.depth)
+    deep = best_of(lambda: simplify_node_data(deep_tree), 1)
+    print(f"  深さ {args.depth} のツリー: {deep * 1000:.1f} ms (軽量化)")
+
+    # デコードから分析キャッシュのキーまでの経路全体も確認する
+    # （json 形式はインデントが深さに比例して出力が深さの2乗で増えるため、別の深さで確認）
+    started_at = time.perf_counter()
+    body = dumps_json(
+        {"nodes": {"1:0": {"document": generate_deep_tree(args.path_depth)}}}
+    )
+    path_json = simplify_node_data(loads_json(body)["nodes"]["1:0"]["document"])
+    for prompt_format in PROMPT_FORMATS:
+        serialize_design(path_json, prompt_format)
+        analysis_cache_key(path_json, prompt_format, local_rules=True)
+    print(
+        f"  深さ {args.path_depth} のツリー: "
+        f"{(time.perf_counter() - started_at) * 1000:.1f} ms "
+        "(デコード・軽量化・全形式のシリアライズ・キャッシュキー)"
+    )
+
+
+def measure_peak(func: Callable[[], Any]) -> tuple[float, float]:
+    """
+    関数を1回実行し、(実行時間（秒）, tracemalloc によるピークメモリ（MB）) を返す
+    """
+    tracemalloc.start()
+    try:
+        started_at = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started_at
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def measure_retained(func: Callable[[], Any]) -> float:
+    """
+    関数を1回実行し、戻り値が保持しているメモリ（MB）を tracemalloc で返す
+    """
+    tracemalloc.start()
+    try:
+        result = func()
+        retained = tracemalloc.get_traced_memory()[0]
+        del result
+    finally:
+        tracemalloc.stop()
+    return retained / 1024 / 1024
+
+
+def walk_small_text(design_json: dict[str, Any]) -> list[str]:
+    """
+    辞書のツリーをたどって、フォントサイズが小さい TEXT ノードを集める（比較用）
+    """
+    found = []
+    stack = [design_json]
+    while stack:
+        node = stack.pop()
+        font_size = (node.get("style") or {}).get("fontSize")
+        if font_size is not None and font_size < MIN_FONT_SIZE:
+            found.append(node["id"])
+        stack.extend(node.get("children") or [])
+    return found
+
+
+def bench_nodestore(args: argparse.Namespace) -> None:
+    """
+    ネストした辞書と列指向の NodeTable で、保持メモリと走査時間を比較
+    """
+    print(f"ツリーを生成中... (ノード数: {args.nodes}, fanout: {args.fanout})")
+    tree = generate_tree(args.nodes, args.fanout)
+
+    simplified = simplify_node_data(tree)
+    table = NodeTable.from_node(tree)
+    if table.to_dict() != simplified:
+        print("エラー: NodeTable から戻した辞書が simplify_node_data と一致しません")
+        raise SystemExit(1)
+    if len(table.small_text_indices(MIN_FONT_SIZE)) != len(walk_small_text(simplified)):
+        print("エラー: NodeTable と辞書の走査結果が一致しません")
+        raise SystemExit(1)
+
+    dict_memory = measure_retained(lambda: simplify_node_data(tree))
+    table_memory = measure_retained(lambda: NodeTable.from_node(tree))
+    dict_timings, table_timings = compare(
+        lambda: simplify_node_data(tree),
+        lambda: NodeTable.from_node(tree),
+        repeat=3,
+    )
+    print(
+        f"  辞書:      作成 {min(dict_timings) * 1000:.0f} ms, 保持 {dict_memory:.1f} MB"
+    )
+    print(
+        f"  NodeTable: 作成 {min(table_timings) * 1000:.0f} ms, 保持 {table_memory:.1f} MB"
+    )
+
+    walk_timings, scan_timings = compare(
+        lambda: walk_small_text(simplified),
+        lambda: table.small_text_indices(MIN_FONT_SIZE),
+        repeat=args.repeat,
+    )
+    print(f"  小さいフォントの検索 辞書の走査: {min(walk_timings) * 1000:.1f} ms")
+    print(f"  小さいフォントの検索 列の走査:   {min(scan_timings) * 1000:.1f} ms")
+
+
+def bench_stream(args: argparse.Namespace) -> None:
+    """
+    レスポンス全体の json.loads + simplify_node_data と、ストリーミングパースを比較
+    """
+    print(f"レスポンスを生成中... (ノード数: {args.nodes})")
+    tree = generate_tree(args.nodes, args.fanout)
+    body = json.dumps({"nodes": {"1:0": {"document": tree}}, "version": "1"}).encode()
+    del tree
+    print(f"  レスポンスサイズ: {len(body) / 1024 / 1024:.1f} MB")
+
+    def load_full() -> dict[str, Any]:
+        return simplify_node_data(json.loads(body)["nodes"]["1:0"]["document"])
+
+    def load_stream() -> dict[str, Any]:
+        return parse_simplified_nodes(io.BytesIO(body))[0]["1:0"]
+
+    if load_full() != load_stream():
+        print("エラー: ストリーミングパースの出力が一致しません")
+        raise SystemExit(1)
+
+    full_seconds, full_peak = measure_peak(load_full)
+    stream_seconds, stream_peak = measure_peak(load_stream)
+    print(f"  json.loads + simplify: {full_seconds:.2f} 秒, ピーク {full_peak:.1f} MB")
+    print(
+        f"  ストリーミング:        {stream_seconds:.2f} 秒, ピーク {stream_peak:.1f} MB"
+    )
+
+
+def bench_contrast(args: argparse.Namespace) -> None:
+    """
+    コントラスト比の計算を NumPy による一括計算と1組ずつの計算で比較
+
+    色の組の抽出は、カードに分かれたフレームと、兄弟が数千件あるフラットなフレームで計測する。
+    """
+    design_json = generate_text_frame(args.text_nodes)
+    flat = generate_flat_text_frame(args.text_nodes)
+    collect_seconds = best_of(lambda: collect_text_contrast_pairs(design_json), 3)
+    flat_seconds = best_of(lambda: collect_text_contrast_pairs(flat), 3)
+    pairs, _ = collect_text_contrast_pairs(design_json)
+    foregrounds = [p[1] for p in pairs]
+    backgrounds = [p[2] for p in pairs]
+
+    vectorized = contrast_ratios(foregrounds, backgrounds)
+    scalar = contrast_ratios(foregrounds, backgrounds, use_numpy=False)
+    if any(abs(a - b) > 1e-9 for a, b in zip(vectorized, scalar, strict=True)):
+        print("エラー: NumPy 版と1組ずつの計算結果が一致しません")
+        raise SystemExit(1)
+
+    vectorized_timings, scalar_timings = compare(
+        lambda: contrast_ratios(foregrounds, backgrounds),
+        lambda: contrast_ratios(foregrounds, backgrounds, use_numpy=False),
+        repeat=args.repeat,
+    )
+    print(f"  TEXTノード: {len(pairs):,}組")
+    print(f"  色の組の抽出 カード:   {collect_seconds * 1000:.1f} ms")
+    print(f"  色の組の抽出 フラット: {flat_seconds * 1000:.1f} ms")
+    print(f"  コントラスト比 NumPy: {min(vectorized_timings) * 1000:.1f} ms")
+    print(f"  コントラスト比 1組ずつ: {min(scalar_timings) * 1000:.1f} ms")
+
+
+def bench_spacing(args: argparse.Namespace) -> None:
+    """
+    余白と揃えの集計時間を、ツリー全体と兄弟の多いフラットなフレームで計測
+    """
+    tree = simplify_node_data(generate_tree(args.nodes, args.fanout))
+    rng = random.Random(0)
+    flat = {
+        "id": "0:0",
+        "name": "Frame",
+        "type": "FRAME",
+        "children": [_make_node(rng, i, "RECTANGLE") for i in range(args.siblings)],
+    }
+
+    for label, design_json in (
+        (f"ツリー {args.nodes:,}ノード", tree),
+        (f"フラット 兄弟{args.siblings:,}件", flat),
+    ):
+        seconds = best_of(lambda d=design_json: analyze_spacing(d), args.repeat)
+        summary = analyze_spacing(design_json)
+        print(
+            f"  {label}: {seconds * 1000:.1f} ms "
+            f"(余白 {sum(summary.gap_counts.values()):,}件 / 検出 {len(summary.findings):,}件)"
+        )
+
+
+def bench_prompt(args: argparse.Namespace) -> None:
+    """
+    プロンプト形式ごとのサイズ・推定トークン数・シリアライズ時間を比較
+
+    ランダムなツリーに加えて、同じ構造の行を繰り返すフレームでも比較する。
+    """
+    designs = [
+        (
+            f"ランダムなツリー {args.nodes:,}ノード",
+            simplify_node_data(generate_tree(args.nodes, args.fanout)),
+        ),
+        (f"同じ構造の行 {args.rows:,}行", generate_instance_frame(args.rows)),
+    ]
+
+    for label, design_json in designs:
+        print(label)
+        baseline = None
+        for prompt_format in PROMPT_FORMATS:
+            seconds = best_of(
+                lambda d=design_json, f=prompt_format: serialize_design(d, f), 3
+            )
+            text = serialize_design(design_json, prompt_format)
+            tokens = count_tokens(text)
+            baseline = baseline or tokens
+            print(
+                f"  {prompt_format:>8}: {len(text):>12,}文字 / 推定 {tokens:>10,}トークン "
+                f"({tokens / baseline:.0%}), {seconds * 1000:.1f} ms"
+            )
+
+
+def _suite_cases(
+    tree: dict[str, Any], body: bytes, design_json: dict[str, Any]
+) -> dict[str, Callable[[], Any]]:
+    """
+    suite で計測する処理（名前から関数へのマッピング、計測順）
+    """
+    cases: dict[str, Callable[[], Any]] = {
+        "decode": lambda: json.loads(body),
+        "simplify": lambda: simplify_node_data(tree),
+    }
+    if importlib.util.find_spec("ijson") is not None:
+        cases["stream_parse"] = lambda: parse_simplified_nodes(io.BytesIO(body))
+    for prompt_format in PROMPT_FORMATS:
+        cases[f"serialize_{prompt_format}"] = lambda f=prompt_format: serialize_design(
+            design_json, f
+        )
+    cases["accessibility_rules"] = lambda: run_accessibility_rules(design_json)
+    cases["spacing"] = lambda: analyze_spacing(design_json)
+    cases["nodetable"] = lambda: NodeTable.from_node(design_json)
+    cases["plan_chunks"] = lambda: plan_chunks(design_json)
+    return cases
+
+
+def _compare_with_baseline(
+    report: dict[str, Any], baseline_path: str, max_ratio: float
+) -> None:
+    """
+    保存済みの結果と同じノード数・処理ごとに処理時間の比率を表示
+
+    Raises:
+        SystemExit: max_ratio を超えて遅くなった処理がある場合
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    baseline_results = {r["nodes"]: r for r in baseline["results"]}
+
+    print(f"\n比較 ({baseline_path}, {baseline['created_at']} との比率)")
+    regressions = []
+    for result in report["results"]:
+        base = baseline_results.get(result["nodes"])
+        if base is None:
+            continue
+        for name, seconds in result["seconds"].items():
+            base_seconds = base["seconds"].get(name)
+            if not base_seconds:
+                continue
+            ratio = seconds / base_seconds
+            print(f"  {result['nodes']:>10,}ノード {name:>20}: {ratio:.2f}")
+            if max_ratio and ratio > max_ratio:
+                regressions.append(f"{result['nodes']:,}ノード {name} ({ratio:.2f})")
+
+    if regressions:
+        print(
+            f"エラー: {max_ratio} 倍を超えて遅くなった処理があります: {', '.join(regressions)}"
+        )
+        raise SystemExit(1)
+
+
+def bench_suite(args: argparse.Namespace) -> None:
+    """
+    ノード数ごとにホットパス（デコード・軽量化・シリアライズ・ローカルの検査）を計測し、JSONに保存
+    """
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = []
+    for size in sizes:
+        print(f"ツリーを生成中... ({size:,}ノード)")
+        try:
+            tree = generate_figma_tree(
+                size,
+                fanout=args.fanout,
+                depth=args.depth,
+                text_ratio=args.text_ratio,
+                instance_ratio=args.instance_ratio,
+                seed=args.seed,
+            )
+        except ValueError as e:
+            print(f"エラー: {e}")
+            raise SystemExit(1) from None
+        body = json.dumps({"nodes": {"1:0": {"document": tree}}, "version": "1"})
+        body = body.encode("utf-8")
+        design_json = simplify_node_data(tree)
+
+        # 生成したデータを GC の走査対象から外し、ノード数が多いときの計測のばらつきを抑える
+        gc.collect()
+        gc.freeze()
+        seconds = {}
+        for name, func in _suite_cases(tree, body, design_json).items():
+            seconds[name] = best_of(func, args.repeat)
+            print(f"  {name:>20}: {seconds[name] * 1000:>10.1f} ms")
+        tokens = {
+            prompt_format: count_tokens(serialize_design(design_json, prompt_format))
+            for prompt_format in PROMPT_FORMATS
+        }
+        results.append(
+            {
+                "nodes": size,
+                "response_bytes": len(body),
+                "seconds": {name: round(value, 6) for name, value in seconds.items()},
+                "tokens": tokens,
+            }
+        )
+        del tree, body, design_json
+        gc.unfreeze()
+
+    report = {
+        "created_at": datetime.datetime.now()
+        .astimezone()
+        .isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "fanout": args.fanout,
+            "depth": args.depth,
+            "text_ratio": args.text_ratio,
+            "instance_ratio": args.instance_ratio,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {args.output}")
+
+    if args.baseline:
+        _compare_with_baseline(report, args.baseline, args.max_ratio)
+
+
+# main の読み込み時には import されないはずの重い依存（使う処理の中で import する）
+LAZY_MODULES = (
+    "google.generativeai",
+    "requests",
+    "dotenv",
+    "asyncio",
+    "http.server",
+    "numpy",
+    "ijson",
+)
+
+
+def import_times(code: str) -> dict[str, int]:
+    """
+    python -X importtime でコードを実行し、モジュールごとの累積の読み込み時間（μs）を返す
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def bench_startup(args: argparse.Namespace) -> None:
+    """
+    main の読み込み時間と --check の起動時間を計測し、重い依存が読み込まれていないか確認
+    """
+    baseline = import_times("pass")
+    runs = [import_times("import main") for _ in range(args.repeat)]
+    main_ms = min(run["main"] for run in runs) / 1000
+    imported = runs[0]
+
+    check_timings = []
+    for _ in range(args.repeat):
+        started_at = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "main.py", "--check"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            check=True,
+        )
+        check_timings.append(time.perf_counter() - started_at)
+
+    print(f"  import main:         {main_ms:.1f} ms")
+    print(
+        f"  main.py --check:     {min(check_timings) * 1000:.1f} ms（プロセス起動を含む）"
+    )
+    print(f"  読み込みの重いモジュール（上位{args.top}件）:")
+    heavy = sorted(
+        ((t, name) for name, t in imported.items() if name not in baseline),
+        reverse=True,
+    )
+    for cumulative, name in [h for h in heavy if h[1] != "main"][: args.top]:
+        print(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+    eager = [
+        name
+        for name in imported
+        if any(name == m or name.startswith(m + ".") for m in LAZY_MODULES)
+    ]
+    if eager:
+        print(
+            f"エラー: main の読み込み時に重い依存が import されています: {', '.join(eager)}"
+        )
+        raise SystemExit(1)
+    if args.max_ms and main_ms > args.max_ms:
+        print(f"エラー: import main が上限 ({args.max_ms:g} ms) を超えています")
+        raise SystemExit(1)
+
+
+def main():
+    """
+    ベンチマークのエントリーポイント
+    """
+    parser = argparse.ArgumentParser(
+        description="Figma UI/UX Analysis Tool ベンチマーク"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    simplify_parser = subparsers.add_parser(
+        "simplify", help="simplify_node_data の反復版と再帰版を比較"
+    )
+    simplify_parser.add_argument("--nodes", type=int, default=100_000)
+    simplify_parser.add_argument("--fanout", type=int, default=8)
+    simplify_parser.add_argument("--depth", type=int, default=100_000)
+    simplify_parser.add_argument(
+        "--path-depth",
+        type=int,
+        default=2_000,
+        help="デコードからキャッシュキーまでの経路全体を確認するツリーの深さ",
+    )
+    simplify_parser.add_argument("--repeat", type=int, default=10)
+    simplify_parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=1.1,
+        help="反復版/再帰版の処理時間の比率の上限（1.0 + 計測誤差の余裕）、0で判定しない",
+    )
+    simplify_parser.set_defaults(func=bench_simplify)
+
+    nodestore_parser = subparsers.add_parser(
+        "nodestore",
+        help="ネストした辞書と列指向の NodeTable の保持メモリ・走査時間を比較",
+    )
+    nodestore_parser.add_argument("--nodes", type=int, default=100_000)
+    nodestore_parser.add_argument("--fanout", type=int, default=8)
+    nodestore_parser.add_argument("--repeat", type=int, default=10)
+    nodestore_parser.set_defaults(func=bench_nodestore)
+
+    stream_parser = subparsers.add_parser(
+        "stream", help="ストリーミングパースのメモリ使用量を比較（ijson が必要）"
+    )
+    stream_parser.add_argument("--nodes", type=int, default=100_000)
+    stream_parser.add_argument("--fanout", type=int, default=8)
+    stream_parser.set_defaults(func=bench_stream)
+
+    contrast_parser = subparsers.add_parser(
+        "contrast", help="コントラスト比の一括計算（NumPy）と1組ずつの計算を比較"
+    )
+    contrast_parser.add_argument("--text-nodes", type=int, default=50_000)
+    contrast_parser.add_argument("--repeat", type=int, default=5)
+    contrast_parser.set_defaults(func=bench_contrast)
+
+    spacing_parser = subparsers.add_parser(
+        "spacing", help="余白と揃えの集計（ソート済みスイープ）の処理時間を計測"
+    )
+    spacing_parser.add_argument("--nodes", type=int, default=100_000)
+    spacing_parser.add_argument("--fanout", type=int, default=8)
+    spacing_parser.add_argument("--siblings", type=int, default=10_000)
+    spacing_parser.add_argument("--repeat", type=int, default=5)
+    spacing_parser.set_defaults(func=bench_spacing)
+
+    prompt_parser = subparsers.add_parser(
+        "prompt", help="プロンプト形式ごとのサイズと推定トークン数を比較"
+    )
+    prompt_parser.add_argument("--nodes", type=int, default=10_000)
+    prompt_parser.add_argument("--fanout", type=int, default=8)
+    prompt_parser.add_argument("--rows", type=int, default=1_000)
+    prompt_parser.set_defaults(func=bench_prompt)
+
+    suite_parser = subparsers.add_parser(
+        "suite",
+        help="合成ツリーのノード数ごとにホットパスを計測し、結果をJSONに保存",
+    )
+    suite_parser.add_argument(
+        "--sizes",
+        default="1000,10000,100000",
+        help="カンマ区切りのノード数（例: 1000,10000,100000,1000000）",
+    )
+    suite_parser.add_argument("--fanout", type=int, default=8)
+    suite_parser.add_argument(
+        "--depth",
+        type=int,
+        default=None,
+        help="ツリーの最大の深さ（デフォルト: 制限なし）",
+    )
+    suite_parser.add_argument("--text-ratio", type=float, default=0.3)
+    suite_parser.add_argument(
+        "--instance-ratio",
+        type=float,
+        default=0.1,
+        help="同じ構造のインスタンスにする子要素の割合",
+    )
+    suite_parser.add_argument("--seed", type=int, default=0)
+    suite_parser.add_argument("--repeat", type=int, default=3)
+    suite_parser.add_argument("--output", default="benchmark_results.json")
+    suite_parser.add_argument(
+        "--baseline", help="比較する過去の結果（suite の --output で保存したJSON）"
+    )
+    suite_parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=0,
+        help="--baseline と比べた処理時間の比率の上限、0で判定しない",
+    )
+    suite_parser.set_defaults(func=bench_suite)
+
+    startup_parser = subparsers.add_parser(
+        "startup", help="-X importtime で起動時間を計測し、重い依存の import を検出"
+    )
+    startup_parser.add_argument("--repeat", type=int, default=5)
+    startup_parser.add_argument("--top", type=int, default=10)
+    startup_parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=0,
+        help="import main の上限（ms）、0で判定しない",
+    )
+    startup_parser.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,26 +4,98 @@ Figma APIからデザインデータを取得し、Gemini AIでUI/UX・アクセ
 """
 
 import argparse
+import array
+import bisect
+import contextlib
+import csv
+import datetime
+import functools
+import hashlib
 import json
+import math
 import os
+import random
+import re
 import sys
-from typing import Any
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, NamedTuple, TextIO
 
-import google.generativeai as genai
-import requests
-from dotenv import load_dotenv
+# google.generativeai・requests・dotenv（と asyncio）は読み込みに時間がかかるため、
+# 使う処理の中で import する（--check やローカルの処理だけなら読み込まない）
+if TYPE_CHECKING:
+    import asyncio
 
+    import requests
 
-def load_env_vars() -> tuple[str, str]:
+# Figma APIのベースURL（環境変数 FIGMA_API_BASE_URL または --figma-base-url で変更できる）
+FIGMA_API_BASE_URL = "https://api.figma.com"
+# HTTP接続プールのサイズ（同一ホストへの同時接続数の上限）
+DEFAULT_POOL_SIZE = 10
+# HTTPタイムアウト秒数 (接続, 読み込み)
+DEFAULT_TIMEOUT = (10.0, 60.0)
+# リトライ回数の上限と指数バックオフの基準・上限秒数
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# 429 の Retry-After に従って待機する最大秒数（超える場合は待たずに失敗する）
+DEFAULT_MAX_RETRY_AFTER_SECONDS = 300.0
+# クライアント側のレート制限（1秒あたりのリクエスト数、0で無効）とバースト数
+DEFAULT_RATE_LIMIT = 2.0
+DEFAULT_RATE_BURST = 5
+# プロンプトに埋め込むデザインデータの形式
+PROMPT_FORMATS = ("json", "compact", "dedup")
+# パイプラインモードの各ステージの同時実行数
+DEFAULT_FETCH_CONCURRENCY = 4
+DEFAULT_SIMPLIFY_CONCURRENCY = 2
+DEFAULT_ANALYZE_CONCURRENCY = 4
+# パイプラインモードのレポート出力先
+DEFAULT_OUTPUT_DIR = "reports"
+# キャッシュの保存先（figma/ と gemini/ に分けて保存）と容量の上限
+DEFAULT_CACHE_DIR = ".cache"
+DEFAULT_CACHE_MAX_MB = 500
+# Gemini分析結果のキャッシュの有効期限（時間）
+DEFAULT_GEMINI_CACHE_TTL_HOURS = 24 * 7
+# サーバーモードでメモリに保持するキャッシュのエントリ数（種類ごと）
+DEFAULT_MEMORY_CACHE_ENTRIES = 256
+# サーバーモードの待ち受けアドレスと、リクエストを同時に処理するスレッド数
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8000
+DEFAULT_SERVER_WORKERS = 8
+# 計測するステージ（--metrics / --metrics-table の出力順）
+METRICS_STAGES = ("fetch", "decode", "simplify", "rules", "serialize", "llm", "write")
+# 分析に使うLLMのバックエンド
+LLM_BACKENDS = ("gemini", "fake")
+# フェイクのLLM（--llm fake）の最初の出力までの秒数と、レポートの推定トークン数
+DEFAULT_FAKE_LATENCY_SECONDS = 1.0
+DEFAULT_FAKE_OUTPUT_TOKENS = 800
+# Gemini のモデル名と生成設定
+GEMINI_MODEL_NAME = "gemini-2.5-pro"
+GEMINI_GENERATION_CONFIG = {"temperature": 0}
+
+
+def load_env_vars(require_gemini: bool = True) -> tuple[str, str]:
     """
     環境変数を読み込み、必要なAPIキーを取得
 
+    Args:
+        require_gemini: GEMINI_API_KEY を必須とするかどうか（フェイクのLLMでは不要）
+
     Returns:
-        tuple[str, str]: (FIGMA_ACCESS_TOKEN, GEMINI_API_KEY)
+        tuple[str, str]: (FIGMA_ACCESS_TOKEN, GEMINI_API_KEY（未設定で不要な場合は空文字列）)
 
     Raises:
         SystemExit: 環境変数が未設定の場合
     """
+    from dotenv import load_dotenv
+
     load_dotenv()
 
     figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
@@ -33,78 +105,915 @@ def load_env_vars() -> tuple[str, str]:
         print("エラー: FIGMA_ACCESS_TOKEN が .env に設定されていません")
         raise SystemExit(1)
 
-    if not gemini_key:
+    if not gemini_key and require_gemini:
         print("エラー: GEMINI_API_KEY が .env に設定されていません")
         raise SystemExit(1)
 
-    return figma_token, gemini_key
+    return figma_token, gemini_key or ""
 
 
-def fetch_figma_data(file_key: str, node_id: str, access_token: str) -> dict:
+class StageMetrics:
     """
-    Figma APIから指定されたノードのデータを取得
+    ステージごとの処理時間・データ量の集計（複数スレッドから更新される）
+
+    measure() で囲んだ区間の回数（calls）と実時間の合計（seconds）を記録する。
+    bytes・nodes・トークン数などは measure() が返す辞書に加えた値をステージごとに合計する。
+    """
+
+    def __init__(self):
+        self.stages: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> Iterator[dict[str, float]]:
+        """
+        with 文で囲んだ区間を stage の処理として計測
+
+        Args:
+            stage: ステージ名（METRICS_STAGES のいずれか）
+
+        Yields:
+            dict[str, float]: この区間で処理した bytes・nodes などを加える辞書
+        """
+        values: dict[str, float] = {}
+        started_at = time.perf_counter()
+        try:
+            yield values
+        finally:
+            values["seconds"] = time.perf_counter() - started_at
+            values["calls"] = 1
+            with self._lock:
+                totals = self.stages.setdefault(stage, {})
+                for key, value in values.items():
+                    totals[key] = totals.get(key, 0) + value
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """
+        現時点の集計を METRICS_STAGES の順に返す（秒数は小数第3位に丸める）
+        """
+        with self._lock:
+            stages = {name: dict(totals) for name, totals in self.stages.items()}
+        order = {name: index for index, name in enumerate(METRICS_STAGES)}
+        return {
+            name: {**totals, "seconds": round(totals["seconds"], 3)}
+            for name, totals in sorted(
+                stages.items(), key=lambda item: order.get(item[0], len(order))
+            )
+        }
+
+    def reset(self) -> None:
+        """
+        集計を空にする
+        """
+        with self._lock:
+            self.stages.clear()
+
+
+# プロセス全体で共有するステージごとの計測
+stage_metrics = StageMetrics()
+
+
+def peak_rss_mb() -> float | None:
+    """
+    プロセスのピーク常駐メモリ（MB）。resource モジュールがない環境（Windows）では None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB 単位、macOS はバイト単位
+    if sys.platform == "darwin":
+        peak //= 1024
+    return round(peak / 1024, 1)
+
+
+class RateLimiter:
+    """
+    トークンバケット方式のレートリミッター（スレッドセーフ）
+
+    複数のワーカーで1つのインスタンスを共有し、全体のリクエスト数を制限する。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate: 1秒あたりに補充されるトークン数
+            burst: バケットの容量（連続して送信できるリクエスト数）
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        トークンを1つ取得（不足している場合は補充されるまで待機）
+
+        Returns:
+            float: 待機した秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """
+    Retry-After ヘッダー（秒数またはHTTP日付）を待機秒数に変換
+
+    Args:
+        value: Retry-After ヘッダーの値
+
+    Returns:
+        float | None: 待機秒数（解釈できない場合は None）
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class FigmaClient:
+    """
+    Figma APIクライアント
+
+    requests.Session を共有し、TCP/TLS接続をプールして再利用する。
+    main やバッチ処理など複数のリクエストで1つのインスタンスを使い回すこと。
+
+    429 は Retry-After に従って、5xx と通信エラーはジッター付き指数バックオフで
+    リトライする。Retry-After が max_retry_after を超える場合は待たずに 429 を返す。
+    リクエストはトークンバケットで流量を制限する。
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: float | tuple[float, float] = DEFAULT_TIMEOUT,
+        keep_alive: bool = True,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        rate_limit: float = DEFAULT_RATE_LIMIT,
+        rate_burst: int = DEFAULT_RATE_BURST,
+        base_url: str = FIGMA_API_BASE_URL,
+        max_retry_after: float = DEFAULT_MAX_RETRY_AFTER_SECONDS,
+    ):
+        """
+        Args:
+            access_token: Figma APIアクセストークン
+            pool_size: 接続プールのサイズ
+            timeout: リクエストのタイムアウト秒数（単一値または (接続, 読み込み)）
+            keep_alive: Falseの場合はリクエストごとに接続を閉じる
+            max_retries: 429/5xx/通信エラー時のリトライ回数の上限
+            rate_limit: 1秒あたりの最大リクエスト数（0 の場合は制限しない）
+            rate_burst: 連続して送信できるリクエスト数
+            base_url: Figma APIのベースURL（モックサーバーでの負荷試験用に変更できる）
+            max_retry_after: 429 の Retry-After に従って待機する最大秒数
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.rate_limiter = (
+            RateLimiter(rate_limit, rate_burst) if rate_limit > 0 else None
+        )
+        self.session = requests.Session()
+
+        # リトライと待機時間の統計（複数スレッドから更新される）
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "throttled_seconds": 0.0,
+            "backoff_seconds": 0.0,
+        }
+        self._stats_lock = threading.Lock()
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.session.headers["X-Figma-Token"] = access_token
+        self.session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+
+    def get(
+        self, path: str, params: dict[str, str] | None = None, stream: bool = False
+    ) -> "requests.Response":
+        """
+        Figma APIにGETリクエストを送信
+
+        Args:
+            path: APIパス（例: /v1/files/{file_key}/nodes）
+            params: クエリパラメータ
+            stream: True の場合はレスポンス本文を読み込まずに返す
+
+        Returns:
+            requests.Response: レスポンス（リトライ上限に達した場合、または Retry-After が
+                max_retry_after を超える場合は最後のレスポンス）
+
+        Raises:
+            requests.exceptions.RequestException: リトライ上限まで通信に失敗した場合
+        """
+        import requests
+
+        url = f"{self.base_url}{path}"
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self._record("throttled_seconds", self.rate_limiter.acquire())
+            self._record("requests", 1)
+
+            is_last = attempt == self.max_retries
+            try:
+                response = self.session.get(
+                    url, params=params, timeout=self.timeout, stream=stream
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                if is_last:
+                    raise
+                print(f"通信エラーのためリトライします: {e}")
+                self._sleep("backoff_seconds", self._backoff(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code == 429 and not is_last:
+                self._record("rate_limited", 1)
+                wait = _parse_retry_after(response.headers.get("Retry-After"))
+                if wait is None:
+                    wait = self._backoff(attempt)
+                elif wait > self.max_retry_after:
+                    # 長時間ワーカーを止めないよう、待たずに失敗させる
+                    print(
+                        f"エラー: Figma APIのレート制限の解除まで {wait:,.0f}秒かかるため"
+                        f"リトライしません（上限: {self.max_retry_after:,.0f}秒、--max-retry-after で変更）"
+                    )
+                    return response
+                print(
+                    f"Figma APIのレート制限に達しました。{wait:.1f}秒後にリトライします"
+                )
+                response.close()
+                self._sleep("throttled_seconds", wait)
+                attempt += 1
+                continue
+
+            if response.status_code >= 500 and not is_last:
+                wait = self._backoff(attempt)
+                print(
+                    f"Figma APIがエラーを返しました (ステータスコード: "
+                    f"{response.status_code})。{wait:.1f}秒後にリトライします"
+                )
+                response.close()
+                self._sleep("backoff_seconds", wait)
+                attempt += 1
+                continue
+
+            return response
+
+    def _backoff(self, attempt: int) -> float:
+        # Full Jitter: 0 〜 min(上限, 基準 * 2^attempt) の一様乱数
+        return random.uniform(
+            0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+        )
+
+    def _sleep(self, stat: str, seconds: float) -> None:
+        self._record("retries", 1)
+        self._record(stat, seconds)
+        time.sleep(seconds)
+
+    def _record(self, stat: str, value: float) -> None:
+        with self._stats_lock:
+            self.stats[stat] += value
+
+    def close(self) -> None:
+        """
+        接続プールを解放
+        """
+        self.session.close()
+
+    def __enter__(self) -> "FigmaClient":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def loads_json(data: bytes | str) -> Any:
+    """
+    JSONをデコード（ネストがどれだけ深くても RecursionError にならない）
+
+    通常は json.loads を使い、標準の json モジュールの再帰の上限を超える深さの場合だけ、
+    ijson のパースイベント列から明示的なスタックで組み立て直す。
+
+    Args:
+        data: JSONのバイト列または文字列
+
+    Returns:
+        Any: デコードしたデータ
+
+    Raises:
+        ValueError: JSONとして不正な場合
+        SystemExit: 深いJSONのデコードに必要な ijson がインストールされていない場合
+    """
+    try:
+        return json.loads(data)
+    except RecursionError:
+        pass
+
+    try:
+        import ijson
+    except ImportError:
+        print(
+            "エラー: ネストが深いJSONのデコードには ijson が必要です (pip install ijson)"
+        )
+        raise SystemExit(1) from None
+
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    events = iter(ijson.basic_parse(data, use_float=True))
+    try:
+        event, value = next(events)
+        result = _build_stream_value(events, event, value)
+        for _ in events:
+            raise ValueError("JSONの末尾に余分なデータがあります")
+    except (ijson.JSONError, StopIteration) as e:
+        raise ValueError(f"JSONのデコードに失敗しました: {e}") from None
+    return result
+
+
+# dumps_json が値の終わりを表すために使う番兵
+_JSON_END = object()
+
+
+def dumps_json(
+    value: Any,
+    indent: int | None = None,
+    separators: tuple[str, str] | None = None,
+    sort_keys: bool = False,
+) -> str:
+    """
+    JSONにエンコード（ネストがどれだけ深くても RecursionError にならない）
+
+    json.dumps(value, ensure_ascii=False, ...) と同じ文字列を返す。
+    通常は json.dumps を使い、再帰の上限を超える深さの場合だけ明示的なスタックで書き出す。
+
+    Args:
+        value: JSONシリアライズ可能なデータ（辞書のキーは文字列）
+        indent: インデントの空白数（None の場合は改行しない）
+        separators: (要素の区切り, キーと値の区切り)（None の場合は json.dumps と同じ既定値）
+        sort_keys: 辞書をキーの順に並べるかどうか
+
+    Returns:
+        str: JSON文字列
+    """
+    try:
+        return json.dumps(
+            value,
+            ensure_ascii=False,
+            indent=indent,
+            separators=separators,
+            sort_keys=sort_keys,
+        )
+    except RecursionError:
+        pass
+
+    item_separator, key_separator = separators or (
+        (",", ": ") if indent is not None else (", ", ": ")
+    )
+    indent_text = None if indent is None else " " * indent
+    encode_scalar = json.JSONEncoder(ensure_ascii=False).encode
+    chunks: list[str] = []
+    # 書き出し中のコンテナごとの [要素のイテレータ, 辞書かどうか, 要素を書き出したか]
+    stack: list[list[Any]] = []
+
+    while True:
+        if isinstance(value, dict) and value:
+            items = sorted(value.items()) if sort_keys else value.items()
+            chunks.append("{")
+            stack.append([iter(items), True, False])
+        elif isinstance(value, (list, tuple)) and value:
+            chunks.append("[")
+            stack.append([iter(value), False, False])
+        else:
+            # スカラー値と空のコンテナ
+            chunks.append(encode_scalar(value))
+
+        # 次に書き出す値を探し、書き終えたコンテナは閉じる
+        while stack:
+            container = stack[-1]
+            item = next(container[0], _JSON_END)
+            if item is _JSON_END:
+                stack.pop()
+                if indent_text is not None:
+                    chunks.append("\n" + indent_text * len(stack))
+                chunks.append("}" if container[1] else "]")
+                continue
+            if container[2]:
+                chunks.append(item_separator)
+            container[2] = True
+            if indent_text is not None:
+                chunks.append("\n" + indent_text * len(stack))
+            if container[1]:
+                key, value = item
+                chunks.append(encode_scalar(key) + key_separator)
+            else:
+                value = item
+            break
+        else:
+            return "".join(chunks)
+
+
+class DiskCache:
+    """
+    JSONデータをファイルとして保存する、容量上限付きのディスクキャッシュ
+
+    エントリはグループ（サブディレクトリ）単位で管理し、
+    容量を超えた場合は最終アクセス日時が古いものから削除する（LRU）。
+    ファイルの更新日時を作成日時、アクセス日時を最終アクセス日時として扱う。
+    """
+
+    def __init__(
+        self, directory: str, max_bytes: int, ttl_seconds: float | None = None
+    ):
+        """
+        Args:
+            directory: キャッシュの保存先ディレクトリ
+            max_bytes: キャッシュ全体の最大バイト数
+            ttl_seconds: エントリの有効期限秒数（None の場合は無期限）
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _is_expired(self, stat: os.stat_result, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stat.st_mtime > self.ttl_seconds
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _group_dir(self, group: str) -> Path:
+        # ファイル名として安全な文字のみを使用
+        return self.directory / re.sub(r"[^A-Za-z0-9_.-]", "_", group)
+
+    def _path(self, group: str, key: str) -> Path:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self._group_dir(group) / f"{digest}.json"
+
+    def get(self, group: str, key: str) -> Any | None:
+        """
+        キャッシュからデータを取得
+
+        Args:
+            group: グループ名
+            key: キャッシュキー
+
+        Returns:
+            Any | None: キャッシュされたデータ（存在しない場合は None）
+        """
+        path = self._path(group, key)
+        now = time.time()
+        try:
+            stat = path.stat()
+            if self._is_expired(stat, now):
+                path.unlink(missing_ok=True)
+                self._count(hit=False)
+                return None
+            with open(path, encoding="utf-8") as f:
+                value = loads_json(f.read())
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        # LRU判定のため最終アクセス日時を更新（作成日時として使う更新日時は維持）
+        os.utime(path, (now, stat.st_mtime))
+        self._count(hit=True)
+        return value
+
+    def set(self, group: str, key: str, value: Any) -> None:
+        """
+        データをキャッシュに保存（容量の調整は evict() で行う）
+
+        Args:
+            group: グループ名
+            key: キャッシュキー
+            value: JSONシリアライズ可能なデータ
+        """
+        path = self._path(group, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 書き込み途中のファイルを読まないよう、一時ファイル経由で置き換える
+        # （同じキーを複数のスレッドが同時に書き込むため、一時ファイル名はスレッドごとに分ける）
+        tmp_path = path.with_name(
+            f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(dumps_json(value, separators=(",", ":")))
+        os.replace(tmp_path, path)
+
+    def evict(self) -> int:
+        """
+        有効期限切れのエントリを削除し、容量上限を超えている場合は
+        最終アクセス日時が古いエントリから削除
+
+        Returns:
+            int: 削除したエントリ数
+        """
+        entries = []
+        total_bytes = 0
+        removed = 0
+        now = time.time()
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if self._is_expired(stat, now):
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total_bytes += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+            removed += 1
+        return removed
+
+    def clear(self, group: str | None = None) -> int:
+        """
+        キャッシュを削除
+
+        Args:
+            group: 削除対象のグループ名（None の場合はすべて）
+
+        Returns:
+            int: 削除したエントリ数
+        """
+        pattern = f"{self._group_dir(group).name}/*.json" if group else "*/*.json"
+        removed = 0
+        for path in self.directory.glob(pattern):
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+
+class MemoryCache(DiskCache):
+    """
+    ディスクキャッシュの手前にプロセス内のLRUを置いたキャッシュ（サーバーモード用）
+
+    取得したデータはディスクから読み直さずにメモリから返す。
+    メモリに置くのは最近使った max_entries 件までで、ディスクへの保存は DiskCache と同じ。
+    返すデータは呼び出し元で共有されるため、変更しないこと。
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        ttl_seconds: float | None = None,
+        max_entries: int = DEFAULT_MEMORY_CACHE_ENTRIES,
+    ):
+        """
+        Args:
+            directory: キャッシュの保存先ディレクトリ
+            max_bytes: ディスクキャッシュ全体の最大バイト数
+            ttl_seconds: エントリの有効期限秒数（None の場合は無期限）
+            max_entries: メモリに保持する最大エントリ数
+        """
+        super().__init__(directory, max_bytes, ttl_seconds)
+        self.max_entries = max_entries
+        # (グループ, キー) から (保存日時, データ) への辞書（末尾が最近使ったもの）
+        self._entries: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+        self._entries_lock = threading.Lock()
+
+    def get(self, group: str, key: str) -> Any | None:
+        with self._entries_lock:
+            entry = self._entries.get((group, key))
+            if entry is not None:
+                stored_at, value = entry
+                if (
+                    self.ttl_seconds is None
+                    or time.time() - stored_at <= self.ttl_seconds
+                ):
+                    self._entries.move_to_end((group, key))
+                    self._count(hit=True)
+                    return value
+                del self._entries[(group, key)]
+
+        value = super().get(group, key)
+        if value is not None:
+            # 有効期限はディスクに保存した日時から数える
+            try:
+                stored_at = self._path(group, key).stat().st_mtime
+            except OSError:
+                stored_at = time.time()
+            self._remember(group, key, value, stored_at)
+        return value
+
+    def set(self, group: str, key: str, value: Any) -> None:
+        super().set(group, key, value)
+        self._remember(group, key, value, time.time())
+
+    def _remember(self, group: str, key: str, value: Any, stored_at: float) -> None:
+        with self._entries_lock:
+            self._entries[(group, key)] = (stored_at, value)
+            self._entries.move_to_end((group, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, group: str | None = None) -> int:
+        with self._entries_lock:
+            if group is None:
+                self._entries.clear()
+            else:
+                for entry_key in [k for k in self._entries if k[0] == group]:
+                    del self._entries[entry_key]
+        return super().clear(group)
+
+
+def fetch_figma_file_version(file_key: str, client: FigmaClient) -> str:
+    """
+    Figmaファイルの現在のバージョンを取得（depth=1 で本体を取得しない軽量なリクエスト）
 
     Args:
         file_key: FigmaファイルのキーID
-        node_id: 取得対象のノードID
-        access_token: Figma APIアクセストークン
+        client: Figma APIクライアント
 
     Returns:
-        dict: 指定されたノードのdocumentデータ
+        str: ファイルのバージョン（取得できない場合は lastModified）
 
     Raises:
         SystemExit: APIリクエストが失敗した場合
     """
-    url = f"https://api.figma.com/v1/files/{file_key}/nodes"
-    headers = {"X-Figma-Token": access_token}
-    params = {"ids": node_id}
-
-    print(f"Figma APIにリクエスト中... (file_key: {file_key}, node_id: {node_id})")
+    import requests
 
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = client.get(f"/v1/files/{file_key}", params={"depth": "1"})
+    except requests.exceptions.RequestException as e:
+        print(f"エラー: HTTPリクエストに失敗しました: {e}")
+        raise SystemExit(1) from None
 
-        if response.status_code != 200:
-            print("エラー: Figma APIリクエストが失敗しました")
-            print(f"ステータスコード: {response.status_code}")
-            print(f"レスポンス本文: {response.text}")
-            raise SystemExit(1)
+    if response.status_code != 200:
+        print("エラー: Figmaファイル情報の取得に失敗しました")
+        print(f"ステータスコード: {response.status_code}")
+        print(f"レスポンス本文: {response.text}")
+        raise SystemExit(1)
 
-        response_json = response.json()
+    response_json = response.json()
+    return str(response_json.get("version") or response_json.get("lastModified"))
 
-        # 指定されたノードのdocumentを取得
-        if "nodes" not in response_json or node_id not in response_json["nodes"]:
-            print(
-                f"エラー: レスポンスに指定されたノード (node_id: {node_id}) が含まれていません"
-            )
+
+# 1回の /nodes リクエストにまとめるノードIDの上限
+FIGMA_NODES_BATCH_SIZE = 50
+# ids クエリパラメータの最大文字数（URL長の上限対策）
+FIGMA_MAX_IDS_LENGTH = 2000
+
+
+def _chunk_node_ids(
+    node_ids: list[str], batch_size: int, max_ids_length: int
+) -> list[list[str]]:
+    """
+    ノードIDのリストを、件数と ids パラメータの文字数が上限を超えないバッチに分割
+
+    Args:
+        node_ids: ノードIDのリスト
+        batch_size: 1バッチあたりの最大ノード数
+        max_ids_length: カンマ区切りにした ids パラメータの最大文字数
+
+    Returns:
+        list[list[str]]: 分割されたノードIDのリスト
+    """
+    batches: list[list[str]] = []
+    current: list[str] = []
+    current_length = 0
+
+    for node_id in node_ids:
+        # カンマ区切りにした場合の追加文字数
+        added_length = len(node_id) + (1 if current else 0)
+        if current and (
+            len(current) >= batch_size or current_length + added_length > max_ids_length
+        ):
+            batches.append(current)
+            current = []
+            current_length = 0
+            added_length = len(node_id)
+        current.append(node_id)
+        current_length += added_length
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def fetch_figma_nodes(
+    file_key: str,
+    node_ids: list[str],
+    client: FigmaClient,
+    batch_size: int = FIGMA_NODES_BATCH_SIZE,
+    cache: DiskCache | None = None,
+    stream: bool = False,
+    version: str | None = None,
+) -> dict[str, dict | None]:
+    """
+    Figma APIから複数ノードのデータを、ids をまとめたバッチリクエストで取得
+
+    cache を指定した場合は、ファイルのバージョンを先に確認し（version 指定時は省略）、
+    同じバージョンで取得済みのノードはディスクから返す。
+
+    stream を指定した場合は、レスポンス本文を逐次パースしながら軽量化し、
+    simplify_node_data 適用済みのデータを返す（レスポンス全体を辞書として保持しない）。
+
+    Args:
+        file_key: FigmaファイルのキーID
+        node_ids: 取得対象のノードIDのリスト
+        client: Figma APIクライアント
+        batch_size: 1リクエストあたりの最大ノード数
+        cache: ノードデータのキャッシュ（None の場合はキャッシュしない）
+        stream: レスポンスを逐次パースして軽量化済みのデータを返すかどうか
+        version: 取得済みのファイルのバージョン（None の場合は cache 使用時に取得する）
+
+    Returns:
+        dict[str, dict | None]: ノードIDからdocumentデータへのマッピング
+            （取得できなかったノードは None）
+
+    Raises:
+        SystemExit: APIリクエストが失敗した場合
+    """
+    import requests
+
+    path = f"/v1/files/{file_key}/nodes"
+
+    # 重複を除去（順序は維持）
+    unique_ids = list(dict.fromkeys(node_ids))
+    documents: dict[str, dict | None] = {}
+
+    # 軽量化済みのデータは元のデータとは別のキーでキャッシュする
+    cache_suffix = ":simplified" if stream else ""
+
+    # キャッシュの確認（キーは file_key, node_id, バージョン）
+    if cache is not None:
+        if version is None:
+            version = fetch_figma_file_version(file_key, client)
+        for node_id in unique_ids:
+            document = cache.get(file_key, f"{node_id}@{version}{cache_suffix}")
+            if document is not None:
+                documents[node_id] = document
+        if documents:
             print(
-                f"レスポンス: {json.dumps(response_json, indent=2, ensure_ascii=False)}"
+                f"キャッシュを使用します (バージョン: {version}, "
+                f"ヒット: {len(documents)}/{len(unique_ids)})"
             )
-            raise SystemExit(1)
 
-        document = response_json["nodes"][node_id].get("document")
+    missing_ids = [node_id for node_id in unique_ids if node_id not in documents]
+    if not missing_ids:
+        return {node_id: documents[node_id] for node_id in unique_ids}
 
-        if not document:
-            print("エラー: ノードにdocumentフィールドが存在しません")
-            raise SystemExit(1)
+    batches = _chunk_node_ids(missing_ids, batch_size, FIGMA_MAX_IDS_LENGTH)
 
-        print("Figma データの取得に成功しました")
-        return document
+    print(
+        f"Figma APIにリクエスト中... (file_key: {file_key}, "
+        f"ノード数: {len(missing_ids)}, リクエスト数: {len(batches)})"
+    )
+
+    try:
+        for batch in batches:
+            params = {"ids": ",".join(batch)}
+            with stage_metrics.measure("fetch") as fetch_metrics:
+                response = client.get(path, params=params, stream=stream)
+                if not stream:
+                    fetch_metrics["bytes"] = len(response.content)
+
+            if response.status_code != 200:
+                print("エラー: Figma APIリクエストが失敗しました")
+                print(f"ステータスコード: {response.status_code}")
+                print(f"レスポンス本文: {response.text}")
+                raise SystemExit(1)
+
+            if stream:
+                # 本文の受信・パース・軽量化を同時に行うため、まとめて decode として計測
+                with response, stage_metrics.measure("decode") as decode_metrics:
+                    # gzip 等の圧縮を展開しながら読み込む
+                    response.raw.decode_content = True
+                    batch_documents, response_version = parse_simplified_nodes(
+                        response.raw
+                    )
+                    decode_metrics["bytes"] = response.raw.tell()
+            else:
+                with stage_metrics.measure("decode") as decode_metrics:
+                    response_json = loads_json(response.content)
+                    decode_metrics["bytes"] = len(response.content)
+                batch_documents = {
+                    node_id: entry.get("document") if entry else None
+                    for node_id, entry in (response_json.get("nodes") or {}).items()
+                }
+                response_version = response_json.get("version")
+
+            # メタデータ確認後にファイルが更新された場合はレスポンスのバージョンを優先
+            batch_version = response_version or version
+
+            # ノード単位で結果を判定（欠落はバッチ全体を失敗させない）
+            for node_id in batch:
+                document = batch_documents.get(node_id)
+                if not document:
+                    print(
+                        f"警告: レスポンスに指定されたノード (node_id: {node_id}) が含まれていません"
+                    )
+                elif cache is not None and batch_version:
+                    cache.set(
+                        file_key, f"{node_id}@{batch_version}{cache_suffix}", document
+                    )
+                documents[node_id] = document or None
 
     except requests.exceptions.RequestException as e:
         print(f"エラー: HTTPリクエストに失敗しました: {e}")
         raise SystemExit(1) from None
 
+    if cache is not None:
+        cache.evict()
 
-def simplify_node_data(node: dict[str, Any]) -> dict[str, Any]:
+    return {node_id: documents[node_id] for node_id in unique_ids}
+
+
+def fetch_figma_data(
+    file_key: str,
+    node_id: str,
+    client: FigmaClient,
+    cache: DiskCache | None = None,
+    stream: bool = False,
+) -> dict:
     """
-    Figmaノードから必要な情報のみを抽出し、軽量化した辞書を作成
+    Figma APIから指定されたノードのデータを取得
+
+    Args:
+        file_key: FigmaファイルのキーID
+        node_id: 取得対象のノードID
+        client: Figma APIクライアント
+        cache: ノードデータのキャッシュ（None の場合はキャッシュしない）
+        stream: レスポンスを逐次パースして軽量化済みのデータを返すかどうか
+
+    Returns:
+        dict: 指定されたノードのdocumentデータ（stream 指定時は軽量化済み）
+
+    Raises:
+        SystemExit: APIリクエストが失敗した場合、またはノードが存在しない場合
+    """
+    document = fetch_figma_nodes(
+        file_key, [node_id], client, cache=cache, stream=stream
+    )[node_id]
+
+    if not document:
+        print(
+            f"エラー: 指定されたノード (node_id: {node_id}) のdocumentを取得できませんでした"
+        )
+        raise SystemExit(1)
+
+    print("Figma データの取得に成功しました")
+    return document
+
+
+def _simplify_single_node(node: dict[str, Any]) -> dict[str, Any]:
+    """
+    1ノード分の必要な情報を抽出（子要素は含まない）
 
     Args:
         node: Figmaノードの辞書
 
     Returns:
-        dict: 軽量化されたノードデータ
+        dict: 軽量化されたノードデータ（children を除く）
     """
     simplified = {}
 
@@ -145,152 +1054,3993 @@ def simplify_node_data(node: dict[str, Any]) -> dict[str, Any]:
                 "lineHeightPx": style.get("lineHeightPx"),
             }
 
-    # 子要素を再帰的に処理
-    if "children" in node and node["children"]:
-        simplified["children"] = [
-            simplify_node_data(child) for child in node["children"]
-        ]
-
     return simplified
 
 
-def analyze_design_with_gemini(design_json: dict, api_key: str) -> str:
+def simplify_node_data(node: dict[str, Any]) -> dict[str, Any]:
     """
-    Gemini AIを使用してデザインデータを分析し、改善レポートを生成
+    Figmaノードから必要な情報のみを抽出し、軽量化した辞書を作成
+
+    再帰ではなく明示的なスタックでツリーをたどるため、
+    ネストがどれだけ深くても RecursionError は発生しない。
 
     Args:
-        design_json: 軽量化されたFigmaデザインデータ
-        api_key: Gemini APIキー
+        node: Figmaノードの辞書
 
     Returns:
-        str: Markdown形式の分析レポート
-
-    Raises:
-        SystemExit: Gemini APIの呼び出しに失敗した場合
+        dict: 軽量化されたノードデータ
     """
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-pro")
+    with stage_metrics.measure("simplify") as metrics:
+        # 深さ優先で走査し、各階層の子要素のイテレータと出力先リストを積む。
+        # 関数呼び出しや (元ノード, 軽量化済みノード) の組を作らないよう、
+        # _simplify_single_node と同じ抽出処理をループ内に展開している
+        roots: list[dict[str, Any]] = []
+        iterators = [iter((node,))]
+        targets = [roots]
+        count = 1
 
-        # プロンプトの構築
-        system_instruction = (
-            "あなたは熟練の UI/UX デザイナー兼アクセシビリティの専門家です。"
-        )
+        while iterators:
+            append = targets[-1].append
+            for source in iterators[-1]:
+                simplified = {}
+                if "id" in source:
+                    simplified["id"] = source["id"]
+                if "name" in source:
+                    simplified["name"] = source["name"]
+                if "type" in source:
+                    simplified["type"] = source["type"]
+                if "absoluteBoundingBox" in source:
+                    bbox = source["absoluteBoundingBox"]
+                    simplified["absoluteBoundingBox"] = {
+                        "x": bbox.get("x"),
+                        "y": bbox.get("y"),
+                        "width": bbox.get("width"),
+                        "height": bbox.get("height"),
+                    }
+                if "fills" in source:
+                    simplified["fills"] = source["fills"]
+                if source.get("type") == "TEXT":
+                    if "characters" in source:
+                        simplified["characters"] = source["characters"]
+                    if "style" in source:
+                        style = source["style"]
+                        simplified["style"] = {
+                            "fontFamily": style.get("fontFamily"),
+                            "fontWeight": style.get("fontWeight"),
+                            "fontSize": style.get("fontSize"),
+                            "letterSpacing": style.get("letterSpacing"),
+                            "lineHeightPx": style.get("lineHeightPx"),
+                        }
+                append(simplified)
 
-        design_json_str = json.dumps(design_json, indent=2, ensure_ascii=False)
+                children = source.get("children")
+                if children:
+                    # 子要素へ降りる。この階層の残りは子要素の処理後に再開する
+                    simplified_children = simplified["children"] = []
+                    iterators.append(iter(children))
+                    targets.append(simplified_children)
+                    count += len(children)
+                    break
+            else:
+                iterators.pop()
+                targets.pop()
 
-        user_prompt = f"""以下のFigmaデザインデータをJSON形式で提供します。このデータを分析し、UI/UXおよびアクセシビリティの観点から改善レポートをMarkdown形式で作成してください。
+        metrics["nodes"] = count
 
-# デザインデータ（JSON）
-```json
-{design_json_str}
-```
+    return roots[0]
 
-# 分析観点
 
-## 1. アクセシビリティ
-- コントラスト比: 背景色と文字色のコントラストが低く、視認性に問題がありそうな箇所を指摘してください
-- フォントサイズ: 14px未満のテキストがある場合は警告してください
-- タッチターゲット: 幅または高さが44px未満の要素（ボタンやリンクなど）がある場合は警告してください
+# NodeTable で位置・サイズ・フォントサイズを持たない場合の値
+_MISSING = float("nan")
+# NodeTable の style のうち、フォントサイズ以外に保持するキー（軽量化後のキーの順）
+_TABLE_STYLE_KEYS = ("fontFamily", "fontWeight", "letterSpacing", "lineHeightPx")
 
-## 2. 一貫性
-- 余白: absoluteBoundingBoxから推測される要素間の余白にばらつきがないか確認してください
-- フォント: fontFamilyやfontWeightに不統一な箇所がないか確認してください
 
-## 3. 改善提案
-- 上記の問題点に対して、具体的な修正例を提示してください
-  例: 「ボタンの高さを44px以上にする」「本文フォントサイズを16pxにする」など
+class NodeTable:
+    """
+    軽量化したノードツリーを、ノードごとの辞書ではなく列ごとの配列で保持する表
 
-# 出力形式
-Markdown形式で、見出しや箇条書きを使って読みやすく構造化してください。
-"""
+    ノードは行き掛け順に 0 から番号付けされ、各列の同じ位置に格納される。
+    子孫は連続した番号になるため、end[i] を使うと部分木を範囲で扱える。
 
-        print("Gemini AIで分析中...")
+    - parent / end: 親の番号（ルートは -1）と、部分木の直後の番号
+    - type_code / name_index: types / names の文字列表への番号（重複する文字列は1つにまとめる。なしは -1）
+    - x / y / width / height / font_size: 連続した float 配列（値がない場合は NaN）
+    - fills / characters / styles: 持っているノードだけの疎な辞書
+    """
 
-        response = model.generate_content(
-            [system_instruction, user_prompt],
-            generation_config=genai.GenerationConfig(
-                temperature=0,
-            ),
-        )
+    def __init__(self):
+        self.ids: list[str | None] = []
+        self.parent = array.array("i")
+        self.end = array.array("i")
+        self.type_code = array.array("i")
+        self.name_index = array.array("i")
+        self.has_bbox = array.array("b")
+        self.x = array.array("d")
+        self.y = array.array("d")
+        self.width = array.array("d")
+        self.height = array.array("d")
+        self.font_size = array.array("d")
+        self.types: list[str] = []
+        self.names: list[str] = []
+        self.fills: dict[int, Any] = {}
+        self.characters: dict[int, str] = {}
+        self.styles: dict[int, tuple] = {}
+        self._type_codes: dict[str, int] = {}
+        self._name_indexes: dict[str, int] = {}
 
-        if not response.text:
-            print("エラー: Geminiからのレスポンスが空です")
-            raise SystemExit(1)
+    def __len__(self) -> int:
+        return len(self.parent)
 
-        print("分析が完了しました")
-        return response.text
+    @staticmethod
+    def _intern(value: str | None, table: list[str], indexes: dict[str, int]) -> int:
+        if value is None:
+            return -1
+        index = indexes.get(value)
+        if index is None:
+            index = indexes[value] = len(table)
+            table.append(value)
+        return index
 
-    except Exception as e:
-        print("エラー: Gemini API呼び出し中に例外が発生しました")
-        print(f"例外の詳細: {e}")
-        import traceback
+    @classmethod
+    def from_node(cls, node: dict[str, Any]) -> "NodeTable":
+        """
+        Figmaノード（取得したまま、または軽量化済みの辞書）から表を作成
 
-        traceback.print_exc()
-        raise SystemExit(1) from None
+        simplify_node_data と同じキーだけを取り出すため、取得したままのノードから
+        直接作れば、軽量化した辞書を経由せずに済む。
 
+        Args:
+            node: Figmaノードの辞書
 
-def main():
-    """
-    メイン実行処理
-    """
-    parser = argparse.ArgumentParser(description="Figma UI/UX Analysis Tool")
-    parser.add_argument("--file-key", help="Figma File Key")
-    parser.add_argument("--node-id", help="Node ID")
+        Returns:
+            NodeTable: 作成した表
+        """
+        table = cls()
+        stack: list[tuple[dict[str, Any], int]] = [(node, -1)]
+
+        while stack:
+            source, parent = stack.pop()
+            index = len(table.parent)
+            table.ids.append(source.get("id"))
+            table.parent.append(parent)
+            table.end.append(index + 1)
+            table.type_code.append(
+                cls._intern(source.get("type"), table.types, table._type_codes)
+            )
+            table.name_index.append(
+                cls._intern(source.get("name"), table.names, table._name_indexes)
+            )
+
+            bbox = source.get("absoluteBoundingBox")
+            table.has_bbox.append(bbox is not None)
+            bbox = bbox or {}
+            for column, key in (
+                (table.x, "x"),
+                (table.y, "y"),
+                (table.width, "width"),
+                (table.height, "height"),
+            ):
+                value = bbox.get(key)
+                column.append(_MISSING if value is None else value)
+
+            if "fills" in source:
+                table.fills[index] = source["fills"]
+
+            font_size = None
+            if source.get("type") == "TEXT":
+                if "characters" in source:
+                    table.characters[index] = source["characters"]
+                if "style" in source:
+                    style = source["style"]
+                    font_size = style.get("fontSize")
+                    table.styles[index] = tuple(style.get(k) for k in _TABLE_STYLE_KEYS)
+            table.font_size.append(_MISSING if font_size is None else font_size)
+
+            children = source.get("children")
+            if children:
+                # 行き掛け順に番号を振るため、最初の子が先に取り出されるよう逆順に積む
+                stack.extend([(child, index) for child in reversed(children)])
+
+        # 行き掛け順では子孫が親より後ろに並ぶので、後ろから部分木の終端を伝播する
+        end = table.end
+        parents = table.parent
+        for index in range(len(parents) - 1, 0, -1):
+            parent = parents[index]
+            if end[index] > end[parent]:
+                end[parent] = end[index]
+
+        return table
+
+    def children(self, index: int) -> Iterator[int]:
+        """
+        子ノードの番号を順に返す
+        """
+        child = index + 1
+        end = self.end[index]
+        while child < end:
+            yield child
+            child = self.end[child]
+
+    def _node_dict(self, index: int) -> dict[str, Any]:
+        node: dict[str, Any] = {}
+        if self.ids[index] is not None:
+            node["id"] = self.ids[index]
+        if self.name_index[index] >= 0:
+            node["name"] = self.names[self.name_index[index]]
+        if self.type_code[index] >= 0:
+            node["type"] = self.types[self.type_code[index]]
+        if self.has_bbox[index]:
+            node["absoluteBoundingBox"] = {
+                key: None if math.isnan(column[index]) else column[index]
+                for key, column in (
+                    ("x", self.x),
+                    ("y", self.y),
+                    ("width", self.width),
+                    ("height", self.height),
+                )
+            }
+        if index in self.fills:
+            node["fills"] = self.fills[index]
+        if index in self.characters:
+            node["characters"] = self.characters[index]
+        if index in self.styles:
+            font_family, font_weight, letter_spacing, line_height = self.styles[index]
+            font_size = self.font_size[index]
+            node["style"] = {
+                "fontFamily": font_family,
+                "fontWeight": font_weight,
+                "fontSize": None if math.isnan(font_size) else font_size,
+                "letterSpacing": letter_spacing,
+                "lineHeightPx": line_height,
+            }
+        return node
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        simplify_node_data と同じ形の辞書に戻す
+        （位置・サイズ・フォントサイズは float 配列を経由するため、整数も float として戻る）
+
+        Returns:
+            dict: 軽量化されたノードデータ
+        """
+        nodes = [self._node_dict(index) for index in range(len(self))]
+        for index in range(1, len(nodes)):
+            nodes[self.parent[index]].setdefault("children", []).append(nodes[index])
+        return nodes[0]
+
+    def small_text_indices(self, min_font_size: float) -> list[int]:
+        """
+        フォントサイズが min_font_size 未満の TEXT ノードの番号を、列の走査だけで返す
+        """
+        return [
+            index
+            for index, font_size in enumerate(self.font_size)
+            if font_size < min_font_size
+        ]
+
+
+# ストリーミング時に値として組み立てるキー（それ以外は読み飛ばす）
+_STREAM_VALUE_KEYS = frozenset({"id", "name", "type", "fills", "characters"})
+# ストリーミング時に一部のキーのみ組み立てるオブジェクト
+_STREAM_FILTERED_KEYS = {
+    "absoluteBoundingBox": frozenset({"x", "y", "width", "height"}),
+    "style": frozenset(
+        {"fontFamily", "fontWeight", "fontSize", "letterSpacing", "lineHeightPx"}
+    ),
+}
+
+
+def _skip_stream_value(events: Iterator[tuple[str, Any]], event: str) -> None:
+    """
+    パースイベント列から値1つ分を読み飛ばす（オブジェクトは組み立てない）
+    """
+    if event not in ("start_map", "start_array"):
+        return
+    depth = 1
+    for event, _ in events:
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def _build_stream_value(
+    events: Iterator[tuple[str, Any]],
+    event: str,
+    value: Any,
+    keys: frozenset[str] | None = None,
+) -> Any:
+    """
+    パースイベント列から値1つ分をPythonオブジェクトとして組み立てる
+
+    Args:
+        events: ijson.basic_parse のイベント列
+        event: 値の最初のイベント
+        value: 値の最初のイベントの値
+        keys: 指定した場合、最上位のオブジェクトはこのキーのみを組み立てる
+
+    Returns:
+        Any: 組み立てた値
+    """
+    if event == "start_map":
+        root: Any = {}
+    elif event == "start_array":
+        root = []
+    else:
+        return value
+
+    # (コンテナ, 現在のキー) のスタック
+    stack: list[list[Any]] = [[root, None]]
+    for event, value in events:
+        container = stack[-1]
+        if event == "map_key":
+            if keys is not None and len(stack) == 1 and value not in keys:
+                _skip_stream_value(events, next(events)[0])
+            else:
+                container[1] = value
+            continue
+        if event in ("end_map", "end_array"):
+            stack.pop()
+            if not stack:
+                return root
+            continue
+
+        if event == "start_map":
+            item: Any = {}
+        elif event == "start_array":
+            item = []
+        else:
+            item = value
+
+        if isinstance(container[0], list):
+            container[0].append(item)
+        else:
+            container[0][container[1]] = item
+        if event in ("start_map", "start_array"):
+            stack.append([item, None])
+
+    raise ValueError("JSONが途中で終了しています")
+
+
+def _stream_simplify_node(events: Iterator[tuple[str, Any]]) -> dict[str, Any]:
+    """
+    パースイベント列から1ノード分を、simplify_node_data と同じ形に軽量化しながら組み立てる
+
+    呼び出し時点でノードの start_map は読み込み済みであること。
+    simplify_node_data と同様に明示的なスタックでたどるため、深いツリーでも再帰しない。
+
+    Args:
+        events: ijson.basic_parse のイベント列
+
+    Returns:
+        dict: 軽量化されたノードデータ
+    """
+    # ノードごとの [保持するフィールド, 軽量化済みの子要素] のスタック
+    stack: list[list[Any]] = [[{}, None]]
+    in_children = False
+
+    for event, value in events:
+        fields, children = stack[-1]
+
+        # children 配列の中: 要素ごとに新しいノードを開始
+        if in_children:
+            if event == "start_map":
+                stack.append([{}, None])
+                in_children = False
+            elif event != "end_array":
+                _skip_stream_value(events, event)
+            else:
+                in_children = False
+            continue
+
+        if event == "map_key":
+            next_event, next_value = next(events)
+            if value == "children" and next_event == "start_array":
+                stack[-1][1] = []
+                in_children = True
+            elif value in _STREAM_VALUE_KEYS:
+                fields[value] = _build_stream_value(events, next_event, next_value)
+            elif value in _STREAM_FILTERED_KEYS:
+                fields[value] = _build_stream_value(
+                    events, next_event, next_value, _STREAM_FILTERED_KEYS[value]
+                )
+            else:
+                _skip_stream_value(events, next_event)
+            continue
+
+        if event == "end_map":
+            # 保持したフィールドのみの辞書から、通常と同じ順序・形式で組み立てる
+            stack.pop()
+            simplified = _simplify_single_node(fields)
+            if children:
+                simplified["children"] = children
+            if not stack:
+                return simplified
+            stack[-1][1].append(simplified)
+            in_children = True
+
+    raise ValueError("JSONが途中で終了しています")
+
+
+def parse_simplified_nodes(
+    stream: IO[bytes],
+) -> tuple[dict[str, dict | None], str | None]:
+    """
+    /v1/files/{file_key}/nodes のレスポンス本文を逐次パースし、各ノードを軽量化
+
+    document 以外（components, styles など）やノードの不要なキーは、
+    Pythonオブジェクトを組み立てずに読み飛ばす。
+
+    Args:
+        stream: レスポンス本文のバイトストリーム
+
+    Returns:
+        tuple[dict[str, dict | None], str | None]:
+            (ノードIDから軽量化済みdocumentへのマッピング, ファイルのバージョン)
+
+    Raises:
+        SystemExit: ijson がインストールされていない場合
+    """
+    try:
+        import ijson
+    except ImportError:
+        print("エラー: ストリーミングパースには ijson が必要です (pip install ijson)")
+        raise SystemExit(1) from None
+
+    events = iter(ijson.basic_parse(stream, use_float=True))
+    documents: dict[str, dict | None] = {}
+    version = None
+
+    next(events)  # 最上位の start_map
+    for event, key in events:
+        if event == "end_map":
+            break
+        next_event, next_value = next(events)
+
+        if key == "version":
+            version = _build_stream_value(events, next_event, next_value)
+        elif key == "nodes" and next_event == "start_map":
+            # "nodes": {node_id: {"document": {...}, ...} | null, ...}
+            for event, node_id in events:
+                if event == "end_map":
+                    break
+                entry_event, _ = next(events)
+                documents[node_id] = None
+                if entry_event != "start_map":
+                    continue
+                for event, entry_key in events:
+                    if event == "end_map":
+                        break
+                    value_event, _ = next(events)
+                    if entry_key == "document" and value_event == "start_map":
+                        documents[node_id] = _stream_simplify_node(events)
+                    else:
+                        _skip_stream_value(events, value_event)
+        else:
+            _skip_stream_value(events, next_event)
+
+    return documents, version
+
+
+# compact形式で使用するキーの短縮名
+COMPACT_KEY_ALIASES = {
+    "id": "i",
+    "name": "n",
+    "type": "t",
+    "absoluteBoundingBox": "b",
+    "fills": "f",
+    "characters": "c",
+    "style": "s",
+    "children": "ch",
+    "fontFamily": "ff",
+    "fontWeight": "fw",
+    "fontSize": "fs",
+    "letterSpacing": "ls",
+    "lineHeightPx": "lh",
+}
+
+# compact形式の凡例（プロンプトに含める）
+COMPACT_LEGEND = """- キーの短縮名: i=id, n=name, t=type, b=absoluteBoundingBox, f=fills, c=characters, s=style, ch=children
+- style内のキー: ff=fontFamily, fw=fontWeight, fs=fontSize, ls=letterSpacing, lh=lineHeightPx
+- b は [x, y, width, height] の配列です
+- f は塗りつぶしの配列です。単色は "#RRGGBB"（不透明度がある場合は "#RRGGBBAA"）、
+  グラデーションは "GRADIENT_LINEAR(#RRGGBB,#RRGGBB)" のように型と色、画像などは型名のみです
+- 非表示の塗りつぶしと値が null の項目は省略しています"""
+
+
+def _compact_number(value: Any) -> Any:
+    # 小数第1位に丸め、整数値は整数として出力する
+    if isinstance(value, float):
+        value = round(value, 1)
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _color_to_hex(color: dict[str, Any], opacity: float = 1.0) -> str:
+    """
+    Figmaの色（0〜1のRGBA）を #RRGGBB または #RRGGBBAA 形式に変換
+
+    Args:
+        color: r, g, b, a を持つ色の辞書
+        opacity: 塗りつぶし自体の不透明度
+
+    Returns:
+        str: 16進数の色コード
+    """
+    channels = [color.get("r", 0), color.get("g", 0), color.get("b", 0)]
+    hex_color = "#" + "".join(f"{round(c * 255):02X}" for c in channels)
+    alpha = color.get("a", 1) * opacity
+    if alpha < 1:
+        hex_color += f"{round(alpha * 255):02X}"
+    return hex_color
+
+
+def _compact_fills(fills: list[dict[str, Any]]) -> list[str]:
+    """
+    塗りつぶしの配列を、色コードまたは型名の文字列の配列に変換
+    """
+    compacted = []
+    for paint in fills:
+        if not isinstance(paint, dict) or paint.get("visible") is False:
+            continue
+        paint_type = paint.get("type", "UNKNOWN")
+        opacity = paint.get("opacity", 1)
+        if paint_type == "SOLID" and "color" in paint:
+            compacted.append(_color_to_hex(paint["color"], opacity))
+        elif "gradientStops" in paint:
+            stops = ",".join(
+                _color_to_hex(stop.get("color", {}), opacity)
+                for stop in paint["gradientStops"]
+            )
+            compacted.append(f"{paint_type}({stops})")
+        else:
+            compacted.append(paint_type)
+    return compacted
+
+
+def _compact_single_node(node: dict[str, Any]) -> dict[str, Any]:
+    """
+    軽量化済みの1ノードを compact 形式に変換（子要素は含まない）
+    """
+    compacted: dict[str, Any] = {}
+    for key, value in node.items():
+        if key == "children" or value is None:
+            continue
+        if key == "absoluteBoundingBox":
+            value = [
+                _compact_number(value.get(k)) for k in ("x", "y", "width", "height")
+            ]
+        elif key == "fills":
+            value = _compact_fills(value)
+        elif key == "style":
+            value = {
+                COMPACT_KEY_ALIASES.get(k, k): _compact_number(v)
+                for k, v in value.items()
+                if v is not None
+            }
+        compacted[COMPACT_KEY_ALIASES.get(key, key)] = value
+    return compacted
+
+
+def compact_design_json(design_json: dict[str, Any]) -> dict[str, Any]:
+    """
+    軽量化済みのデザインデータを、プロンプト用の compact 形式に変換
+
+    キーを短縮名に置き換え、absoluteBoundingBox を [x, y, w, h]、
+    塗りつぶしの色を16進数の色コードにする。凡例は COMPACT_LEGEND を参照。
+
+    Args:
+        design_json: simplify_node_data で軽量化されたデザインデータ
+
+    Returns:
+        dict: compact 形式のデザインデータ
+    """
+    children_key = COMPACT_KEY_ALIASES["children"]
+    root = _compact_single_node(design_json)
+    stack = [(design_json, root)]
+
+    while stack:
+        source, compacted = stack.pop()
+        children = source.get("children")
+        if not children:
+            continue
+        compacted_children = [_compact_single_node(child) for child in children]
+        compacted[children_key] = compacted_children
+        stack.extend(zip(children, compacted_children, strict=True))
+
+    return root
+
+
+# dedup形式で定義にまとめる部分木の最小ノード数（子要素を持つ部分木だけを対象にする）
+DEDUP_MIN_NODES = 2
+
+# dedup形式の凡例（compact形式の凡例に続けてプロンプトに含める）
+DEDUP_LEGEND = """- 同じ構造の部分木（コンポーネントのインスタンスなど）は defs に1回だけ定義し、
+  出現箇所は {"i": id, "n": name, "b": [x, y, width, height], "r": 定義名} の参照で表します
+- defs 内のノードは id を省略し、b は定義のルートの左上を原点とした相対座標です"""
+
+
+def _subtree_shapes(
+    design_json: dict[str, Any],
+) -> tuple[dict[int, int], list[int], list[int]]:
+    """
+    id・名前・位置を除いた構造で部分木をハッシュし、同じ構造の部分木に同じ番号を振る
+
+    子要素の位置は親の左上からの相対座標としてハッシュに含めるため、
+    配置された場所だけが異なるインスタンスは同じ番号になる。
+
+    Args:
+        design_json: 軽量化されたデザインデータ
+
+    Returns:
+        tuple: (ノードの id() から構造番号への辞書, 構造ごとの出現回数, 構造ごとのノード数)
+    """
+    shape_numbers: dict[str, int] = {}
+    node_shapes: dict[int, int] = {}
+    counts: list[int] = []
+    sizes: list[int] = []
+
+    # 子要素をすべて処理してから親を処理する（帰りがけ順）
+    stack: list[tuple[dict[str, Any], bool]] = [(design_json, False)]
+    while stack:
+        node, children_done = stack.pop()
+        children = node.get("children") or []
+        if not children_done and children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+
+        content = _compact_single_node(node)
+        content.pop("i", None)
+        content.pop("n", None)
+        bbox = content.pop("b", None) or [None] * 4
+        entries = [
+            [
+                child.get("name"),
+                *_relative_position(child, bbox),
+                node_shapes[id(child)],
+            ]
+            for child in children
+        ]
+        key = json.dumps([content, bbox[2:], entries], ensure_ascii=False)
+
+        number = shape_numbers.get(key)
+        if number is None:
+            number = shape_numbers[key] = len(counts)
+            counts.append(0)
+            sizes.append(1 + sum(sizes[node_shapes[id(child)]] for child in children))
+        counts[number] += 1
+        node_shapes[id(node)] = number
+
+    return node_shapes, counts, sizes
+
+
+def _relative_position(node: dict[str, Any], origin: list[Any]) -> list[Any]:
+    # compact形式の bbox の [x, y] を origin の左上からの相対座標にする
+    bbox = node.get("absoluteBoundingBox") or {}
+    return [
+        None
+        if bbox.get(key) is None or base is None
+        else _compact_number(float(bbox[key] - base))
+        for key, base in (("x", origin[0]), ("y", origin[1]))
+    ]
+
+
+def _select_shapes(
+    design_json: dict[str, Any],
+    node_shapes: dict[int, int],
+    counts: list[int],
+    sizes: list[int],
+) -> set[int]:
+    """
+    定義にまとめる構造を選ぶ
+
+    定義にまとめた部分木の内側は参照の先で1回しか出力されないため、
+    内側でしか繰り返さない構造を選ぶと1回しか参照されない定義ができてしまう。
+    そこで、選んだ部分木の内側を数えずに出現回数を数え直し、
+    2回未満になった構造を外すことを、選ぶ構造が変わらなくなるまで繰り返す。
+    """
+    selected = {
+        number
+        for number, (count, size) in enumerate(zip(counts, sizes, strict=True))
+        if count >= 2 and size >= DEDUP_MIN_NODES
+    }
+    while True:
+        visible: dict[int, int] = {}
+        stack = [design_json]
+        while stack:
+            node = stack.pop()
+            number = node_shapes[id(node)]
+            if number in selected:
+                visible[number] = visible.get(number, 0) + 1
+                continue
+            stack.extend(node.get("children") or [])
+
+        remaining = {number for number in selected if visible.get(number, 0) >= 2}
+        if remaining == selected:
+            return selected
+        selected = remaining
+
+
+def dedup_design_json(design_json: dict[str, Any]) -> dict[str, Any]:
+    """
+    繰り返し出現する部分木を1回だけ定義する、compact形式のデザインデータに変換
+
+    コンポーネントのインスタンスのように同じ構造の部分木は defs に1回だけ出力し、
+    出現箇所は id・名前・bbox と定義名の参照だけにする。凡例は DEDUP_LEGEND を参照。
+
+    Args:
+        design_json: simplify_node_data で軽量化されたデザインデータ
+
+    Returns:
+        dict: {"defs": 定義名から部分木への辞書, "tree": ルートノード}
+    """
+    node_shapes, counts, sizes = _subtree_shapes(design_json)
+    selected = _select_shapes(design_json, node_shapes, counts, sizes)
+    children_key = COMPACT_KEY_ALIASES["children"]
+    def_names: dict[int, str] = {}
+    defs: dict[str, Any] = {}
+
+    # (元のノード, 出力先のリスト, 相対座標の原点, 定義の中かどうか)
+    root_holder: list[dict[str, Any]] = []
+    stack: list[tuple[dict[str, Any], list, list | None, bool]] = [
+        (design_json, root_holder, None, False)
+    ]
+
+    while stack:
+        source, target, origin, in_def = stack.pop()
+        compacted = _compact_single_node(source)
+        if origin is not None and "b" in compacted:
+            compacted["b"][:2] = _relative_position(source, origin)
+        if in_def:
+            compacted.pop("i", None)
+
+        number = node_shapes[id(source)]
+        if number in selected and not (in_def and origin is None):
+            # 参照として出力し、初出のときだけ定義を作る
+            name = def_names.get(number)
+            if name is None:
+                name = def_names[number] = f"D{len(def_names)}"
+                body: list[dict[str, Any]] = []
+                stack.append((source, body, None, True))
+                defs[name] = body
+            reference = {k: compacted[k] for k in ("i", "n", "b") if k in compacted}
+            reference["r"] = name
+            target.append(reference)
+            continue
+
+        target.append(compacted)
+        children = source.get("children")
+        if children:
+            if in_def and origin is None:
+                # 定義のルート: id・名前・位置は参照側に持たせる
+                for key in ("n", "b"):
+                    compacted.pop(key, None)
+                bbox = source.get("absoluteBoundingBox") or {}
+                child_origin = [bbox.get("x"), bbox.get("y")]
+            else:
+                child_origin = origin
+            compacted_children: list[dict[str, Any]] = []
+            compacted[children_key] = compacted_children
+            # 子要素の順序を保つため逆順に積む
+            stack.extend(
+                (child, compacted_children, child_origin, in_def)
+                for child in reversed(children)
+            )
+
+    return {
+        "defs": {name: body[0] for name, body in defs.items()},
+        "tree": root_holder[0],
+    }
+
+
+def serialize_design(design_json: dict[str, Any], prompt_format: str = "json") -> str:
+    """
+    デザインデータをプロンプトに埋め込む文字列に変換
+
+    Args:
+        design_json: 軽量化されたデザインデータ
+        prompt_format: "json"（インデント付きJSON）、"compact"（空白なしの短縮形式）
+            または "dedup"（compact形式で、繰り返す部分木を1回だけ定義）
+
+    Returns:
+        str: シリアライズされたデザインデータ
+    """
+    if prompt_format in ("compact", "dedup"):
+        convert = dedup_design_json if prompt_format == "dedup" else compact_design_json
+        return dumps_json(convert(design_json), separators=(",", ":"))
+    return dumps_json(design_json, indent=2)
+
+
+# 改行とそれに続くインデント（count_tokens でまとめて1トークンとして数える）
+_LINE_BREAK_RE = re.compile(r"\n[ \t]*")
+
+
+def count_tokens(text: str) -> int:
+    """
+    テキストのトークン数を推定（APIを呼び出さないローカルの概算）
+
+    ASCII文字は約4文字で1トークン、それ以外（日本語など）は1文字1トークンとして数える。
+    インデント付きJSONの改行とそれに続くインデントは、トークナイザーと同様に
+    まとめて1トークンとして数える（空白の文字数では数えない）。
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        int: 推定トークン数
+    """
+    ascii_count = len(text.encode("ascii", "ignore"))
+    other_count = len(text) - ascii_count
+    line_breaks = text.count("\n")
+    if line_breaks:
+        ascii_count -= len(text) - len(_LINE_BREAK_RE.sub("", text))
+    return (ascii_count + 3) // 4 + line_breaks + other_count
+
+
+# アクセシビリティの判定基準
+MIN_FONT_SIZE = 14
+MIN_TOUCH_TARGET_SIZE = 44
+# WCAG 2.1 AA のコントラスト比（通常テキスト / 大きなテキスト）
+MIN_CONTRAST_RATIO = 4.5
+MIN_CONTRAST_RATIO_LARGE = 3.0
+# 大きなテキストとみなすフォントサイズ（通常 / 太字）
+LARGE_TEXT_SIZE = 24
+LARGE_BOLD_TEXT_SIZE = 18.66
+# タッチターゲットとみなす要素名のパターン（英語は単語単位で照合し、"Table" などを除く）
+TOUCH_TARGET_NAME_PATTERN = re.compile(
+    r"(?<![a-z])(?:button|btn|link|icon|tab|check ?box|radio|switch|toggle|chip)s?(?![a-z])"
+    r"|ボタン|リンク|アイコン|タブ"
+)
+# 名前で判定できない場合に、タッチターゲットかどうかを Gemini に確認するノードの種類
+AMBIGUOUS_TOUCH_TARGET_TYPES = frozenset({"INSTANCE", "COMPONENT"})
+# レポート・プロンプトに列挙する検出結果の上限
+MAX_LISTED_FINDINGS = 100
+
+# ルールの表示名
+RULE_TITLES = {
+    "contrast": "コントラスト比",
+    "font_size": "フォントサイズ",
+    "touch_target": "タッチターゲット",
+    "spacing": "余白のばらつき",
+    "alignment": "揃えのずれ",
+}
+
+# 色を合成できない塗りつぶし（グラデーション・画像など）を表す値
+_COMPLEX_PAINT = "complex"
+
+
+class Finding(NamedTuple):
+    """
+    ローカルのルールによる検出結果
+
+    ambiguous が True の項目はローカルで判定できなかったもので、Gemini に判断を依頼する。
+    """
+
+    rule: str
+    node_id: str | None
+    node_name: str | None
+    message: str
+    ambiguous: bool = False
+
+
+def _blend(
+    top: tuple[float, float, float, float], bottom: tuple[float, float, float, float]
+) -> tuple[float, float, float, float]:
+    # アルファ合成（source-over）
+    alpha = top[3] + bottom[3] * (1 - top[3])
+    if alpha == 0:
+        return (0.0, 0.0, 0.0, 0.0)
+    r, g, b = (
+        (top[i] * top[3] + bottom[i] * bottom[3] * (1 - top[3])) / alpha
+        for i in range(3)
+    )
+    return (r, g, b, alpha)
+
+
+def _node_paint(node: dict[str, Any]) -> Any:
+    """
+    ノードの塗りつぶしを1色に合成
+
+    Returns:
+        Any: (r, g, b, a) のタプル、単色以外を含む場合は _COMPLEX_PAINT、
+            表示される塗りつぶしがない場合は None
+    """
+    paint = None
+    for fill in node.get("fills") or []:
+        if not isinstance(fill, dict) or fill.get("visible") is False:
+            continue
+        if fill.get("type") != "SOLID" or "color" not in fill:
+            return _COMPLEX_PAINT
+        color = fill["color"]
+        rgba = (
+            color.get("r", 0),
+            color.get("g", 0),
+            color.get("b", 0),
+            color.get("a", 1) * fill.get("opacity", 1),
+        )
+        # fills は下から上の順に並んでいる
+        paint = rgba if paint is None else _blend(rgba, paint)
+    if paint is not None and paint[3] == 0:
+        return None
+    return paint
+
+
+def _resolve_background(layers: list[Any]) -> Any:
+    """
+    テキストの背後にある塗りつぶし（手前から奥の順）から背景色を決定
+
+    Returns:
+        Any: 不透明な (r, g, b, a)、判定できない場合は _COMPLEX_PAINT、
+            不透明な背景が見つからない場合は None
+    """
+    stack = []
+    for paint in layers:
+        if paint == _COMPLEX_PAINT:
+            return _COMPLEX_PAINT
+        stack.append(paint)
+        if paint[3] >= 1:
+            break
+    else:
+        return None
+
+    background = stack.pop()
+    while stack:
+        background = _blend(stack.pop(), background)
+    return background
+
+
+# 兄弟要素の空間インデックスを使う子要素数（これ以下は全件を走査する）
+SIBLING_INDEX_MIN_CHILDREN = 32
+# 空間インデックスの1要素が占めるセル数の上限（超える大きな背景は全件走査の対象にする）
+SIBLING_INDEX_MAX_CELLS = 64
+
+
+class _SiblingCoverIndex:
+    """
+    テキストを覆う兄弟要素を求めるための、兄弟要素の矩形のグリッドインデックス
+
+    テキストを覆う矩形はテキストの左上の点を含むため、その点のセルに登録された矩形だけを調べる。
+    兄弟が数千件あるフラットなフレームでも、テキストごとに全件を走査しない。
+    """
+
+    def __init__(self, children: list[dict[str, Any]], paints: list[Any]):
+        """
+        Args:
+            children: 兄弟要素（背面から前面の順）
+            paints: 兄弟要素ごとの _node_paint の値
+        """
+        # 塗りつぶしと矩形を持つ兄弟要素: (インデックス, 左, 上, 右, 下)
+        # TEXT の塗りつぶしは文字の色で矩形を塗らないため、背景の候補にしない
+        self.rects = []
+        for index, (child, paint) in enumerate(zip(children, paints, strict=True)):
+            if paint is None or child.get("type") == "TEXT":
+                continue
+            rect = _bbox_edges(child.get("absoluteBoundingBox"))
+            if rect is not None:
+                self.rects.append((index, *rect))
+
+        self.cells: dict[tuple[int, int], list[tuple]] | None = None
+        self.large: list[tuple] = []
+        if len(children) <= SIBLING_INDEX_MIN_CHILDREN or not self.rects:
+            return
+
+        # セルの大きさはテキストなどの小さな要素が1〜数セルに収まる中央値にする
+        widths = sorted(r[3] - r[1] for r in self.rects)
+        heights = sorted(r[4] - r[2] for r in self.rects)
+        self.cell_width = max(widths[len(widths) // 2], 1.0)
+        self.cell_height = max(heights[len(heights) // 2], 1.0)
+        self.cells = {}
+        for rect in self.rects:
+            _, left, top, right, bottom = rect
+            x0, x1 = int(left // self.cell_width), int(right // self.cell_width)
+            y0, y1 = int(top // self.cell_height), int(bottom // self.cell_height)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > SIBLING_INDEX_MAX_CELLS:
+                self.large.append(rect)
+                continue
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    self.cells.setdefault((cx, cy), []).append(rect)
+
+    def covering(self, index: int, bbox: dict[str, Any] | None) -> list[int]:
+        """
+        index の要素より背面にあり、bbox を覆う兄弟要素のインデックス（前面から背面の順）
+        """
+        target = _bbox_edges(bbox)
+        if target is None:
+            return []
+        left, top, right, bottom = target
+        if self.cells is None:
+            candidates = self.rects
+        else:
+            cell = (int(left // self.cell_width), int(top // self.cell_height))
+            candidates = self.cells.get(cell, []) + self.large
+        return sorted(
+            (
+                r[0]
+                for r in candidates
+                if r[0] < index
+                and r[1] <= left
+                and r[2] <= top
+                and r[3] >= right
+                and r[4] >= bottom
+            ),
+            reverse=True,
+        )
+
+
+def _bbox_edges(
+    bbox: dict[str, Any] | None,
+) -> tuple[float, float, float, float] | None:
+    # (左, 上, 右, 下)。座標が欠けている場合は None
+    if not bbox:
+        return None
+    try:
+        left, top = float(bbox["x"]), float(bbox["y"])
+        return (left, top, left + float(bbox["width"]), top + float(bbox["height"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class _SiblingGroup:
+    """
+    同じ親を持つ子要素（背面から前面の順）
+
+    塗りつぶしと _SiblingCoverIndex は、テキストの背景を調べるときに初めて作る。
+    """
+
+    def __init__(self, children: list[dict[str, Any]]):
+        self.children = children
+        self.paints: list[Any] | None = None
+        self.cover_index: _SiblingCoverIndex | None = None
+
+    def paint(self, index: int) -> Any:
+        """
+        index の要素の _node_paint の値
+        """
+        if self.paints is None:
+            self.paints = [_node_paint(c) for c in self.children]
+        return self.paints[index]
+
+    def covering_paints(self, index: int, bbox: dict[str, Any] | None) -> list[Any]:
+        """
+        index の要素より背面にあり、bbox を覆う兄弟要素の塗りつぶし（前面から背面の順）
+        """
+        if self.cover_index is None:
+            self.paint(index)
+            self.cover_index = _SiblingCoverIndex(self.children, self.paints)
+        return [self.paints[i] for i in self.cover_index.covering(index, bbox)]
+
+
+def _has_opaque_layer(layers: list[Any]) -> bool:
+    # これより奥の塗りつぶしが背景に影響しない層（不透明な色、またはグラデーション・画像）があるか
+    return any(paint == _COMPLEX_PAINT or paint[3] >= 1 for paint in layers)
+
+
+def collect_text_contrast_pairs(
+    design_json: dict[str, Any],
+) -> tuple[list[tuple[dict[str, Any], tuple, tuple]], list[Finding]]:
+    """
+    TEXTノードごとに文字色と背景色の組を抽出
+
+    背景色は、テキストから祖先へ1階層ずつさかのぼり、各階層でより背面にありテキストを覆う
+    兄弟要素と、その親の塗りつぶしを手前から順に合成して求める。Group や Frame の中の
+    テキストでも、その Group の背面にある矩形を背景として扱う。不透明な層が見つかった
+    時点でさかのぼるのをやめる。
+
+    Args:
+        design_json: 軽量化されたデザインデータ
+
+    Returns:
+        tuple: ([(TEXTノード, 文字色 (r, g, b, a), 背景色 (r, g, b, a)), ...],
+            色を判定できなかったTEXTノードの Finding のリスト)
+    """
+    pairs = []
+    ambiguous = []
+    # 祖先の連結リスト: (ノードの塗りつぶし, 親の中でのインデックス, 兄弟要素, 親のリンク)
+    # スタックには (ノード, 親の中でのインデックス, 兄弟要素, 親のリンク) を積む
+    stack: list[tuple[dict[str, Any], int, _SiblingGroup | None, Any]] = [
+        (design_json, 0, None, None)
+    ]
+
+    while stack:
+        node, node_index, node_group, parent_link = stack.pop()
+        children = node.get("children")
+        if not children:
+            continue
+
+        link = (_node_paint(node), node_index, node_group, parent_link)
+        group = _SiblingGroup(children)
+
+        for index, child in enumerate(children):
+            if child.get("type") != "TEXT":
+                stack.append((child, index, group, link))
+                continue
+
+            text_paint = group.paint(index)
+            if text_paint is None:
+                continue
+            bbox = child.get("absoluteBoundingBox")
+            layers = group.covering_paints(index, bbox)
+            opaque = _has_opaque_layer(layers)
+            ancestor = link
+            while ancestor is not None and not opaque:
+                paint, ancestor_index, ancestor_group, ancestor = ancestor
+                if paint is not None:
+                    layers.append(paint)
+                    opaque = _has_opaque_layer([paint])
+                if ancestor_group is not None and not opaque:
+                    covering = ancestor_group.covering_paints(ancestor_index, bbox)
+                    layers.extend(covering)
+                    opaque = _has_opaque_layer(covering)
+            background = _resolve_background(layers)
+
+            if text_paint == _COMPLEX_PAINT or background == _COMPLEX_PAINT:
+                reason = "文字色または背景がグラデーション・画像のため判定できません"
+            elif background is None:
+                reason = "不透明な背景が見つからないため判定できません"
+            else:
+                pairs.append((child, _blend(text_paint, background), background))
+                continue
+            ambiguous.append(
+                Finding("contrast", child.get("id"), child.get("name"), reason, True)
+            )
+
+    return pairs, ambiguous
+
+
+def _relative_luminance(rgba: tuple) -> float:
+    # WCAG 2.x の相対輝度
+    def linearize(c: float) -> float:
+        return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+    r, g, b = (linearize(c) for c in rgba[:3])
+    return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+
+def contrast_ratio(foreground: tuple, background: tuple) -> float:
+    """
+    2色のコントラスト比を計算（WCAG 2.x）
+
+    Args:
+        foreground: 文字色 (r, g, b[, a])、各値は0〜1
+        background: 背景色 (r, g, b[, a])、各値は0〜1
+
+    Returns:
+        float: コントラスト比（1〜21）
+    """
+    lighter, darker = sorted(
+        (_relative_luminance(foreground), _relative_luminance(background)),
+        reverse=True,
+    )
+    return (lighter + 0.05) / (darker + 0.05)
+
+
+def required_contrast_ratio(node: dict[str, Any]) -> float:
+    """
+    TEXTノードに求められるコントラスト比（大きなテキストは基準が緩い）
+    """
+    style = node.get("style") or {}
+    font_size = style.get("fontSize") or 0
+    font_weight = style.get("fontWeight") or 400
+    if font_size >= LARGE_TEXT_SIZE or (
+        font_size >= LARGE_BOLD_TEXT_SIZE and font_weight >= 700
+    ):
+        return MIN_CONTRAST_RATIO_LARGE
+    return MIN_CONTRAST_RATIO
+
+
+def _import_numpy() -> Any:
+    """
+    NumPy を読み込む（任意の依存のため、未インストールの場合は None）
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def contrast_ratios(
+    foregrounds: list[tuple], backgrounds: list[tuple], use_numpy: bool = True
+) -> list[float]:
+    """
+    文字色と背景色の組のコントラスト比をまとめて計算
+
+    NumPy がインストールされている場合は、すべての組の相対輝度と
+    コントラスト比を配列演算で一括計算する（未インストール時は1組ずつ計算）。
+
+    Args:
+        foregrounds: 文字色 (r, g, b[, a]) のリスト
+        backgrounds: 背景色 (r, g, b[, a]) のリスト（foregrounds と同じ順序）
+        use_numpy: False の場合は NumPy を使わない
+
+    Returns:
+        list[float]: 組ごとのコントラスト比
+    """
+    np = _import_numpy() if use_numpy else None
+    if np is None or not foregrounds:
+        return [
+            contrast_ratio(fg, bg)
+            for fg, bg in zip(foregrounds, backgrounds, strict=True)
+        ]
+
+    # (組数, 2, 3) の配列: [:, 0] が文字色、[:, 1] が背景色
+    colors = np.stack(
+        (np.array(foregrounds)[:, :3], np.array(backgrounds)[:, :3]), axis=1
+    )
+    linear = np.where(
+        colors <= 0.04045, colors / 12.92, ((colors + 0.055) / 1.055) ** 2.4
+    )
+    luminance = linear @ np.array([0.2126, 0.7152, 0.0722])
+    ratios = (luminance.max(axis=1) + 0.05) / (luminance.min(axis=1) + 0.05)
+    return ratios.tolist()
+
+
+def check_contrast(design_json: dict[str, Any]) -> list[Finding]:
+    """
+    すべてのTEXTノードについて文字色と背景色のコントラスト比を検査
+
+    Args:
+        design_json: 軽量化されたデザインデータ
+
+    Returns:
+        list[Finding]: 基準を満たさないノードと、判定できなかったノードの検出結果
+    """
+    pairs, findings = collect_text_contrast_pairs(design_json)
+    ratios = contrast_ratios([p[1] for p in pairs], [p[2] for p in pairs])
+    for (node, foreground, background), ratio in zip(pairs, ratios, strict=True):
+        required = required_contrast_ratio(node)
+        if ratio < required:
+            findings.append(
+                Finding(
+                    "contrast",
+                    node.get("id"),
+                    node.get("name"),
+                    f"コントラスト比 {ratio:.2f}:1（基準 {required:g}:1 以上）"
+                    f" 文字色 {_color_to_hex(_rgba_dict(foreground))}"
+                    f" / 背景色 {_color_to_hex(_rgba_dict(background))}",
+                )
+            )
+    return findings
+
+
+def _rgba_dict(rgba: tuple) -> dict[str, float]:
+    # 不透明色として16進数表記にするための辞書
+    return {"r": rgba[0], "g": rgba[1], "b": rgba[2]}
+
+
+def is_touch_target_name(name: str) -> bool:
+    """
+    要素名からタッチターゲット（ボタン・リンクなど）かどうかを判定
+
+    "IconButton" や "btn_primary" は単語に分けて照合し、"Table header" や "Stable" は除く。
+
+    Args:
+        name: ノード名
+
+    Returns:
+        bool: タッチターゲットとみなす名前の場合 True
+    """
+    words = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", name).lower()
+    return TOUCH_TARGET_NAME_PATTERN.search(words) is not None
+
+
+def run_accessibility_rules(design_json: dict[str, Any]) -> list[Finding]:
+    """
+    コントラスト比・フォントサイズ・タッチターゲットをローカルで検査
+
+    Args:
+        design_json: simplify_node_data で軽量化されたデザインデータ
+
+    Returns:
+        list[Finding]: 検出結果（判定できなかった項目は ambiguous=True）
+    """
+    findings = check_contrast(design_json)
+    # (ノード, 最も近いタッチターゲットの祖先が基準を満たすか) のスタック
+    stack: list[tuple[dict[str, Any], bool]] = [(design_json, False)]
+
+    while stack:
+        node, inside_large_target = stack.pop()
+        node_id = node.get("id")
+        name = node.get("name") or ""
+        bbox = node.get("absoluteBoundingBox") or {}
+        width, height = bbox.get("width"), bbox.get("height")
+        is_target = is_touch_target_name(name)
+        if is_target and width is not None and height is not None:
+            children_inside = min(width, height) >= MIN_TOUCH_TARGET_SIZE
+        else:
+            children_inside = inside_large_target
+        stack.extend(
+            (child, children_inside) for child in reversed(node.get("children") or [])
+        )
+
+        # フォントサイズ
+        if node.get("type") == "TEXT":
+            font_size = (node.get("style") or {}).get("fontSize")
+            if font_size is not None and font_size < MIN_FONT_SIZE:
+                findings.append(
+                    Finding(
+                        "font_size",
+                        node_id,
+                        name,
+                        f"フォントサイズ {font_size:g}px（基準 {MIN_FONT_SIZE}px 以上）",
+                    )
+                )
+            continue
+
+        # タッチターゲット（名前で判定できない小さな部品は Gemini に判断を依頼）
+        # 基準を満たすボタンの中のアイコンなどは、押せる範囲が祖先の大きさになるため除く
+        if inside_large_target or width is None or height is None:
+            continue
+        if min(width, height) >= MIN_TOUCH_TARGET_SIZE:
+            continue
+        size = f"{width:g}×{height:g}px（基準 {MIN_TOUCH_TARGET_SIZE}px 以上）"
+        if is_target:
+            findings.append(Finding("touch_target", node_id, name, size))
+        elif node.get("type") in AMBIGUOUS_TOUCH_TARGET_TYPES:
+            findings.append(
+                Finding(
+                    "touch_target",
+                    node_id,
+                    name,
+                    f"{size}。操作可能な要素かどうかを名前から判定できません",
+                    True,
+                )
+            )
+
+    return findings
+
+
+def format_findings_markdown(findings: list[Finding], spacing_summary: str = "") -> str:
+    """
+    ローカルのルールによる確定的な検出結果を Markdown に整形
+
+    Args:
+        findings: 検出結果
+        spacing_summary: format_spacing_summary による余白と揃えの集計
+
+    Returns:
+        str: レポートの先頭に置く Markdown
+    """
+    lines = [
+        "# ローカルルールによる検査",
+        "",
+        "コントラスト比（WCAG 2.1 AA）・フォントサイズ・タッチターゲット・余白・揃えを"
+        "デザインデータから計算した結果です。",
+        "",
+    ]
+    if spacing_summary:
+        lines += ["## 余白と揃えの集計", "", spacing_summary, ""]
+    for rule, title in RULE_TITLES.items():
+        confirmed = [f for f in findings if f.rule == rule and not f.ambiguous]
+        ambiguous_count = sum(1 for f in findings if f.rule == rule and f.ambiguous)
+        lines.append(f"## {title}")
+        lines.append("")
+        if not confirmed:
+            lines.append("- 問題は検出されませんでした")
+        else:
+            lines.append("| ノード | 名前 | 内容 |")
+            lines.append("| --- | --- | --- |")
+            for finding in confirmed[:MAX_LISTED_FINDINGS]:
+                name = (finding.node_name or "").replace("|", "\\|")
+                lines.append(f"| {finding.node_id} | {name} | {finding.message} |")
+            if len(confirmed) > MAX_LISTED_FINDINGS:
+                lines.append("")
+                lines.append(f"- 他 {len(confirmed) - MAX_LISTED_FINDINGS}件")
+        if ambiguous_count:
+            lines.append("")
+            lines.append(
+                f"- ローカルで判定できなかった {ambiguous_count}件は Gemini の分析結果を参照してください"
+            )
+        lines.append("")
+    return "\n".join(lines) + "\n---\n\n"
+
+
+def format_ambiguous_findings(findings: list[Finding]) -> str:
+    """
+    ローカルで判定できなかった項目をプロンプト用の箇条書きに整形
+    """
+    ambiguous = [f for f in findings if f.ambiguous]
+    if not ambiguous:
+        return "- なし"
+    lines = [
+        f"- [{RULE_TITLES[f.rule]}] {f.node_id} 「{f.node_name}」: {f.message}"
+        for f in ambiguous[:MAX_LISTED_FINDINGS]
+    ]
+    if len(ambiguous) > MAX_LISTED_FINDINGS:
+        lines.append(f"- 他 {len(ambiguous) - MAX_LISTED_FINDINGS}件")
+    return "\n".join(lines)
+
+
+# 余白を同じ値とみなす許容差（px）
+SPACING_TOLERANCE = 1.0
+# 揃っているとみなす位置の許容差と、揃えのずれとして指摘する最大のずれ（px）
+ALIGNMENT_TOLERANCE = 0.5
+MAX_MISALIGNMENT = 4.0
+# 余白の分布として列挙する値の数
+TOP_GAP_VALUES = 8
+
+
+class SpacingSummary(NamedTuple):
+    """
+    要素間の余白と揃えの集計結果
+    """
+
+    gap_counts: dict[float, int]
+    findings: list[Finding]
+
+
+def _axis_gaps(boxes: list[tuple[float, float]]) -> list[float]:
+    """
+    1軸上の区間 (開始, 終了) の並びから、重ならない区間同士の間隔を求める（スイープライン）
+
+    開始位置でソートし、それまでの区間の最大の終了位置より後ろから始まる区間との
+    距離を間隔とする。重なっている区間は同じ列（行）として扱う。
+
+    Args:
+        boxes: (開始位置, 終了位置) のリスト
+
+    Returns:
+        list[float]: 隣り合う列（行）の間隔（開始位置の順）
+    """
+    gaps = []
+    sweep_end = None
+    for start, end in sorted(boxes):
+        if sweep_end is not None and start > sweep_end:
+            gaps.append(round(start - sweep_end, 1))
+        sweep_end = end if sweep_end is None else max(sweep_end, end)
+    return gaps
+
+
+def _misaligned(
+    values: list[tuple[float, dict[str, Any]]],
+) -> list[tuple[dict[str, Any], float, float]]:
+    """
+    位置の値をソートしてクラスタにまとめ、揃え位置の近くで揃っていない要素を検出
+
+    Args:
+        values: (位置, ノード) のリスト
+
+    Returns:
+        list[tuple[dict, float, float]]: (ノード, 位置, 最も近い揃え位置) のリスト
+    """
+    # ソート済みの値を、隣との差が許容差以内のものどうしでクラスタにまとめる
+    clusters: list[list[tuple[float, dict[str, Any]]]] = []
+    for value in sorted(values, key=lambda v: v[0]):
+        if clusters and value[0] - clusters[-1][-1][0] <= ALIGNMENT_TOLERANCE:
+            clusters[-1].append(value)
+        else:
+            clusters.append([value])
+
+    # 2要素以上が揃っている位置を揃え位置とし、近くにある単独の要素をずれとみなす
+    lines = [cluster[0][0] for cluster in clusters if len(cluster) > 1]
+    misaligned = []
+    for cluster in clusters:
+        if len(cluster) > 1 or not lines:
+            continue
+        position, node = cluster[0]
+        index = bisect.bisect_left(lines, position)
+        nearest = min(
+            lines[max(index - 1, 0) : index + 1], key=lambda v: abs(v - position)
+        )
+        if abs(nearest - position) <= MAX_MISALIGNMENT:
+            misaligned.append((node, position, nearest))
+    return misaligned
+
+
+def analyze_spacing(design_json: dict[str, Any]) -> SpacingSummary:
+    """
+    absoluteBoundingBox から要素間の余白と揃えを集計
+
+    親要素ごとに子要素の区間をソートして走査するため、全体で O(n log n) で動作する。
+
+    - 余白: 縦・横それぞれ隣り合う列（行）の間隔を求め、3つ以上ある場合は
+      中央値から許容差を超えて外れた間隔をばらつきとして検出
+    - 揃え: 左端・中央・右端（縦方向は上端・中央・下端）ごとに揃え位置を求め、
+      揃え位置から少しだけずれている要素を検出
+
+    Args:
+        design_json: 軽量化されたデザインデータ
+
+    Returns:
+        SpacingSummary: 余白の値ごとの出現回数と、ばらつき・ずれの検出結果
+    """
+    gap_counts: dict[float, int] = {}
+    findings = []
+    stack = [design_json]
+
+    while stack:
+        node = stack.pop()
+        children = node.get("children") or []
+        stack.extend(children)
+
+        boxed = [
+            (child, child["absoluteBoundingBox"])
+            for child in children
+            if child.get("absoluteBoundingBox")
+            and None not in child["absoluteBoundingBox"].values()
+        ]
+        if len(boxed) < 2:
+            continue
+
+        for axis, start_key, size_key in (
+            ("縦", "y", "height"),
+            ("横", "x", "width"),
+        ):
+            # 余白
+            gaps = _axis_gaps(
+                [(b[start_key], b[start_key] + b[size_key]) for _, b in boxed]
+            )
+            for gap in gaps:
+                gap_counts[gap] = gap_counts.get(gap, 0) + 1
+            if len(gaps) >= 3:
+                median = sorted(gaps)[len(gaps) // 2]
+                outliers = [g for g in gaps if abs(g - median) > SPACING_TOLERANCE]
+                if outliers:
+                    findings.append(
+                        Finding(
+                            "spacing",
+                            node.get("id"),
+                            node.get("name"),
+                            f"{axis}方向の余白 {_format_px_list(gaps)}"
+                            f"（中央値 {median:g}px から外れ: {_format_px_list(outliers)}）",
+                        )
+                    )
+
+            # 揃え（要素ごとに最もずれの小さいものを1件だけ報告）
+            offsets: dict[int, tuple[dict[str, Any], str, float, float]] = {}
+            for edge, ratio in (("始端", 0.0), ("中央", 0.5), ("終端", 1.0)):
+                values = [
+                    (b[start_key] + b[size_key] * ratio, child) for child, b in boxed
+                ]
+                for child, position, line in _misaligned(values):
+                    key = id(child)
+                    if key not in offsets or abs(line - position) < abs(
+                        offsets[key][3] - offsets[key][2]
+                    ):
+                        offsets[key] = (child, edge, position, line)
+            for child, edge, position, line in offsets.values():
+                findings.append(
+                    Finding(
+                        "alignment",
+                        child.get("id"),
+                        child.get("name"),
+                        f"{axis}方向の{edge} {start_key}={position:g} が"
+                        f"揃え位置 {line:g} から {abs(position - line):.1f}px ずれています",
+                    )
+                )
+
+    return SpacingSummary(gap_counts, findings)
+
+
+def _format_px_list(values: list[float]) -> str:
+    return "[" + ", ".join(f"{v:g}" for v in values) + "]px"
+
+
+def format_spacing_summary(summary: SpacingSummary) -> str:
+    """
+    余白と揃えの集計を、座標の代わりにプロンプト・レポートへ渡す箇条書きに整形
+    """
+    top_gaps = sorted(summary.gap_counts.items(), key=lambda item: -item[1])
+    distribution = ", ".join(
+        f"{gap:g}px×{count}" for gap, count in top_gaps[:TOP_GAP_VALUES]
+    )
+    spacing_count = sum(1 for f in summary.findings if f.rule == "spacing")
+    alignment_count = len(summary.findings) - spacing_count
+    return "\n".join(
+        [
+            f"- 要素間の余白の分布（多い順）: {distribution or 'なし'}",
+            f"- 余白のばらつきがある親要素: {spacing_count}件",
+            f"- 揃え位置からわずかにずれた要素: {alignment_count}件",
+        ]
+    )
+
+
+# Gemini に与える役割
+SYSTEM_INSTRUCTION = "あなたは熟練の UI/UX デザイナー兼アクセシビリティの専門家です。"
+
+# アクセシビリティの分析観点（ローカルのルールを使わない場合）
+ACCESSIBILITY_CRITERIA = """- コントラスト比: 背景色と文字色のコントラストが低く、視認性に問題がありそうな箇所を指摘してください
+- フォントサイズ: 14px未満のテキストがある場合は警告してください
+- タッチターゲット: 幅または高さが44px未満の要素（ボタンやリンクなど）がある場合は警告してください"""
+
+# アクセシビリティの分析観点（ローカルのルールで検査済みの場合）
+ACCESSIBILITY_CRITERIA_WITH_LOCAL_RULES = """- コントラスト比・フォントサイズ・タッチターゲットはローカルのルールで計算済みで、結果はレポートに別途掲載します。これらを改めて列挙する必要はありません
+- ただし、以下のローカルで判定できなかった項目については、デザインデータから判断して問題があれば指摘してください
+{ambiguous_findings}"""
+
+# 余白の分析観点（ローカルのルールを使わない場合）
+SPACING_CRITERIA = "- 余白: absoluteBoundingBoxから推測される要素間の余白にばらつきがないか確認してください"
+
+# 余白の分析観点（ローカルで集計済みの場合）
+SPACING_CRITERIA_WITH_LOCAL_RULES = """- 余白: 座標から集計した要素間の余白と揃えは以下のとおりです（個別の検出結果はレポートに別途掲載します）。この集計をもとに、余白のスケールの一貫性を評価してください
+{spacing_summary}"""
+
+# 分析の指示（すべてのフレームで共通の静的な部分）
+# プロンプトの先頭に置くことで、最小トークン数を満たせばコンテキストキャッシュの対象になる
+ANALYSIS_INSTRUCTIONS = """FigmaデザインデータをJSON形式で提供します。このデータを分析し、UI/UXおよびアクセシビリティの観点から改善レポートをMarkdown形式で作成してください。
+
+# 分析観点
+
+## 1. アクセシビリティ
+- コントラスト比・フォントサイズ・タッチターゲットについて、デザインデータとともに示す「このフレームの分析観点」に従って確認してください
+
+## 2. 一貫性
+- 余白: 「このフレームの分析観点」に従って確認してください
+- フォント: fontFamilyやfontWeightに不統一な箇所がないか確認してください
+
+## 3. 改善提案
+- 上記の問題点に対して、具体的な修正例を提示してください
+  例: 「ボタンの高さを44px以上にする」「本文フォントサイズを16pxにする」など
+
+# 出力形式
+Markdown形式で、見出しや箇条書きを使って読みやすく構造化してください。
+"""
+
+# 分析プロンプトのテンプレート（フレームごとに変わる部分）
+# （{design_json} にデザインデータ、{legend} に凡例、
+#   {accessibility_criteria} と {spacing_criteria} に分析観点が入る）
+ANALYSIS_PROMPT_TEMPLATE = """# デザインデータ（JSON）
+```json
+{design_json}
+```
+{legend}
+# このフレームの分析観点
+
+## アクセシビリティ
+{accessibility_criteria}
+
+## 一貫性
+{spacing_criteria}
+"""
+
+
+def analysis_cache_key(
+    design_json: dict[str, Any],
+    prompt_format: str,
+    local_rules: bool,
+    model_name: str = GEMINI_MODEL_NAME,
+    generation_config: dict[str, Any] | None = None,
+    prompt_template: str = ANALYSIS_PROMPT_TEMPLATE,
+) -> str:
+    """
+    Gemini分析結果のキャッシュキーを生成
+
+    モデル名・生成設定・プロンプトのテンプレートと、キー順を正規化した
+    デザインデータのハッシュを使うため、いずれかが変われば別のキーになる。
+
+    Args:
+        design_json: 軽量化されたデザインデータ
+        prompt_format: プロンプトに埋め込むデザインデータの形式
+        local_rules: ローカルのアクセシビリティ検査を使うかどうか
+        model_name: 使用するモデル名
+        generation_config: 生成設定（None の場合は GEMINI_GENERATION_CONFIG）
+        prompt_template: 実際にプロンプトの組み立てに使うテンプレート
+            （DesignAnalyzer.prompt_template）
+
+    Returns:
+        str: SHA-256 のハッシュ値
+    """
+    canonical_design = dumps_json(design_json, separators=(",", ":"), sort_keys=True)
+    material = json.dumps(
+        {
+            "model": model_name,
+            "generation_config": generation_config or GEMINI_GENERATION_CONFIG,
+            "system_instruction": SYSTEM_INSTRUCTION,
+            "instructions": ANALYSIS_INSTRUCTIONS,
+            "prompt_template": prompt_template,
+            "prompt_format": prompt_format,
+            "criteria": (
+                [
+                    ACCESSIBILITY_CRITERIA_WITH_LOCAL_RULES,
+                    SPACING_CRITERIA_WITH_LOCAL_RULES,
+                ]
+                if local_rules
+                else [ACCESSIBILITY_CRITERIA, SPACING_CRITERIA]
+            ),
+            "design": canonical_design,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _print_prompt_size(design_json_str: str) -> None:
+    """
+    プロンプトに埋め込むデザインデータのサイズと推定トークン数を表示
+
+    形式ごとの比較は分析のたびに再シリアライズしないよう、benchmark.py prompt で行う。
+    """
+    tokens = count_tokens(design_json_str)
+    print(f"デザインデータ: {len(design_json_str):,}文字 / 推定 {tokens:,}トークン")
+
+
+# コンテキストキャッシュの有効期限のデフォルト（分）
+DEFAULT_CONTEXT_CACHE_TTL_MINUTES = 60
+# 有効期限までの残りがこの秒数を下回ったら延長する
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 300
+# コンテキストキャッシュに登録できる最小トークン数（モデル名の前方一致、長いものを優先）
+CONTEXT_CACHE_MIN_TOKENS = {"gemini-2.5-pro": 4096, "gemini-2.5-flash": 1024}
+# 上記にないモデルの最小トークン数（分からないため大きい方に合わせる）
+DEFAULT_CONTEXT_CACHE_MIN_TOKENS = 4096
+
+
+def context_cache_min_tokens(model_name: str) -> int:
+    """
+    モデルのコンテキストキャッシュに登録できる最小トークン数
+
+    Args:
+        model_name: モデル名
+
+    Returns:
+        int: 最小トークン数（CONTEXT_CACHE_MIN_TOKENS にないモデルは DEFAULT_CONTEXT_CACHE_MIN_TOKENS）
+    """
+    for prefix in sorted(CONTEXT_CACHE_MIN_TOKENS, key=len, reverse=True):
+        if model_name.startswith(prefix):
+            return CONTEXT_CACHE_MIN_TOKENS[prefix]
+    return DEFAULT_CONTEXT_CACHE_MIN_TOKENS
+
+
+class GeminiContextCache:
+    """
+    システム指示と分析の指示を Gemini のコンテキストキャッシュに登録して再利用する
+
+    最初の分析で1回だけ作成し、有効期限が近づいたら延長する。処理の終わりに close() で削除すること。
+    共通の指示がモデルの最小トークン数に満たない場合は作成を試みず、作成に失敗した場合も含めて
+    以降はキャッシュを使わず、通常の呼び出しで続行する。
+    """
+
+    def __init__(
+        self,
+        model_name: str = GEMINI_MODEL_NAME,
+        ttl_seconds: float = DEFAULT_CONTEXT_CACHE_TTL_MINUTES * 60,
+        count: Callable[[str], int] = count_tokens,
+    ):
+        """
+        Args:
+            model_name: キャッシュを使うモデル名
+            ttl_seconds: キャッシュの有効期限（秒）
+            count: 共通の指示のトークン数を数える関数（GeminiBackend.count_tokens など）
+        """
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self.count = count
+        self._cached_content: Any = None
+        self._expires_at = 0.0
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def _prefix_is_cacheable(self) -> bool:
+        tokens = self.count(f"{SYSTEM_INSTRUCTION}\n{ANALYSIS_INSTRUCTIONS}")
+        min_tokens = context_cache_min_tokens(self.model_name)
+        if tokens >= min_tokens:
+            return True
+        print(
+            f"コンテキストキャッシュを使いません: 共通の指示は {tokens:,}トークンで、"
+            f"{self.model_name} の最小 {min_tokens:,}トークンに満たないため（キャッシュなしで続行）"
+        )
+        return False
+
+    def get(self) -> Any:
+        """
+        有効なキャッシュを返す（必要に応じて作成・延長する）
+
+        genai.configure を呼び出した後に使うこと。
+
+        Returns:
+            CachedContent | None: キャッシュ（使えない場合は None）
+        """
+        with self._lock:
+            if self._disabled:
+                return None
+            ttl = datetime.timedelta(seconds=self.ttl_seconds)
+
+            if (
+                self._cached_content is not None
+                and self._expires_at - time.monotonic()
+                < CONTEXT_CACHE_REFRESH_MARGIN_SECONDS
+            ):
+                try:
+                    self._cached_content.update(ttl=ttl)
+                    self._expires_at = time.monotonic() + self.ttl_seconds
+                except Exception as e:
+                    # 期限切れなどで延長できない場合は作り直す
+                    print(f"コンテキストキャッシュを延長できないため再作成します ({e})")
+                    self._cached_content = None
+
+            if self._cached_content is None:
+                if not self._prefix_is_cacheable():
+                    self._disabled = True
+                    return None
+                try:
+                    from google.generativeai import caching
+
+                    self._cached_content = caching.CachedContent.create(
+                        model=f"models/{self.model_name}",
+                        display_name="figma-uiux-analysis",
+                        system_instruction=SYSTEM_INSTRUCTION,
+                        contents=[ANALYSIS_INSTRUCTIONS],
+                        ttl=ttl,
+                    )
+                except Exception as e:
+                    self._disabled = True
+                    print(
+                        "警告: コンテキストキャッシュを作成できませんでした。"
+                        f"キャッシュなしで続行します ({e})"
+                    )
+                    return None
+                self._expires_at = time.monotonic() + self.ttl_seconds
+                print(
+                    f"コンテキストキャッシュを作成しました: {self._cached_content.name}"
+                )
+
+            return self._cached_content
+
+    def close(self) -> None:
+        """
+        作成したキャッシュを削除
+        """
+        with self._lock:
+            if self._cached_content is None:
+                return
+            try:
+                self._cached_content.delete()
+            except Exception as e:
+                print(f"警告: コンテキストキャッシュの削除に失敗しました ({e})")
+            self._cached_content = None
+
+    def __enter__(self) -> "GeminiContextCache":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class TokenUsage:
+    """
+    LLM のトークン使用量の集計（複数スレッドから更新される）
+
+    prompt_tokens はキャッシュから読まれた分を含むため、
+    キャッシュされなかった入力は prompt_tokens - cached_tokens になる。
+    """
+
+    def __init__(self):
+        self.stats = {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+        }
+        self._lock = threading.Lock()
+
+    def add(self, counts: dict[str, int]) -> None:
+        """
+        1回の呼び出しの prompt_tokens / cached_tokens / output_tokens を集計に加える
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            for key in ("prompt_tokens", "cached_tokens", "output_tokens"):
+                self.stats[key] += counts.get(key, 0)
+
+
+class LLMBackend(ABC):
+    """
+    分析レポートを生成するLLMのバックエンド（GeminiBackend / FakeBackend）
+
+    プロンプトの組み立て・分析結果のキャッシュ・ローカルの検査・レポートへの書き込みは
+    DesignAnalyzer が行い、バックエンドは1回の生成だけを担当する。
+    別のLLMを使う場合はこのクラスを継承して generate を実装する（未実装の場合はインスタンス化できない）。
+    複数スレッドから呼び出される。
+    """
+
+    # 進捗の表示に使う名前
+    label = "LLM"
+
+    def __init__(self, model_name: str, generation_config: dict[str, Any]):
+        """
+        Args:
+            model_name: モデル名（分析結果のキャッシュキーに含める）
+            generation_config: 生成設定（分析結果のキャッシュキーに含める）
+        """
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    @abstractmethod
+    def generate(
+        self, user_prompt: str, on_text: Callable[[str], None] | None = None
+    ) -> tuple[str, dict[str, int]]:
+        """
+        静的な指示（SYSTEM_INSTRUCTION, ANALYSIS_INSTRUCTIONS）とフレームごとのプロンプトからレポートを生成
+
+        Args:
+            user_prompt: フレームごとのプロンプト
+            on_text: 指定した場合はストリーミング生成し、生成された部分ごとに呼び出す
+
+        Returns:
+            tuple[str, dict[str, int]]:
+                (生成されたテキスト, prompt_tokens / cached_tokens / output_tokens)
+        """
+
+    def count_tokens(self, text: str) -> int:
+        """
+        モデルの入力としての text のトークン数（チャンクに分割するかの判定に使う）
+
+        モデルのトークナイザーを使えないバックエンドはローカルの推定値を返す。
+
+        Args:
+            text: 対象のテキスト
+
+        Returns:
+            int: トークン数
+        """
+        return count_tokens(text)
+
+    def close(self) -> None:
+        """
+        バックエンドが確保したリソースを解放（解放するリソースがない場合は何もしない）
+        """
+        return
+
+
+class GeminiBackend(LLMBackend):
+    """
+    google.generativeai で生成するバックエンド
+
+    genai の設定と GenerativeModel は1回だけ作成する。
+    context_cache_ttl_seconds を指定した場合は、共通の指示がモデルの最小トークン数を満たすときだけ
+    コンテキストキャッシュに登録し、フレームごとのプロンプトだけを送信する（close() でキャッシュを削除する）。
+    """
+
+    label = "Gemini AI"
+
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = GEMINI_MODEL_NAME,
+        generation_config: dict[str, Any] | None = None,
+        context_cache_ttl_seconds: float | None = None,
+    ):
+        """
+        Args:
+            api_key: Gemini APIキー
+            model_name: 使用するモデル名
+            generation_config: 生成設定（temperature など。None の場合は GEMINI_GENERATION_CONFIG）
+            context_cache_ttl_seconds: コンテキストキャッシュの有効期限（None の場合は使わない）
+        """
+        import google.generativeai as genai
+
+        super().__init__(
+            model_name, dict(generation_config or GEMINI_GENERATION_CONFIG)
+        )
+        self.context_cache = (
+            GeminiContextCache(model_name, context_cache_ttl_seconds, self.count_tokens)
+            if context_cache_ttl_seconds
+            else None
+        )
+
+        genai.configure(api_key=api_key)
+        self._generation_config = genai.GenerationConfig(**self.generation_config)
+        self._model = genai.GenerativeModel(model_name)
+        # コンテキストキャッシュを使うモデル（キャッシュを作り直した場合は作り直す）
+        self._cached_model: tuple[str, Any] | None = None
+        self._lock = threading.Lock()
+
+    def _model_for(self, cached_content: Any) -> Any:
+        if cached_content is None:
+            return self._model
+        import google.generativeai as genai
+
+        with self._lock:
+            if (
+                self._cached_model is None
+                or self._cached_model[0] != cached_content.name
+            ):
+                self._cached_model = (
+                    cached_content.name,
+                    genai.GenerativeModel.from_cached_content(
+                        cached_content, generation_config=self._generation_config
+                    ),
+                )
+            return self._cached_model[1]
+
+    def generate(
+        self, user_prompt: str, on_text: Callable[[str], None] | None = None
+    ) -> tuple[str, dict[str, int]]:
+        cached_content = (
+            self.context_cache.get() if self.context_cache is not None else None
+        )
+        model = self._model_for(cached_content)
+
+        # 全フレーム共通の指示を先頭に置き、キャッシュ済みの場合はフレームごとの部分だけを送る
+        contents = (
+            [user_prompt]
+            if cached_content is not None
+            else [SYSTEM_INSTRUCTION, ANALYSIS_INSTRUCTIONS, user_prompt]
+        )
+        response = model.generate_content(
+            contents,
+            generation_config=self._generation_config,
+            stream=on_text is not None,
+        )
+
+        if on_text is None:
+            text = response.text
+        else:
+            chunks = []
+            for chunk in response:
+                try:
+                    chunk_text = chunk.text
+                except ValueError:
+                    # テキストを含まないチャンク（終了理由のみ等）は読み飛ばす
+                    continue
+                on_text(chunk_text)
+                chunks.append(chunk_text)
+            text = "".join(chunks)
+
+        # usage_metadata の prompt_token_count はキャッシュから読まれた分を含む
+        usage_metadata = getattr(response, "usage_metadata", None)
+        counts = {
+            "prompt_tokens": getattr(usage_metadata, "prompt_token_count", 0) or 0,
+            "cached_tokens": getattr(usage_metadata, "cached_content_token_count", 0)
+            or 0,
+            "output_tokens": getattr(usage_metadata, "candidates_token_count", 0) or 0,
+        }
+        return text, counts
+
+    def count_tokens(self, text: str) -> int:
+        # 数えられない場合（APIのエラーなど）は、分析を止めずにローカルの推定値を使う
+        try:
+            return self._model.count_tokens(text).total_tokens
+        except Exception as e:
+            print(f"警告: Gemini でトークン数を数えられないため推定値を使います: {e}")
+            return count_tokens(text)
+
+    def close(self) -> None:
+        """
+        コンテキストキャッシュを削除
+        """
+        if self.context_cache is not None:
+            self.context_cache.close()
+
+
+class FakeBackend(LLMBackend):
+    """
+    APIを呼び出さない決定的なバックエンド（スループットの計測・オフラインの試験用）
+
+    同じプロンプトには同じレポートを返す。トークン数は count_tokens の推定値で、
+    キャッシュから読んだ入力はないものとして数える。
+    最初の出力までの latency と、出力トークンあたりの生成時間で Gemini の応答時間を再現する。
+    """
+
+    label = "フェイクのLLM"
+
+    def __init__(
+        self,
+        latency: float = DEFAULT_FAKE_LATENCY_SECONDS,
+        output_tokens: int = DEFAULT_FAKE_OUTPUT_TOKENS,
+        tokens_per_second: float = 0.0,
+    ):
+        """
+        Args:
+            latency: 最初の出力までの秒数
+            output_tokens: 生成するレポートの推定トークン数
+            tokens_per_second: 1秒あたりの出力トークン数（0 の場合は待たずに出力する）
+        """
+        # 生成されるレポートは output_tokens だけで決まる
+        super().__init__("fake", {"output_tokens": output_tokens})
+        self.latency = latency
+        self.output_tokens = output_tokens
+        self.tokens_per_second = tokens_per_second
+        self._prefix_tokens = count_tokens(SYSTEM_INSTRUCTION) + count_tokens(
+            ANALYSIS_INSTRUCTIONS
+        )
+
+    def _report_chunks(self, user_prompt: str) -> list[str]:
+        # プロンプトのハッシュから、output_tokens 程度の決まったレポートを作る
+        digest = hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()
+        chunks = [
+            f"## 総合評価\n\nフェイクのLLMによるレポートです (プロンプト: {digest[:12]})\n\n"
+        ]
+        tokens = count_tokens(chunks[0])
+        line = 0
+        while tokens < self.output_tokens:
+            chunk = f"- 改善点 {line + 1}: {digest[line % 48 : line % 48 + 16]}\n"
+            chunks.append(chunk)
+            tokens += count_tokens(chunk)
+            line += 1
+        return chunks
+
+    def generate(
+        self, user_prompt: str, on_text: Callable[[str], None] | None = None
+    ) -> tuple[str, dict[str, int]]:
+        chunks = self._report_chunks(user_prompt)
+        time.sleep(self.latency)
+        for chunk in chunks:
+            if self.tokens_per_second > 0:
+                time.sleep(count_tokens(chunk) / self.tokens_per_second)
+            if on_text is not None:
+                on_text(chunk)
+
+        text = "".join(chunks)
+        prompt_tokens = self._prefix_tokens + count_tokens(user_prompt)
+        return text, {
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": 0,
+            "output_tokens": count_tokens(text),
+        }
+
+
+class DesignAnalyzer:
+    """
+    LLMのバックエンドを使ってデザイン分析を行う、使い回し可能な分析器
+
+    バッチ処理やサーバーでは1つのインスタンスを作り、複数スレッドから analyze を呼び出すこと。
+    インスタンスは関数としても呼び出せる（analyze と同じ）。
+
+    - local_rules: コントラスト比・フォントサイズ・タッチターゲット・余白は
+      ローカルで計算してレポートの先頭に掲載し、判定できなかった項目のみ LLM に依頼する
+    - cache: モデル・生成設定・プロンプト・デザインデータが同じ分析結果はキャッシュから返す
+    """
+
+    def __init__(
+        self,
+        backend: LLMBackend,
+        prompt_format: str = "json",
+        cache: DiskCache | None = None,
+        local_rules: bool = True,
+    ):
+        """
+        Args:
+            backend: レポートを生成するLLMのバックエンド
+            prompt_format: プロンプトに埋め込むデザインデータの形式
+            cache: 分析結果のキャッシュ（None の場合はキャッシュしない）
+            local_rules: ローカルの検査を使うかどうか
+        """
+        self.backend = backend
+        self.prompt_format = prompt_format
+        self.cache = cache
+        self.local_rules = local_rules
+        self.prompt_template = ANALYSIS_PROMPT_TEMPLATE
+        self.usage = TokenUsage()
+
+    def _build_prompt(self, design_json: dict[str, Any]) -> tuple[str, str]:
+        """
+        ローカルの検査を実行し、(レポート先頭の検出結果, フレームごとのプロンプト) を返す
+        """
+        findings_markdown = ""
+        accessibility_criteria = ACCESSIBILITY_CRITERIA
+        spacing_criteria = SPACING_CRITERIA
+        if self.local_rules:
+            started_at = time.perf_counter()
+            with stage_metrics.measure("rules"):
+                findings = run_accessibility_rules(design_json)
+                spacing = analyze_spacing(design_json)
+            findings += spacing.findings
+            spacing_summary = format_spacing_summary(spacing)
+            ambiguous_count = sum(1 for f in findings if f.ambiguous)
+            print(
+                f"ローカルルールによる検査: 検出 {len(findings) - ambiguous_count}件 / "
+                f"判定不可 {ambiguous_count}件 ({(time.perf_counter() - started_at) * 1000:.0f}ms)"
+            )
+            findings_markdown = format_findings_markdown(findings, spacing_summary)
+            accessibility_criteria = ACCESSIBILITY_CRITERIA_WITH_LOCAL_RULES.format(
+                ambiguous_findings=format_ambiguous_findings(findings)
+            )
+            spacing_criteria = SPACING_CRITERIA_WITH_LOCAL_RULES.format(
+                spacing_summary=spacing_summary
+            )
+
+        with stage_metrics.measure("serialize") as serialize_metrics:
+            design_json_str = serialize_design(design_json, self.prompt_format)
+            serialize_metrics["bytes"] = len(design_json_str.encode("utf-8"))
+        _print_prompt_size(design_json_str)
+
+        # compact / dedup 形式の場合は凡例を添える
+        legend = ""
+        if self.prompt_format == "compact":
+            legend = f"\n## データ形式の凡例\n{COMPACT_LEGEND}\n"
+        elif self.prompt_format == "dedup":
+            legend = f"\n## データ形式の凡例\n{COMPACT_LEGEND}\n{DEDUP_LEGEND}\n"
+
+        user_prompt = self.prompt_template.format(
+            design_json=design_json_str,
+            legend=legend,
+            accessibility_criteria=accessibility_criteria,
+            spacing_criteria=spacing_criteria,
+        )
+        return findings_markdown, user_prompt
+
+    def analyze(
+        self,
+        design_json: dict[str, Any],
+        output: TextIO | None = None,
+        echo: bool = False,
+    ) -> str:
+        """
+        デザインデータを分析し、改善レポートを生成
+
+        output を指定した場合はストリーミング生成を使い、生成された部分から順に
+        output へ書き込む。途中で失敗しても、それまでに生成された部分は残る。
+
+        Args:
+            design_json: 軽量化されたFigmaデザインデータ
+            output: 生成されたレポートを逐次書き込む出力先（None の場合はストリーミングしない）
+            echo: output への書き込みと同時に標準出力にも表示するかどうか
+
+        Returns:
+            str: Markdown形式の分析レポート
+
+        Raises:
+            SystemExit: LLMの呼び出しに失敗した場合
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = analysis_cache_key(
+                design_json,
+                self.prompt_format,
+                self.local_rules,
+                self.backend.model_name,
+                self.backend.generation_config,
+                self.prompt_template,
+            )
+            cached_report = self.cache.get("gemini", cache_key)
+            if cached_report is not None:
+                print("キャッシュ済みの分析結果を使用します")
+                if output is not None:
+                    _write_report_chunk(output, cached_report, echo)
+                return cached_report
+
+        findings_markdown, user_prompt = self._build_prompt(design_json)
+
+        streamed = False
+        started_at = time.perf_counter()
+
+        def write_streamed(text: str) -> None:
+            nonlocal streamed
+            if not streamed:
+                print(f"最初の出力まで {time.perf_counter() - started_at:.1f}秒")
+                if findings_markdown:
+                    _write_report_chunk(output, findings_markdown, echo)
+                streamed = True
+            _write_report_chunk(output, text, echo)
+
+        try:
+            print(f"{self.backend.label}で分析中...")
+
+            with stage_metrics.measure("llm") as llm_metrics:
+                report_text, counts = self.backend.generate(
+                    user_prompt, write_streamed if output is not None else None
+                )
+                self.usage.add(counts)
+                llm_metrics.update(counts)
+                llm_metrics["bytes"] = len(report_text.encode("utf-8"))
+            print(
+                f"トークン使用量: 入力 {counts['prompt_tokens']:,} "
+                f"(キャッシュ {counts['cached_tokens']:,}) / 出力 {counts['output_tokens']:,}"
+            )
+
+            if not report_text:
+                print(f"エラー: {self.backend.label}からのレスポンスが空です")
+                raise SystemExit(1)
+
+            report_text = findings_markdown + report_text
+
+            if self.cache is not None:
+                self.cache.set("gemini", cache_key, report_text)
+                self.cache.evict()
+
+            print("分析が完了しました")
+            return report_text
+
+        except Exception as e:
+            if streamed:
+                _write_report_chunk(
+                    output,
+                    "\n\n---\n⚠️ 分析が途中で中断されたため、このレポートは不完全です\n",
+                    echo,
+                )
+            print(f"エラー: {self.backend.label}の呼び出し中に例外が発生しました")
+            print(f"例外の詳細: {e}")
+            import traceback
+
+            traceback.print_exc()
+            raise SystemExit(1) from None
+
+    __call__ = analyze
+
+    def close(self) -> None:
+        """
+        バックエンドのリソース（コンテキストキャッシュなど）を解放
+        """
+        self.backend.close()
+
+    def __enter__(self) -> "DesignAnalyzer":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class GeminiAnalyzer(DesignAnalyzer):
+    """
+    GeminiBackend を使う DesignAnalyzer
+
+    genai の設定・GenerativeModel・生成設定・プロンプトを1回だけ用意して保持する。
+    context_cache_ttl_seconds を指定した場合は静的な指示をコンテキストキャッシュに登録する。
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = GEMINI_MODEL_NAME,
+        generation_config: dict[str, Any] | None = None,
+        prompt_format: str = "json",
+        cache: DiskCache | None = None,
+        local_rules: bool = True,
+        context_cache_ttl_seconds: float | None = None,
+    ):
+        """
+        Args:
+            api_key: Gemini APIキー
+            model_name: 使用するモデル名
+            generation_config: 生成設定（temperature など。None の場合は GEMINI_GENERATION_CONFIG）
+            prompt_format: プロンプトに埋め込むデザインデータの形式
+            cache: 分析結果のキャッシュ（None の場合はキャッシュしない）
+            local_rules: ローカルの検査を使うかどうか
+            context_cache_ttl_seconds: コンテキストキャッシュの有効期限（None の場合は使わない）
+        """
+        super().__init__(
+            GeminiBackend(
+                api_key, model_name, generation_config, context_cache_ttl_seconds
+            ),
+            prompt_format=prompt_format,
+            cache=cache,
+            local_rules=local_rules,
+        )
+
+
+def analyze_design_with_gemini(
+    design_json: dict,
+    api_key: str,
+    prompt_format: str = "json",
+    cache: DiskCache | None = None,
+    output: TextIO | None = None,
+    echo: bool = False,
+    local_rules: bool = True,
+) -> str:
+    """
+    Gemini AIを使用してデザインデータを分析し、改善レポートを生成
+
+    1回だけ分析する場合の簡易版。複数回分析する場合は GeminiAnalyzer を使い回すこと。
+
+    Args:
+        design_json: 軽量化されたFigmaデザインデータ
+        api_key: Gemini APIキー
+        prompt_format: プロンプトに埋め込むデザインデータの形式
+        cache: 分析結果のキャッシュ（None の場合はキャッシュしない）
+        output: 生成されたレポートを逐次書き込む出力先（None の場合はストリーミングしない）
+        echo: output への書き込みと同時に標準出力にも表示するかどうか
+        local_rules: ローカルの検査を使うかどうか
+
+    Returns:
+        str: Markdown形式の分析レポート
+
+    Raises:
+        SystemExit: Gemini APIの呼び出しに失敗した場合
+    """
+    analyzer = GeminiAnalyzer(
+        api_key, prompt_format=prompt_format, cache=cache, local_rules=local_rules
+    )
+    return analyzer.analyze(design_json, output=output, echo=echo)
+
+
+def _write_report_chunk(output: TextIO, text: str, echo: bool) -> None:
+    """
+    レポートの一部を出力先に書き込んで即座にフラッシュ（echo 指定時は標準出力にも表示）
+    """
+    output.write(text)
+    output.flush()
+    if echo:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+def write_report(output_path: str, report_markdown: str) -> None:
+    """
+    レポートをファイルに保存（出力先ディレクトリがなければ作成）
+
+    Args:
+        output_path: 出力先ファイルパス
+        report_markdown: Markdown形式のレポート
+    """
+    with stage_metrics.measure("write") as metrics:
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            metrics["bytes"] = f.write(report_markdown)
+
+
+# 1回のGemini呼び出しに含めるデザインデータの推定トークン数の上限
+DEFAULT_TOKEN_BUDGET = 200_000
+# 分割の検討を省略する目安とする、軽量化済みの1ノードの推定トークン数（十分に大きい値）
+CHUNK_PLAN_NODE_TOKENS = 2_000
+
+
+def _json_line_breaks(value: Any) -> int:
+    """
+    json.dumps(indent=2) が value の中に入れる改行の数（count_tokens では改行ごとに1トークン）
+    """
+    if isinstance(value, dict):
+        items = list(value.values())
+    elif isinstance(value, list):
+        items = value
+    else:
+        return 0
+    if not items:
+        return 0
+    # 各要素の行と閉じ括弧の行の改行
+    return sum(1 + _json_line_breaks(item) for item in items) + 1
+
+
+def _subtree_token_estimates(
+    design_json: dict[str, Any], prompt_format: str
+) -> dict[int, int]:
+    """
+    部分木ごとのシリアライズ後の推定トークン数を求める
+
+    ノードを1つずつ空白なしでシリアライズし、json 形式では改行（インデントは改行とまとめて
+    1トークン）、children の括弧と区切りを加えて子孫の分を足し合わせるため、全体で O(n) で動作する
+    （dedup 形式の重複排除は考慮しないので、その場合は多めの見積もりになる）。
+
+    Returns:
+        dict[int, int]: ノードの id() から推定トークン数への辞書
+    """
+    indented = prompt_format == "json"
+    children_key = "children" if indented else COMPACT_KEY_ALIASES["children"]
+    estimates: dict[int, int] = {}
+    # (ノード, 子要素を集計済みか)
+    stack: list[tuple[dict[str, Any], bool]] = [(design_json, False)]
+    while stack:
+        node, children_done = stack.pop()
+        children = node.get("children") or []
+        if not children_done and children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+
+        if indented:
+            own = {k: v for k, v in node.items() if k != "children"}
+            text = json.dumps(own, ensure_ascii=False, separators=(",", ": "))
+            line_breaks = _json_line_breaks(own)
+            if children:
+                # ,\n "children": [ \n 子要素, ... \n ]
+                layout = len(children_key) + 5 + len(children)
+                line_breaks += 2 + len(children)
+            else:
+                layout = 0
+        else:
+            text = json.dumps(
+                _compact_single_node(node), ensure_ascii=False, separators=(",", ":")
+            )
+            # ,"ch":[子要素,...]
+            layout = len(children_key) + 5 + len(children) if children else 0
+            line_breaks = 0
+        estimates[id(node)] = (
+            count_tokens(text)
+            + layout // 4
+            + line_breaks
+            + sum(estimates[id(child)] for child in children)
+        )
+    return estimates
+
+
+def _chunk_with_ancestors(
+    ancestors: list[dict[str, Any]], node: dict[str, Any]
+) -> dict[str, Any]:
+    # 祖先を子要素1つだけの殻として残し、背景色や配置の文脈を保つ
+    for ancestor in reversed(ancestors):
+        shell = {k: v for k, v in ancestor.items() if k != "children"}
+        shell["children"] = [node]
+        node = shell
+    return node
+
+
+def plan_chunks(
+    design_json: dict[str, Any],
+    prompt_format: str = "json",
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> list[tuple[str, dict[str, Any]]]:
+    """
+    デザインデータを、推定トークン数が上限に収まるチャンクに分割
+
+    上限を超えるノードは子フレームの境界で分割し、隣り合う小さな子要素は
+    上限に収まる範囲で1つのチャンクにまとめる。子要素を持たないノードは
+    それ以上分割できないため、上限を超えていてもそのまま1チャンクにする。
+    各チャンクには祖先ノードを子要素1つだけの殻として含め、殻の分も上限に含めて数える。
+
+    Args:
+        design_json: 軽量化されたデザインデータ
+        prompt_format: プロンプトに埋め込むデザインデータの形式
+        token_budget: 1チャンクあたりの推定トークン数の上限
+
+    Returns:
+        list[tuple[str, dict]]: 文書順の (チャンクの説明, デザインデータ) のリスト
+    """
+    estimates = _subtree_token_estimates(design_json, prompt_format)
+    if estimates[id(design_json)] <= token_budget:
+        return [("全体", design_json)]
+
+    chunks = []
+    # ("node", ノード, (祖先, 祖先の殻の推定トークン数)) は分割を検討するノード、
+    # ("chunk", 説明, チャンク) は確定したチャンク
+    stack: list[tuple[str, Any, Any]] = [("node", design_json, ([], 0))]
+
+    while stack:
+        kind, item, context = stack.pop()
+        if kind == "chunk":
+            chunks.append((item, context))
+            continue
+
+        node, (ancestors, shell_tokens) = item, context
+        # 祖先の殻の分を除いた、このノード以下に使える上限
+        budget = token_budget - shell_tokens
+        children = node.get("children") or []
+        path = " > ".join(str(a.get("name")) for a in [*ancestors, node])
+        if estimates[id(node)] <= budget or not children:
+            stack.append(("chunk", path, _chunk_with_ancestors(ancestors, node)))
+            continue
+
+        own_tokens = estimates[id(node)] - sum(estimates[id(c)] for c in children)
+        # 子要素を、上限に収まるグループ（list）と単独で上限を超える子要素（dict）に分ける
+        segments: list[Any] = []
+        group_tokens = own_tokens
+        for child in children:
+            child_tokens = estimates[id(child)]
+            if own_tokens + child_tokens > budget:
+                segments.append(child)
+            elif (
+                segments
+                and isinstance(segments[-1], list)
+                and group_tokens + child_tokens <= budget
+            ):
+                segments[-1].append(child)
+                group_tokens += child_tokens
+            else:
+                segments.append([child])
+                group_tokens = own_tokens + child_tokens
+
+        items: list[tuple[str, Any, Any]] = []
+        for segment in segments:
+            if isinstance(segment, dict):
+                # 単独でも上限を超える子要素は、さらに分割を検討する
+                items.append(
+                    ("node", segment, ([*ancestors, node], shell_tokens + own_tokens))
+                )
+                continue
+            shell = {k: v for k, v in node.items() if k != "children"}
+            shell["children"] = segment
+            label = f"{path}（{segment[0].get('name')} ほか子要素{len(segment)}件）"
+            items.append(("chunk", label, _chunk_with_ancestors(ancestors, shell)))
+
+        # 文書順に処理されるよう逆順に積む
+        stack.extend(reversed(items))
+
+    return chunks
+
+
+def _demote_headings(markdown: str) -> str:
+    # 結合したレポートの見出し階層に合わせて、見出しを1段下げる（コードブロック内は除く）
+    lines = []
+    in_code = False
+    for line in markdown.splitlines():
+        if line.startswith("```"):
+            in_code = not in_code
+        elif not in_code and line.startswith("#"):
+            line = "#" + line
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def analyze_design_in_chunks(
+    design_json: dict[str, Any],
+    analyze: Callable[..., str],
+    prompt_format: str = "json",
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_ANALYZE_CONCURRENCY,
+    output: TextIO | None = None,
+    echo: bool = False,
+    limit: threading.Semaphore | None = None,
+    count: Callable[[str], int] | None = None,
+) -> str:
+    """
+    推定トークン数が上限を超える場合はチャンクに分割して並行に分析し、レポートを結合
+
+    上限に収まる場合は analyze をそのまま呼び出す（output があればストリーミングする）。
+    分割した場合の所要時間は、同時実行数がチャンク数以上なら最も大きなチャンクの分析時間で決まる。
+    一部のチャンクの分析に失敗した場合は、その旨をレポートに記載して残りを結合する。
+
+    Args:
+        design_json: 軽量化されたデザインデータ
+        analyze: 軽量化済みデザインデータからレポートを生成する関数
+        prompt_format: プロンプトに埋め込むデザインデータの形式
+        token_budget: 1回の分析に含める推定トークン数の上限
+        concurrency: チャンクを分析する同時実行数
+        output: 結合したレポートを書き込む出力先
+        echo: output への書き込みと同時に標準出力にも表示するかどうか
+        limit: LLM呼び出しの同時実行数を制限するセマフォ（パイプラインの全フレームで共有する）
+        count: モデルでトークン数を数える関数（LLMBackend.count_tokens）。指定した場合、
+            推定トークン数が上限を超えたときにシリアライズしたデザインデータを数え直し、
+            実際のトークン数が上限を超える場合だけ分割する
+
+    Returns:
+        str: Markdown形式の分析レポート
+
+    Raises:
+        SystemExit: すべてのチャンクの分析に失敗した場合
+    """
+    # ノード数から上限を超えようがない小さなデザインは、推定トークン数を求めずに分析する
+    max_unplanned_nodes = token_budget // CHUNK_PLAN_NODE_TOKENS
+    node_count = 0
+    stack = [design_json]
+    while stack and node_count <= max_unplanned_nodes:
+        node_count += 1
+        stack.extend(stack.pop().get("children") or [])
+    if node_count > max_unplanned_nodes:
+        chunks = plan_chunks(design_json, prompt_format, token_budget)
+    else:
+        chunks = [("全体", design_json)]
+
+    if len(chunks) > 1 and count is not None:
+        # 推定値は概算のため、分割する前にモデルで実際のトークン数を数える
+        design_json_str = serialize_design(design_json, prompt_format)
+        measured = count(design_json_str)
+        if measured <= token_budget:
+            chunks = [("全体", design_json)]
+        else:
+            # 推定値と実際の比率で上限を換算し、チャンクが実際のトークン数で上限に収まるようにする
+            estimated = count_tokens(design_json_str)
+            chunks = plan_chunks(
+                design_json, prompt_format, token_budget * estimated // measured
+            )
+
+    if len(chunks) == 1:
+        with limit if limit is not None else contextlib.nullcontext():
+            if output is not None:
+                return analyze(design_json, output=output, echo=echo)
+            return analyze(design_json)
+
+    print(
+        f"推定トークン数が上限 ({token_budget:,}) を超えるため、"
+        f"{len(chunks)}個のチャンクに分割して分析します"
+    )
+
+    def analyze_chunk(chunk: dict[str, Any]) -> str:
+        with limit if limit is not None else contextlib.nullcontext():
+            return analyze(chunk)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as pool:
+        futures = [pool.submit(analyze_chunk, chunk) for _, chunk in chunks]
+
+        sections = [
+            f"# フレーム全体の分析（{len(chunks)}分割）",
+            "",
+            f"推定トークン数が1回の分析の上限 ({token_budget:,}) を超えるため、"
+            "子フレームの単位で分割して分析した結果を結合しています。",
+            "",
+        ]
+        failed = 0
+        for index, ((label, _), future) in enumerate(
+            zip(chunks, futures, strict=True), start=1
+        ):
+            sections.append(f"## {index}/{len(chunks)}: {label}")
+            sections.append("")
+            try:
+                sections.append(_demote_headings(future.result()))
+            except SystemExit:
+                failed += 1
+                sections.append("⚠️ このチャンクの分析に失敗しました")
+            sections.append("")
+
+    if failed == len(chunks):
+        print("エラー: すべてのチャンクの分析に失敗しました")
+        raise SystemExit(1)
+
+    report_markdown = "\n".join(sections)
+    if output is not None:
+        _write_report_chunk(output, report_markdown, echo)
+    return report_markdown
+
+
+class FrameJob(NamedTuple):
+    """
+    パイプラインで分析する1フレーム分の入力
+    """
+
+    file_key: str
+    node_id: str
+    output_path: str
+
+
+def report_path_for(
+    node_id: str, output_dir: str = DEFAULT_OUTPUT_DIR, file_key: str | None = None
+) -> str:
+    """
+    ノードIDからフレームごとのレポートファイルパスを生成
+
+    Args:
+        node_id: ノードID（例: 1:1099）
+        output_dir: 出力先ディレクトリ
+        file_key: 指定した場合はファイル名に含める（複数ファイルを分析する場合）
+
+    Returns:
+        str: レポートファイルパス（例: reports/report_1-1099.md）
+    """
+    safe_id = re.sub(r"[^A-Za-z0-9_-]", "-", node_id)
+    if file_key:
+        safe_id = re.sub(r"[^A-Za-z0-9_-]", "-", file_key) + "_" + safe_id
+    return str(Path(output_dir) / f"report_{safe_id}.md")
+
+
+# マニフェストの列（output_path は省略可）
+MANIFEST_FIELDS = ("file_key", "node_id", "output_path")
+
+
+def load_manifest(path: str, output_dir: str = DEFAULT_OUTPUT_DIR) -> list[FrameJob]:
+    """
+    分析するフレームの一覧をCSVまたはJSONLのマニフェストから読み込む
+
+    CSV はヘッダー行に file_key, node_id（任意で output_path）を持つこと。
+    それ以外の拡張子は1行1オブジェクトのJSONLとして読み込む。
+    output_path を省略した行は output_dir 以下に出力する
+    （複数のファイルを含む場合はファイル名に file_key を含める）。
+
+    Args:
+        path: マニフェストファイルのパス
+        output_dir: output_path を省略した行の出力先ディレクトリ
+
+    Returns:
+        list[FrameJob]: マニフェストの順序のフレームのリスト
+
+    Raises:
+        SystemExit: ファイルが読めない、必須の列がない、出力先が重複する場合
+    """
+    try:
+        # Excel で保存したCSVは先頭に BOM が付くため utf-8-sig で読む
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            if path.lower().endswith(".csv"):
+                rows = [(n, row) for n, row in enumerate(csv.DictReader(f), start=2)]
+            else:
+                rows = [
+                    (n, json.loads(line))
+                    for n, line in enumerate(f, start=1)
+                    if line.strip()
+                ]
+    except (OSError, json.JSONDecodeError, csv.Error) as e:
+        print(f"エラー: マニフェストを読み込めませんでした ({path}): {e}")
+        raise SystemExit(1) from None
+
+    entries = []
+    for line_number, row in rows:
+        values = (
+            {field: str(row.get(field) or "").strip() for field in MANIFEST_FIELDS}
+            if isinstance(row, dict)
+            else {}
+        )
+        if not values.get("file_key") or not values.get("node_id"):
+            print(
+                f"エラー: マニフェストの{line_number}行目に file_key と node_id がありません"
+            )
+            raise SystemExit(1)
+        entries.append(values)
+
+    multiple_files = len({entry["file_key"] for entry in entries}) > 1
+    jobs = []
+    for entry in entries:
+        output_path = entry["output_path"] or report_path_for(
+            entry["node_id"],
+            output_dir,
+            file_key=entry["file_key"] if multiple_files else None,
+        )
+        jobs.append(FrameJob(entry["file_key"], entry["node_id"], output_path))
+
+    seen: set[str] = set()
+    duplicates = set()
+    for job in jobs:
+        if job.output_path in seen:
+            duplicates.add(job.output_path)
+        seen.add(job.output_path)
+    if duplicates:
+        print(
+            f"エラー: マニフェストの出力先が重複しています: {', '.join(sorted(duplicates))}"
+        )
+        raise SystemExit(1)
+    return jobs
+
+
+def write_summary(
+    path: str,
+    jobs: list[FrameJob],
+    results: list[dict[str, Any]],
+    seconds: float,
+    **stats: Any,
+) -> None:
+    """
+    パイプラインの処理結果をまとめたJSONを書き出す
+
+    Args:
+        path: 出力先のパス
+        jobs: 処理したフレームのリスト（frames はこの順序で出力する）
+        results: run_pipeline の処理結果
+        seconds: 全体の処理時間（秒）
+        **stats: あわせて記録する統計（Figma APIのリトライ統計など）
+    """
+    order = {tuple(job): index for index, job in enumerate(jobs)}
+    frames = sorted(
+        results,
+        key=lambda r: order.get(
+            (r["file_key"], r["node_id"], r["output_path"]), len(jobs)
+        ),
+    )
+    failed = sum(1 for r in results if r["status"] != "ok")
+    summary = {
+        "finished_at": datetime.datetime.now()
+        .astimezone()
+        .isoformat(timespec="seconds"),
+        "seconds": round(seconds, 3),
+        "total": len(results),
+        "ok": len(results) - failed,
+        "error": failed,
+        **stats,
+        "frames": frames,
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def _analyze_streaming_to_file(
+    analyze: Callable[..., str], design_json: dict[str, Any], output_path: str
+) -> str:
+    """
+    レポートファイルを開き、分析結果を生成されたそばから書き込む
+    """
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        return analyze(design_json, output=f)
+
+
+async def _fetch_file_version(
+    file_key: str,
+    figma_client: FigmaClient,
+    fetch_semaphore: "asyncio.Semaphore",
+) -> str | None:
+    """
+    ファイルのバージョンを取得（失敗した場合は None）
+
+    同じファイルのバッチで共有するタスクとして実行するため、SystemExit は送出しない。
+    """
+    import asyncio
+
+    async with fetch_semaphore:
+        try:
+            return await asyncio.to_thread(
+                fetch_figma_file_version, file_key, figma_client
+            )
+        except SystemExit:
+            return None
+
+
+async def _fetch_node_batch(
+    file_key: str,
+    node_ids: list[str],
+    figma_client: FigmaClient,
+    figma_cache: DiskCache | None,
+    version_task: "asyncio.Task[str | None] | None",
+    fetch_semaphore: "asyncio.Semaphore",
+    stream_json: bool,
+) -> tuple[dict[str, dict | None] | None, float]:
+    """
+    同じファイルのノードを1回の /nodes リクエストでまとめて取得
+
+    バッチ内のフレームで共有するタスクとして実行するため、SystemExit は送出しない。
+
+    Returns:
+        tuple: (ノードIDからdocumentデータへのマッピング（失敗した場合は None),
+            セマフォの待ち時間を除いた取得時間（秒）)
+    """
+    import asyncio
+
+    version = None
+    if version_task is not None:
+        version = await version_task
+        if version is None:
+            return None, 0.0
+
+    async with fetch_semaphore:
+        started_at = time.perf_counter()
+        try:
+            documents = await asyncio.to_thread(
+                fetch_figma_nodes,
+                file_key,
+                node_ids,
+                figma_client,
+                cache=figma_cache,
+                stream=stream_json,
+                version=version,
+            )
+        except SystemExit:
+            documents = None
+        return documents, time.perf_counter() - started_at
+
+
+async def _process_frame(
+    job: FrameJob,
+    fetch_task: "asyncio.Task[tuple[dict[str, dict | None] | None, float]]",
+    analyze: Callable[..., str],
+    analyze_semaphore: "asyncio.Semaphore",
+    simplify_executor: ThreadPoolExecutor,
+    stream_json: bool,
+    stream_report: bool,
+) -> dict[str, Any]:
+    """
+    1フレーム分の取得 → 軽量化 → 分析 → 保存 を実行
+
+    ノードは fetch_task（同じファイルのフレームをまとめたバッチ）の完了を待って受け取る。
+    各ステージはセマフォで同時実行数を制限し、ブロッキング処理はスレッドで実行する。
+    既存の関数は失敗時に SystemExit を送出するため、フレーム単位で捕捉して結果に記録する。
+
+    Returns:
+        dict[str, Any]: フレームごとの処理結果（status, error, seconds, ステージごとの timings を含む）
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    started_at = time.perf_counter()
+    result: dict[str, Any] = {**job._asdict(), "status": "ok", "error": None}
+    # ステージごとの処理時間（セマフォの待ち時間は含めない）
+    timings: dict[str, float] = {}
+
+    try:
+        documents, fetch_seconds = await fetch_task
+        timings["fetch"] = round(fetch_seconds, 3)
+        if documents is None:
+            raise SystemExit(1)
+        figma_node = documents.get(job.node_id)
+        if not figma_node:
+            print(
+                f"エラー: 指定されたノード (node_id: {job.node_id}) のdocumentを取得できませんでした"
+            )
+            raise SystemExit(1)
+
+        # ストリーミング時は取得と同時に軽量化済み
+        if stream_json:
+            simplified_data = figma_node
+        else:
+            stage_started_at = time.perf_counter()
+            simplified_data = await loop.run_in_executor(
+                simplify_executor, simplify_node_data, figma_node
+            )
+            timings["simplify"] = round(time.perf_counter() - stage_started_at, 3)
+
+        async with analyze_semaphore:
+            stage_started_at = time.perf_counter()
+            if stream_report:
+                await asyncio.to_thread(
+                    _analyze_streaming_to_file,
+                    analyze,
+                    simplified_data,
+                    job.output_path,
+                )
+            else:
+                report_markdown = await asyncio.to_thread(analyze, simplified_data)
+                await asyncio.to_thread(write_report, job.output_path, report_markdown)
+            timings["analyze"] = round(time.perf_counter() - stage_started_at, 3)
+
+    except SystemExit:
+        result["status"] = "error"
+        result["error"] = "処理中にエラーが発生しました（詳細はログを参照）"
+
+    result["seconds"] = round(time.perf_counter() - started_at, 3)
+    result["timings"] = timings
+    return result
+
+
+async def run_pipeline(
+    jobs: list[FrameJob],
+    figma_client: FigmaClient,
+    analyze: Callable[..., str],
+    figma_cache: DiskCache | None = None,
+    fetch_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+    simplify_concurrency: int = DEFAULT_SIMPLIFY_CONCURRENCY,
+    analyze_concurrency: int = DEFAULT_ANALYZE_CONCURRENCY,
+    stream_json: bool = False,
+    stream_report: bool = False,
+) -> list[dict[str, Any]]:
+    """
+    複数フレームを asyncio で並行に処理するパイプライン
+
+    Figmaの取得とGeminiの分析をステージごとの同時実行数の範囲で重ねて実行し、
+    フレームの処理が終わり次第レポートファイルを書き出す。
+    取得は file_key ごとにまとめた fetch_figma_nodes のバッチで行い、
+    キャッシュ使用時のファイルのバージョン確認はファイルごとに1回だけ行う。
+
+    Args:
+        jobs: 処理対象のフレームのリスト
+        figma_client: Figma APIクライアント
+        analyze: 軽量化済みデザインデータからレポートを生成する関数
+        figma_cache: ノードデータのキャッシュ
+        fetch_concurrency: Figma取得の同時実行数
+        simplify_concurrency: 軽量化の同時実行数
+        analyze_concurrency: Gemini分析の同時実行数
+        stream_json: Figmaのレスポンスを逐次パースして軽量化するかどうか
+        stream_report: 分析結果を生成されたそばからレポートファイルに書き込むかどうか
+
+    Returns:
+        list[dict[str, Any]]: 完了順のフレームごとの処理結果
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    # asyncio.to_thread のスレッド数がステージの同時実行数を下回らないようにする
+    loop.set_default_executor(
+        ThreadPoolExecutor(max_workers=fetch_concurrency + analyze_concurrency + 1)
+    )
+    fetch_semaphore = asyncio.Semaphore(fetch_concurrency)
+    analyze_semaphore = asyncio.Semaphore(analyze_concurrency)
+
+    # file_key ごとのノードID（重複を除き、マニフェストの順序を維持）
+    node_ids_by_file: dict[str, dict[str, None]] = {}
+    for job in jobs:
+        node_ids_by_file.setdefault(job.file_key, {})[job.node_id] = None
+
+    fetch_tasks = {}
+    for file_key, node_ids in node_ids_by_file.items():
+        version_task = None
+        if figma_cache is not None:
+            version_task = asyncio.create_task(
+                _fetch_file_version(file_key, figma_client, fetch_semaphore)
+            )
+        for batch in _chunk_node_ids(
+            list(node_ids), FIGMA_NODES_BATCH_SIZE, FIGMA_MAX_IDS_LENGTH
+        ):
+            fetch_task = asyncio.create_task(
+                _fetch_node_batch(
+                    file_key,
+                    batch,
+                    figma_client,
+                    figma_cache,
+                    version_task,
+                    fetch_semaphore,
+                    stream_json,
+                )
+            )
+            for node_id in batch:
+                fetch_tasks[file_key, node_id] = fetch_task
+
+    results = []
+    with ThreadPoolExecutor(max_workers=simplify_concurrency) as simplify_executor:
+        tasks = [
+            _process_frame(
+                job,
+                fetch_tasks[job.file_key, job.node_id],
+                analyze,
+                analyze_semaphore,
+                simplify_executor,
+                stream_json,
+                stream_report,
+            )
+            for job in jobs
+        ]
+        for completed in asyncio.as_completed(tasks):
+            result = await completed
+            results.append(result)
+            mark = "✓" if result["status"] == "ok" else "✗"
+            print(
+                f"{mark} [{len(results)}/{len(jobs)}] {result['node_id']} "
+                f"({result['seconds']:.1f}秒) → {result['output_path']}"
+            )
+
+    return results
+
+
+# 数値として受け付ける型（bool は int のサブクラスだが数値として扱わない）
+_NUMBER_TYPES = (int, float)
+
+# サーバーが受け付けるノードのキーと、値に求める型
+NODE_FIELD_TYPES: dict[str, type | tuple[type, ...]] = {
+    "id": str,
+    "name": str,
+    "type": str,
+    "characters": str,
+    "children": list,
+    "absoluteBoundingBox": dict,
+    "fills": list,
+    "style": dict,
+}
+# ノードのオブジェクト型のキーについて、その中のキーと値に求める型
+NODE_OBJECT_FIELD_TYPES: dict[str, dict[str, type | tuple[type, ...]]] = {
+    "absoluteBoundingBox": {
+        "x": _NUMBER_TYPES,
+        "y": _NUMBER_TYPES,
+        "width": _NUMBER_TYPES,
+        "height": _NUMBER_TYPES,
+    },
+    "style": {
+        "fontFamily": str,
+        "fontWeight": _NUMBER_TYPES,
+        "fontSize": _NUMBER_TYPES,
+        "letterSpacing": _NUMBER_TYPES,
+        "lineHeightPx": _NUMBER_TYPES,
+    },
+}
+# fills の各要素と、その color のキーと値に求める型
+PAINT_FIELD_TYPES: dict[str, type | tuple[type, ...]] = {
+    "type": str,
+    "opacity": _NUMBER_TYPES,
+    "color": dict,
+}
+COLOR_FIELD_TYPES: dict[str, type | tuple[type, ...]] = {
+    "r": _NUMBER_TYPES,
+    "g": _NUMBER_TYPES,
+    "b": _NUMBER_TYPES,
+    "a": _NUMBER_TYPES,
+}
+# エラーメッセージに表示する型の名前
+_FIELD_TYPE_NAMES = {
+    str: "文字列",
+    list: "配列",
+    dict: "オブジェクト",
+    _NUMBER_TYPES: "数値",
+}
+
+
+def _validate_fields(
+    value: dict[str, Any],
+    field_types: dict[str, type | tuple[type, ...]],
+    path: str,
+) -> None:
+    # None（null）は未指定として扱い、数値は bool と NaN・無限大を受け付けない
+    for field, expected in field_types.items():
+        item = value.get(field)
+        if item is None:
+            continue
+        if expected is _NUMBER_TYPES:
+            valid = (
+                isinstance(item, _NUMBER_TYPES)
+                and not isinstance(item, bool)
+                and math.isfinite(item)
+            )
+        else:
+            valid = isinstance(item, expected)
+        if not valid:
+            raise ValueError(
+                f"{path}.{field} は{_FIELD_TYPE_NAMES[expected]}で指定してください"
+            )
+
+
+def validate_node_tree(node: Any, key: str) -> None:
+    """
+    リクエストで受け取ったノードツリーの形と値の型を検査（深いツリーでも再帰しない）
+
+    Args:
+        node: 検査するノード
+        key: エラーメッセージに表示するリクエストのキー（パスの先頭）
+
+    Raises:
+        ValueError: ノードがオブジェクトでない場合、または値の型が NODE_FIELD_TYPES・
+            NODE_OBJECT_FIELD_TYPES・PAINT_FIELD_TYPES・COLOR_FIELD_TYPES と異なる場合
+            （メッセージには design.children[0].style.fontSize のようなパスを含む）
+    """
+    # (ノード, リクエスト内のパス) のスタック
+    stack: list[tuple[Any, str]] = [(node, key)]
+    while stack:
+        current, path = stack.pop()
+        if not isinstance(current, dict):
+            raise ValueError(f"{path} はオブジェクトで指定してください")
+        _validate_fields(current, NODE_FIELD_TYPES, path)
+        for field, field_types in NODE_OBJECT_FIELD_TYPES.items():
+            if current.get(field) is not None:
+                _validate_fields(current[field], field_types, f"{path}.{field}")
+        for i, paint in enumerate(current.get("fills") or []):
+            paint_path = f"{path}.fills[{i}]"
+            if not isinstance(paint, dict):
+                raise ValueError(f"{paint_path} はオブジェクトで指定してください")
+            _validate_fields(paint, PAINT_FIELD_TYPES, paint_path)
+            if paint.get("color") is not None:
+                _validate_fields(
+                    paint["color"], COLOR_FIELD_TYPES, f"{paint_path}.color"
+                )
+        stack.extend(
+            (child, f"{path}.children[{i}]")
+            for i, child in enumerate(current.get("children") or [])
+        )
+
+
+class AnalysisService:
+    """
+    サーバーモードで使い回すクライアントとキャッシュをまとめたもの
+
+    FigmaClient・分析器・キャッシュは起動時に1回だけ作成し、全リクエストで共有する。
+    """
+
+    def __init__(
+        self,
+        figma_client: FigmaClient,
+        analyze: Callable[..., str],
+        figma_cache: DiskCache | None = None,
+        gemini_cache: DiskCache | None = None,
+        stream_json: bool = False,
+    ):
+        """
+        Args:
+            figma_client: Figma APIクライアント
+            analyze: 軽量化済みデザインデータからレポートを生成する関数
+            figma_cache: ノードデータのキャッシュ
+            gemini_cache: 分析結果のキャッシュ（統計の表示用）
+            stream_json: Figmaのレスポンスを逐次パースして軽量化するかどうか
+        """
+        self.figma_client = figma_client
+        self.analyze = analyze
+        self.figma_cache = figma_cache
+        self.gemini_cache = gemini_cache
+        self.stream_json = stream_json
+
+    def fetch(self, body: dict[str, Any]) -> dict[str, Any]:
+        """
+        リクエストの file_key と node_id のノードを取得
+
+        Raises:
+            ValueError: file_key または node_id の指定が不正な場合
+        """
+        file_key = body.get("file_key")
+        node_id = body.get("node_id")
+        if not isinstance(file_key, str) or not isinstance(node_id, str):
+            raise ValueError("file_key と node_id を文字列で指定してください")
+        return fetch_figma_data(
+            file_key, node_id, self.figma_client, self.figma_cache, self.stream_json
+        )
+
+    def simplified(self, body: dict[str, Any], key: str) -> dict[str, Any]:
+        """
+        リクエストに key のデザインデータがあればそれを、なければ取得して軽量化したものを返す
+
+        Raises:
+            ValueError: key のデザインデータの形式が不正な場合
+        """
+        if key in body:
+            validate_node_tree(body[key], key)
+            return body[key] if key == "design" else simplify_node_data(body[key])
+        node = self.fetch(body)
+        return node if self.stream_json else simplify_node_data(node)
+
+    def health(self) -> dict[str, Any]:
+        """
+        稼働状況と累計の統計
+        """
+        caches = {"figma": self.figma_cache, "gemini": self.gemini_cache}
+        return {
+            "status": "ok",
+            "figma": self.figma_client.stats,
+            "cache": {
+                name: {"hits": cache.hits, "misses": cache.misses}
+                for name, cache in caches.items()
+                if cache is not None
+            },
+        }
+
+
+def serve(
+    service: AnalysisService,
+    host: str = DEFAULT_SERVER_HOST,
+    port: int = DEFAULT_SERVER_PORT,
+    workers: int = DEFAULT_SERVER_WORKERS,
+) -> None:
+    """
+    AnalysisService をHTTPで提供する（Ctrl+C で終了）
+
+    リクエストは上限付きのスレッドプールで処理し、上限を超えた分は空きを待つ。
+
+    - GET /health: 稼働状況と統計
+    - POST /fetch {file_key, node_id}: 取得したノード（--stream-json 時は軽量化済み）
+    - POST /simplify {file_key, node_id} または {node}: 軽量化したデザインデータ
+    - POST /analyze {file_key, node_id} または {design}: 分析レポート（Markdown）
+
+    Args:
+        service: リクエストを処理するサービス
+        host: 待ち受けるホスト
+        port: 待ち受けるポート
+        workers: リクエストを同時に処理するスレッド数
+    """
+    # サーバーモードでしか使わないため、起動時間に影響しないよう遅延 import
+    import traceback
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    routes: dict[str, Callable[[dict[str, Any]], dict[str, Any]]] = {
+        "/fetch": lambda body: {"document": service.fetch(body)},
+        "/simplify": lambda body: {"design": service.simplified(body, "node")},
+        "/analyze": lambda body: {
+            "report": service.analyze(service.simplified(body, "design"))
+        },
+    }
+
+    # 接続はリクエストごとに閉じる（HTTP/1.0）。キープアライブの接続がワーカーを占有しないようにする
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self._send_json(200, service.health())
+            else:
+                self._send_json(404, {"error": f"見つかりません: {self.path}"})
+
+        def do_POST(self) -> None:
+            route = routes.get(self.path)
+            if route is None:
+                self._send_json(404, {"error": f"見つかりません: {self.path}"})
+                return
+
+            started_at = time.perf_counter()
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = loads_json(self.rfile.read(length) or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError(
+                        "リクエスト本文はJSONオブジェクトで指定してください"
+                    )
+                payload = route(body)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except SystemExit:
+                # 各処理は失敗時に SystemExit を送出する（詳細はサーバーのログに出力済み）
+                self._send_json(
+                    502,
+                    {
+                        "error": "処理中にエラーが発生しました（詳細はサーバーのログを参照）"
+                    },
+                )
+                return
+            except Exception:
+                # 想定外のエラーでも接続を切らずに応答し、詳細はサーバーのログに出力する
+                traceback.print_exc()
+                self._send_json(
+                    500,
+                    {
+                        "error": "サーバー内部でエラーが発生しました（詳細はサーバーのログを参照）"
+                    },
+                )
+                return
+
+            payload["seconds"] = round(time.perf_counter() - started_at, 3)
+            self._send_json(200, payload)
+
+        def _send_json(self, status: int, payload: dict[str, Any]) -> None:
+            data = dumps_json(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    class Server(HTTPServer):
+        def process_request(self, request: Any, client_address: Any) -> None:
+            executor.submit(self._process_in_worker, request, client_address)
+
+        def _process_in_worker(self, request: Any, client_address: Any) -> None:
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    with (
+        ThreadPoolExecutor(max_workers=workers) as executor,
+        Server((host, port), Handler) as server,
+    ):
+        print(
+            f"サーバーを起動しました: http://{host}:{server.server_port}（Ctrl+C で終了）"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nサーバーを停止します")
+
+
+def _display_width(text: str) -> int:
+    # 全角文字を2桁として数える
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+
+
+def format_metrics_table(record: dict[str, Any]) -> str:
+    """
+    計測結果をステージごとの表（テキスト）に整形
+
+    Args:
+        record: metrics_record で作成した計測結果
+
+    Returns:
+        str: ステージ・回数・時間・バイト数・ノード数・トークン数の表
+    """
+    header = (
+        "ステージ",
+        "回数",
+        "時間(秒)",
+        "バイト",
+        "ノード",
+        "入力トークン",
+        "出力トークン",
+    )
+    rows = [
+        (
+            name,
+            f"{totals['calls']:,}",
+            f"{totals['seconds']:.3f}",
+            f"{totals['bytes']:,}" if "bytes" in totals else "-",
+            f"{totals['nodes']:,}" if "nodes" in totals else "-",
+            f"{totals['prompt_tokens']:,}" if "prompt_tokens" in totals else "-",
+            f"{totals['output_tokens']:,}" if "output_tokens" in totals else "-",
+        )
+        for name, totals in record["stages"].items()
+    ]
+    widths = [
+        max(_display_width(row[i]) for row in [header, *rows])
+        for i in range(len(header))
+    ]
+    lines = []
+    for row in [header, *rows]:
+        cells = []
+        for i, (cell, width) in enumerate(zip(row, widths, strict=True)):
+            padding = " " * (width - _display_width(cell))
+            # ステージ名は左寄せ、数値は右寄せ
+            cells.append(cell + padding if i == 0 else padding + cell)
+        lines.append("  ".join(cells))
+    peak_rss = record["peak_rss_mb"]
+    lines.append(
+        f"全体 {record['seconds']:.3f}秒 / ピークメモリ "
+        f"{'-' if peak_rss is None else f'{peak_rss:,.1f}MB'}"
+    )
+    return "\n".join(lines)
+
+
+def metrics_record(status: str, seconds: float, **stats: Any) -> dict[str, Any]:
+    """
+    実行全体の計測結果（ステージごとの集計・ピークメモリ・統計）をまとめる
+
+    Args:
+        status: 実行結果（ok / error）
+        seconds: 全体の処理時間（秒）
+        **stats: あわせて記録する統計（Figma APIのリトライ統計など）
+
+    Returns:
+        dict[str, Any]: 1実行分の計測結果
+    """
+    return {
+        "finished_at": datetime.datetime.now()
+        .astimezone()
+        .isoformat(timespec="seconds"),
+        "status": status,
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stage_metrics.snapshot(),
+        **stats,
+    }
+
+
+def write_metrics(path: str, record: dict[str, Any]) -> None:
+    """
+    計測結果をJSON Lines形式で追記（1実行につき1行）
+
+    Args:
+        path: 出力先のパス
+        record: metrics_record で作成した計測結果
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _print_retry_stats(figma_client: FigmaClient) -> None:
+    """
+    リトライが発生した場合にFigma APIのリトライ統計を表示
+    """
+    stats = figma_client.stats
+    if stats["retries"]:
+        print(
+            f"リトライ: {stats['retries']}回 (429: {stats['rate_limited']}回, "
+            f"レート制限による待機: {stats['throttled_seconds']:.1f}秒, "
+            f"バックオフ: {stats['backoff_seconds']:.1f}秒)"
+        )
+
+
+def _print_token_usage(usage: TokenUsage) -> None:
+    """
+    LLM のトークン使用量の合計を表示（呼び出しがなかった場合は省略）
+    """
+    stats = usage.stats
+    if not stats["calls"]:
+        return
+    prompt_tokens = stats["prompt_tokens"]
+    cached_tokens = stats["cached_tokens"]
+    cached_ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+    print(
+        f"トークン使用量の合計 ({stats['calls']}回): 入力 {prompt_tokens:,} "
+        f"(キャッシュ {cached_tokens:,} / {cached_ratio:.0%}, "
+        f"キャッシュなし {prompt_tokens - cached_tokens:,}) / 出力 {stats['output_tokens']:,}"
+    )
+
+
+def _print_cache_stats(**caches: DiskCache | None) -> None:
+    """
+    キャッシュのヒット・ミス数を表示（参照がなかったキャッシュは省略）
+    """
+    for name, cache in caches.items():
+        if cache is not None and cache.hits + cache.misses:
+            print(f"{name} キャッシュ: ヒット {cache.hits}件 / ミス {cache.misses}件")
+
+
+def main():
+    """
+    メイン実行処理
+    """
+    parser = argparse.ArgumentParser(description="Figma UI/UX Analysis Tool")
+    parser.add_argument("--file-key", help="Figma File Key")
+    parser.add_argument(
+        "--node-id",
+        help="Node ID（カンマ区切りで複数指定するとパイプラインモードで並行処理）",
+    )
+    parser.add_argument(
+        "--manifest",
+        help="分析するフレームの一覧（file_key, node_id, 任意で output_path）のCSVまたはJSONL。"
+        "指定した場合は1プロセスのパイプラインモードでまとめて処理",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="HTTPサーバーとして常駐し、POST /fetch・/simplify・/analyze を受け付ける",
+    )
+    parser.add_argument(
+        "--host",
+        default=DEFAULT_SERVER_HOST,
+        help=f"サーバーモードの待ち受けホスト（デフォルト: {DEFAULT_SERVER_HOST}）",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_SERVER_PORT,
+        help=f"サーバーモードの待ち受けポート（デフォルト: {DEFAULT_SERVER_PORT}）",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_SERVER_WORKERS,
+        help=f"サーバーモードでリクエストを同時に処理するスレッド数（デフォルト: {DEFAULT_SERVER_WORKERS}）",
+    )
+    parser.add_argument(
+        "--summary",
+        help="パイプラインモードの処理結果（フレームごとの状態・処理時間）のJSONの出力先"
+        f"（--manifest 指定時のデフォルト: {DEFAULT_OUTPUT_DIR}/summary.json）",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="ステージごとの処理時間・バイト数・ノード数・トークン数とピークメモリを"
+        "JSON Lines形式で追記するファイル（1実行につき1行）",
+    )
+    parser.add_argument(
+        "--metrics-table",
+        action="store_true",
+        help="実行終了時にステージごとの計測結果を表で表示",
+    )
     parser.add_argument(
         "--check", action="store_true", help="構文チェックのみを実行（CI用）"
     )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT[1],
+        help=f"Figma APIの読み込みタイムアウト秒数（デフォルト: {DEFAULT_TIMEOUT[1]:g}）",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=DEFAULT_POOL_SIZE,
+        help=f"Figma APIの接続プールサイズ（デフォルト: {DEFAULT_POOL_SIZE}）",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help=f"429/5xx時のリトライ回数の上限（デフォルト: {DEFAULT_MAX_RETRIES}）",
+    )
+    parser.add_argument(
+        "--max-retry-after",
+        type=float,
+        default=DEFAULT_MAX_RETRY_AFTER_SECONDS,
+        help="429 の Retry-After に従って待機する最大秒数。超える場合は待たずに失敗"
+        f"（デフォルト: {DEFAULT_MAX_RETRY_AFTER_SECONDS:g}）",
+    )
+    parser.add_argument(
+        "--figma-base-url",
+        help="Figma APIのベースURL（モックサーバーを使う場合など。"
+        f"デフォルト: 環境変数 FIGMA_API_BASE_URL または {FIGMA_API_BASE_URL}）",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=DEFAULT_RATE_LIMIT,
+        help=f"Figma APIへの1秒あたりの最大リクエスト数、0で無効（デフォルト: {DEFAULT_RATE_LIMIT:g}）",
+    )
+    parser.add_argument(
+        "--stream-json",
+        action="store_true",
+        help="Figmaのレスポンスを逐次パースして軽量化（大きなノード向け、ijson が必要）",
+    )
+    parser.add_argument(
+        "--prompt-format",
+        choices=PROMPT_FORMATS,
+        default="json",
+        help="プロンプトに埋め込むデザインデータの形式。compact は空白なし・短縮キー・"
+        "bboxを配列・色を16進数にしてトークン数を削減（デフォルト: json）",
+    )
+    parser.add_argument(
+        "--llm",
+        choices=LLM_BACKENDS,
+        default="gemini",
+        help="分析に使うLLMのバックエンド。fake はAPIを呼び出さない決定的なフェイク"
+        "（スループットの計測・オフラインの試験用、デフォルト: gemini）",
+    )
+    parser.add_argument(
+        "--fake-latency",
+        type=float,
+        default=DEFAULT_FAKE_LATENCY_SECONDS,
+        help=f"--llm fake の最初の出力までの秒数（デフォルト: {DEFAULT_FAKE_LATENCY_SECONDS:g}）",
+    )
+    parser.add_argument(
+        "--fake-output-tokens",
+        type=int,
+        default=DEFAULT_FAKE_OUTPUT_TOKENS,
+        help=f"--llm fake が生成するレポートの推定トークン数（デフォルト: {DEFAULT_FAKE_OUTPUT_TOKENS}）",
+    )
+    parser.add_argument(
+        "--fake-tokens-per-second",
+        type=float,
+        default=0,
+        help="--llm fake の1秒あたりの出力トークン数、0で待たずに出力（デフォルト: 0）",
+    )
+    parser.add_argument(
+        "--model",
+        default=GEMINI_MODEL_NAME,
+        help=f"分析に使用するGeminiのモデル名（デフォルト: {GEMINI_MODEL_NAME}）",
+    )
+    parser.add_argument(
+        "--temperature",
+        type=float,
+        default=GEMINI_GENERATION_CONFIG["temperature"],
+        help=f"Geminiの生成時の temperature（デフォルト: {GEMINI_GENERATION_CONFIG['temperature']}）",
+    )
+    parser.add_argument(
+        "--max-output-tokens",
+        type=int,
+        default=0,
+        help="Geminiの出力トークン数の上限、0でモデルの既定値（デフォルト: 0）",
+    )
+    parser.add_argument(
+        "--stream-report",
+        action="store_true",
+        help="Geminiの出力を生成されたそばからレポートファイルに書き込む",
+    )
+    parser.add_argument(
+        "--echo-report",
+        action="store_true",
+        help="--stream-report 時にレポートを標準出力にも表示（単一フレームのみ）",
+    )
+    parser.add_argument(
+        "--no-local-rules",
+        action="store_true",
+        help="コントラスト比・フォントサイズ・タッチターゲットのローカル検査を行わず、すべてGeminiに任せる",
+    )
+    parser.add_argument(
+        "--context-cache",
+        action="store_true",
+        help="システム指示と分析の指示をGeminiのコンテキストキャッシュに登録して、各分析で再利用する"
+        "（モデルの最小トークン数に満たない場合はキャッシュなしで続行）",
+    )
+    parser.add_argument(
+        "--context-cache-ttl-minutes",
+        type=float,
+        default=DEFAULT_CONTEXT_CACHE_TTL_MINUTES,
+        help="コンテキストキャッシュの有効期限（分）。処理中は期限前に自動で延長し、終了時に削除"
+        f"（デフォルト: {DEFAULT_CONTEXT_CACHE_TTL_MINUTES}）",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        help="1回のGemini分析に含めるデザインデータの推定トークン数の上限。超える場合は子フレーム単位で"
+        f"分割して並行に分析、0で無効（デフォルト: {DEFAULT_TOKEN_BUDGET}）",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=DEFAULT_OUTPUT_DIR,
+        help=f"パイプラインモードのレポート出力先（デフォルト: {DEFAULT_OUTPUT_DIR}）",
+    )
+    parser.add_argument(
+        "--fetch-concurrency",
+        type=int,
+        default=DEFAULT_FETCH_CONCURRENCY,
+        help=f"パイプラインモードのFigma取得の同時実行数（デフォルト: {DEFAULT_FETCH_CONCURRENCY}）",
+    )
+    parser.add_argument(
+        "--analyze-concurrency",
+        type=int,
+        default=DEFAULT_ANALYZE_CONCURRENCY,
+        help=f"Gemini分析の同時実行数（パイプラインモードのフレーム・分割したチャンクごと）（デフォルト: {DEFAULT_ANALYZE_CONCURRENCY}）",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Figmaレスポンス・Gemini分析結果のキャッシュ保存先（デフォルト: {DEFAULT_CACHE_DIR}）",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=f"キャッシュの種類ごとの最大容量MB（デフォルト: {DEFAULT_CACHE_MAX_MB}）",
+    )
+    parser.add_argument(
+        "--gemini-cache-ttl-hours",
+        type=float,
+        default=DEFAULT_GEMINI_CACHE_TTL_HOURS,
+        help=f"Gemini分析結果のキャッシュの有効期限（時間）（デフォルト: {DEFAULT_GEMINI_CACHE_TTL_HOURS}）",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Figmaレスポンス・Gemini分析結果のキャッシュを使用しない",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="キャッシュを削除して終了（--file-key 指定時はそのファイルのFigmaキャッシュのみ）",
+    )
     args = parser.parse_args()
+    run_started_at = time.perf_counter()
 
     # 構文チェックモード（CI用）
     if args.check:
         print("構文チェック完了")
         return
 
+    # キャッシュ削除モード
+    if args.clear_cache:
+        cache_dir = Path(args.cache_dir)
+        removed = DiskCache(str(cache_dir / "figma"), 0).clear(args.file_key)
+        if not args.file_key:
+            removed += DiskCache(str(cache_dir / "gemini"), 0).clear()
+        print(f"キャッシュを削除しました ({removed}件)")
+        return
+
+    figma_cache = None
+    gemini_cache = None
+    if not args.no_cache:
+        cache_max_bytes = args.cache_max_mb * 1024 * 1024
+        # サーバーモードではリクエスト間でメモリ上のキャッシュも共有する
+        cache_class = MemoryCache if args.serve else DiskCache
+        figma_cache = cache_class(str(Path(args.cache_dir) / "figma"), cache_max_bytes)
+        gemini_cache = cache_class(
+            str(Path(args.cache_dir) / "gemini"),
+            cache_max_bytes,
+            ttl_seconds=args.gemini_cache_ttl_hours * 3600,
+        )
+
     print("=== Figma UI/UX Analysis Tool ===\n")
 
     # Step 1: 環境変数の読み込み
-    figma_token, gemini_key = load_env_vars()
+    figma_token, gemini_key = load_env_vars(require_gemini=args.llm == "gemini")
     print("環境変数の読み込みが完了しました\n")
 
-    # コマンドライン引数、環境変数、またはユーザー入力からfile_keyとnode_idを取得
-    file_key = args.file_key or os.getenv("FIGMA_FILE_KEY")
-    node_id = args.node_id or os.getenv("FIGMA_NODE_ID")
+    if args.manifest:
+        # マニフェストのフレームをまとめてパイプラインモードで処理
+        jobs = load_manifest(args.manifest, args.output_dir)
+        file_key = node_id = ""
+        print(f"マニフェストから {len(jobs)}フレームを読み込みました ({args.manifest})")
+    elif args.serve:
+        # 分析するフレームはリクエストごとに指定される
+        jobs = []
+        file_key = node_id = ""
+    else:
+        # コマンドライン引数、環境変数、またはユーザー入力からfile_keyとnode_idを取得
+        file_key = args.file_key or os.getenv("FIGMA_FILE_KEY")
+        node_id = args.node_id or os.getenv("FIGMA_NODE_ID")
 
-    # コマンドライン引数や環境変数が設定されていない場合はユーザー入力を求める
-    if not file_key and sys.stdin.isatty():
-        file_key = input("Figma File Key を入力してください: ").strip()
-    if not node_id and sys.stdin.isatty():
-        node_id = input("Node ID を入力してください: ").strip()
+        # コマンドライン引数や環境変数が設定されていない場合はユーザー入力を求める
+        if not file_key and sys.stdin.isatty():
+            file_key = input("Figma File Key を入力してください: ").strip()
+        if not node_id and sys.stdin.isatty():
+            node_id = input("Node ID を入力してください: ").strip()
 
-    if not file_key or not node_id:
-        print("エラー: file_keyとnode_idを入力してください")
-        print("使用方法: python main.py --file-key <KEY> --node-id <ID>")
-        print("または環境変数 FIGMA_FILE_KEY と FIGMA_NODE_ID を設定してください")
-        raise SystemExit(1)
+        if not file_key or not node_id:
+            print("エラー: file_keyとnode_idを入力してください")
+            print("使用方法: python main.py --file-key <KEY> --node-id <ID>")
+            print("または環境変数 FIGMA_FILE_KEY と FIGMA_NODE_ID を設定してください")
+            print("複数のフレームは --manifest <CSV/JSONL> でまとめて指定できます")
+            raise SystemExit(1)
+
+        # 複数ノード指定時はパイプラインモードで並行処理
+        node_ids = [n.strip() for n in node_id.split(",") if n.strip()]
+        jobs = []
+        if len(node_ids) > 1:
+            jobs = [
+                FrameJob(file_key, n, report_path_for(n, args.output_dir))
+                for n in node_ids
+            ]
 
     print()
 
     # Step 2: Figmaデータの取得
-    figma_node = fetch_figma_data(file_key, node_id, figma_token)
-    print()
+    figma_client = FigmaClient(
+        figma_token,
+        pool_size=args.pool_size,
+        timeout=(DEFAULT_TIMEOUT[0], args.timeout),
+        max_retries=args.max_retries,
+        max_retry_after=args.max_retry_after,
+        rate_limit=args.rate_limit,
+        base_url=(
+            args.figma_base_url or os.getenv("FIGMA_API_BASE_URL") or FIGMA_API_BASE_URL
+        ),
+    )
+    if figma_client.base_url != FIGMA_API_BASE_URL:
+        print(f"Figma APIのベースURL: {figma_client.base_url}")
 
-    # Step 3: データの軽量化
-    print("デザインデータを軽量化中...")
-    simplified_data = simplify_node_data(figma_node)
-    print("軽量化完了 (元のキー数から必要な情報のみを抽出)\n")
+    generation_config = {"temperature": args.temperature}
+    if args.max_output_tokens:
+        generation_config["max_output_tokens"] = args.max_output_tokens
+    backend: LLMBackend
+    if args.llm == "fake":
+        backend = FakeBackend(
+            latency=args.fake_latency,
+            output_tokens=args.fake_output_tokens,
+            tokens_per_second=args.fake_tokens_per_second,
+        )
+    else:
+        backend = GeminiBackend(
+            gemini_key,
+            model_name=args.model,
+            generation_config=generation_config,
+            context_cache_ttl_seconds=(
+                args.context_cache_ttl_minutes * 60 if args.context_cache else None
+            ),
+        )
+    analyzer = DesignAnalyzer(
+        backend,
+        prompt_format=args.prompt_format,
+        cache=gemini_cache,
+        local_rules=not args.no_local_rules,
+    )
 
-    # Step 4: Gemini AIによる分析
-    report_markdown = analyze_design_with_gemini(simplified_data, gemini_key)
-    print()
+    analyze: Callable[..., str] = analyzer
+    if args.token_budget > 0:
+        analyze = functools.partial(
+            analyze_design_in_chunks,
+            analyze=analyze,
+            prompt_format=args.prompt_format,
+            token_budget=args.token_budget,
+            concurrency=args.analyze_concurrency,
+            # パイプラインの各フレームのチャンクで共有し、LLMの同時呼び出し数を抑える
+            limit=threading.Semaphore(args.analyze_concurrency),
+            count=backend.count_tokens,
+        )
+
+    run_status = "ok"
+    try:
+        if args.serve:
+            service = AnalysisService(
+                figma_client, analyze, figma_cache, gemini_cache, args.stream_json
+            )
+            with figma_client, analyzer:
+                serve(service, args.host, args.port, args.workers)
+            _print_retry_stats(figma_client)
+            _print_cache_stats(Figma=figma_cache, Gemini=gemini_cache)
+            _print_token_usage(analyzer.usage)
+            return
+
+        if jobs:
+            print(f"パイプラインモード: {len(jobs)}フレームを並行処理します\n")
+            started_at = time.perf_counter()
+            with figma_client, analyzer:
+                import asyncio
+
+                results = asyncio.run(
+                    run_pipeline(
+                        jobs,
+                        figma_client,
+                        analyze,
+                        figma_cache,
+                        fetch_concurrency=args.fetch_concurrency,
+                        analyze_concurrency=args.analyze_concurrency,
+                        stream_json=args.stream_json,
+                        stream_report=args.stream_report,
+                    )
+                )
+            _print_retry_stats(figma_client)
+            _print_cache_stats(Figma=figma_cache, Gemini=gemini_cache)
+            _print_token_usage(analyzer.usage)
+
+            summary_path = args.summary or (
+                str(Path(args.output_dir) / "summary.json") if args.manifest else None
+            )
+            if summary_path:
+                write_summary(
+                    summary_path,
+                    jobs,
+                    results,
+                    time.perf_counter() - started_at,
+                    manifest=args.manifest,
+                    figma=figma_client.stats,
+                    gemini=analyzer.usage.stats,
+                )
 
-    # Step 5: レポートをファイルに保存
-    output_filename = "report.md"
-    with open(output_filename, "w", encoding="utf-8") as f:
-        f.write(report_markdown)
+            failed = [r for r in results if r["status"] != "ok"]
+            print(
+                f"\n✓ {len(results) - len(failed)}/{len(results)} フレームのレポート作成が完了しました"
+            )
+            print(f"  出力先: {args.output_dir}")
+            if summary_path:
+                print(f"  処理結果: {summary_path}")
+            if failed:
+                raise SystemExit(1)
+            return
+
+        with figma_client:
+            figma_node = fetch_figma_data(
+                file_key, node_id, figma_client, figma_cache, stream=args.stream_json
+            )
+        _print_retry_stats(figma_client)
+        print()
 
-    print("✓ レポート作成が完了しました")
-    print(f"  ファイル名: {output_filename}")
+        # Step 3: データの軽量化（ストリーミング時は取得と同時に実施済み）
+        if args.stream_json:
+            simplified_data = figma_node
+        else:
+            print("デザインデータを軽量化中...")
+            simplified_data = simplify_node_data(figma_node)
+            print("軽量化完了 (元のキー数から必要な情報のみを抽出)\n")
+
+        output_filename = "report.md"
+
+        # Step 4, 5: Gemini AIによる分析とレポートの保存
+        with analyzer:
+            if args.stream_report:
+                # 生成された部分から順にレポートファイルへ書き込む
+                with open(output_filename, "w", encoding="utf-8") as f:
+                    analyze(simplified_data, output=f, echo=args.echo_report)
+            else:
+                report_markdown = analyze(simplified_data)
+                write_report(output_filename, report_markdown)
+        print()
+        _print_cache_stats(Figma=figma_cache, Gemini=gemini_cache)
+        _print_token_usage(analyzer.usage)
+
+        print("✓ レポート作成が完了しました")
+        print(f"  ファイル名: {output_filename}")
+    except BaseException:
+        run_status = "error"
+        raise
+    finally:
+        if args.metrics or args.metrics_table:
+            record = metrics_record(
+                run_status,
+                time.perf_counter() - run_started_at,
+                figma=figma_client.stats,
+                gemini=analyzer.usage.stats,
+            )
+            if args.metrics:
+                write_metrics(args.metrics, record)
+            if args.metrics_table:
+                print(f"\n{format_metrics_table(record)}")
 
 
 if __name__ == "__main__":
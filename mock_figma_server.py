@@ -0,0 +1,335 @@
+"""
+Figma API のモックサーバー
+/v1/files/{file_key}/nodes と /v1/files/{file_key} に保存済みまたは合成したレスポンスを返し、
+遅延・429・5xx を注入して、ネットワークなしでバッチ処理のスループット・リトライ・キャッシュを試験する
+"""
+
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+from benchmark import generate_figma_tree
+from main import dumps_json, loads_json
+
+# 5xx を注入するときに返すステータスコード
+SERVER_ERROR_STATUSES = (500, 502, 503)
+
+
+class FigmaMock:
+    """
+    モックサーバーの設定・レスポンス・統計（複数スレッドから参照される）
+
+    responses_dir を指定した場合は {file_key}.json に保存した /nodes のレスポンスから、
+    指定しない場合は node_id ごとに決まった合成ツリーから document を返す。
+    """
+
+    def __init__(
+        self,
+        responses_dir: str | None = None,
+        nodes: int = 1000,
+        fanout: int = 8,
+        text_ratio: float = 0.3,
+        instance_ratio: float = 0.1,
+        version: str = "1",
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_429_rate: float = 0.0,
+        error_5xx_rate: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            responses_dir: 保存済みレスポンスのディレクトリ（None の場合は合成する）
+            nodes: 合成する document 1つあたりのノード数
+            fanout: 合成ツリーの1ノードあたりの最大子要素数
+            text_ratio: 合成ツリーの TEXT ノードの割合
+            instance_ratio: 合成ツリーの同じ構造のインスタンスの割合
+            version: レスポンスに含めるファイルのバージョン
+            latency_ms: レスポンスまでの遅延（ミリ秒）
+            jitter_ms: 遅延に加える 0〜jitter_ms の一様乱数（ミリ秒）
+            error_429_rate: 429 を返す確率
+            error_5xx_rate: 5xx を返す確率
+            retry_after: 429 の Retry-After（秒）
+            seed: 遅延・エラーの乱数シード
+        """
+        self.responses_dir = Path(responses_dir) if responses_dir else None
+        self.nodes = nodes
+        self.fanout = fanout
+        self.text_ratio = text_ratio
+        self.instance_ratio = instance_ratio
+        self.version = version
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_429_rate = error_429_rate
+        self.error_5xx_rate = error_5xx_rate
+        self.retry_after = retry_after
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "404": 0}
+        self.last_modified = (
+            datetime.datetime.now().astimezone().isoformat(timespec="seconds")
+        )
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # 読み込んだ保存済みレスポンスと、エンコード済みの nodes の値
+        self._recorded_responses: dict[str, dict[str, Any] | None] = {}
+        self._entries: dict[tuple[str, str], bytes] = {}
+
+    def record(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def delay(self) -> float:
+        """
+        このリクエストの遅延（秒）
+        """
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms)
+        return (self.latency_ms + jitter) / 1000
+
+    def fault(self) -> int | None:
+        """
+        このリクエストに注入するエラーのステータスコード（注入しない場合は None）
+        """
+        with self._lock:
+            roll = self._rng.random()
+            if roll < self.error_429_rate:
+                return 429
+            if roll < self.error_429_rate + self.error_5xx_rate:
+                return self._rng.choice(SERVER_ERROR_STATUSES)
+        return None
+
+    def _recorded(self, file_key: str) -> dict[str, Any] | None:
+        with self._lock:
+            if file_key in self._recorded_responses:
+                return self._recorded_responses[file_key]
+        path = self.responses_dir / f"{file_key}.json"
+        recorded = None
+        if path.is_file():
+            # 深いツリーを保存したレスポンスも読めるよう、再帰しないデコードを使う
+            with open(path, encoding="utf-8") as f:
+                recorded = loads_json(f.read())
+        with self._lock:
+            self._recorded_responses[file_key] = recorded
+        return recorded
+
+    def entry(self, file_key: str, node_id: str) -> bytes:
+        """
+        nodes[node_id] に入れる値をエンコードしたJSON（存在しないノードは null）
+
+        同じノードは同じバイト列を返すため、リクエストごとにシリアライズし直さない。
+        """
+        with self._lock:
+            encoded = self._entries.get((file_key, node_id))
+        if encoded is None:
+            encoded = self._build_entry(file_key, node_id)
+            with self._lock:
+                self._entries[(file_key, node_id)] = encoded
+        return encoded
+
+    def _build_entry(self, file_key: str, node_id: str) -> bytes:
+        if self.responses_dir is not None:
+            recorded = self._recorded(file_key)
+            entry = ((recorded or {}).get("nodes") or {}).get(node_id)
+        else:
+            document = generate_figma_tree(
+                self.nodes,
+                fanout=self.fanout,
+                text_ratio=self.text_ratio,
+                instance_ratio=self.instance_ratio,
+                seed=zlib.crc32(f"{file_key}/{node_id}".encode()),
+            )
+            document["id"] = node_id
+            entry = {"document": document, "components": {}, "styles": {}}
+        return dumps_json(entry).encode("utf-8")
+
+    def file_info(self, file_key: str) -> dict[str, Any] | None:
+        """
+        /v1/files/{file_key}?depth=1 のレスポンス（保存済みレスポンスがない場合は None）
+        """
+        recorded = None
+        if self.responses_dir is not None:
+            recorded = self._recorded(file_key)
+            if recorded is None:
+                return None
+        recorded = recorded or {}
+        return {
+            "name": recorded.get("name", file_key),
+            "lastModified": recorded.get("lastModified", self.last_modified),
+            "version": recorded.get("version", self.version),
+            "document": {"id": "0:0", "name": "Document", "type": "DOCUMENT"},
+        }
+
+
+def make_handler(mock: FigmaMock) -> type[BaseHTTPRequestHandler]:
+    """
+    mock のレスポンスを返すリクエストハンドラのクラスを作成
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # リクエストごとのログは負荷試験の妨げになるため出力しない
+            pass
+
+        def do_GET(self) -> None:
+            mock.record("requests")
+            time.sleep(mock.delay())
+
+            if not self.headers.get("X-Figma-Token"):
+                self._send_json(403, {"status": 403, "err": "Invalid token"})
+                return
+
+            status = mock.fault()
+            if status == 429:
+                mock.record("429")
+                self._send_json(
+                    429,
+                    {"status": 429, "err": "Rate limit exceeded"},
+                    {"Retry-After": f"{mock.retry_after:g}"},
+                )
+                return
+            if status is not None:
+                mock.record("5xx")
+                self._send_json(status, {"status": status, "err": "Injected error"})
+                return
+
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "nodes":
+                ids = parse_qs(url.query).get("ids", [""])[0].split(",")
+                self._send_nodes(parts[2], [i for i in ids if i])
+                return
+            if len(parts) == 3 and parts[:2] == ["v1", "files"]:
+                info = mock.file_info(parts[2])
+                if info is not None:
+                    mock.record("ok")
+                    self._send_json(200, info)
+                    return
+
+            mock.record("404")
+            self._send_json(404, {"status": 404, "err": "Not found"})
+
+        def _send_nodes(self, file_key: str, node_ids: list[str]) -> None:
+            info = mock.file_info(file_key)
+            if info is None or not node_ids:
+                mock.record("404")
+                self._send_json(404, {"status": 404, "err": "Not found"})
+                return
+            # 各ノードはエンコード済みのバイト列をつなげて返す
+            entries = b",".join(
+                json.dumps(node_id).encode("utf-8")
+                + b":"
+                + mock.entry(file_key, node_id)
+                for node_id in node_ids
+            )
+            head = json.dumps(
+                {
+                    "name": info["name"],
+                    "lastModified": info["lastModified"],
+                    "version": info["version"],
+                },
+                ensure_ascii=False,
+            ).encode("utf-8")
+            mock.record("ok")
+            self._send(200, head[:-1] + b', "nodes": {' + entries + b"}}")
+
+        def _send_json(
+            self,
+            status: int,
+            payload: dict[str, Any],
+            headers: dict[str, str] | None = None,
+        ) -> None:
+            self._send(status, json.dumps(payload).encode("utf-8"), headers)
+
+        def _send(
+            self, status: int, body: bytes, headers: dict[str, str] | None = None
+        ) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def main():
+    """
+    モックサーバーのエントリーポイント
+    """
+    parser = argparse.ArgumentParser(description="Figma API のモックサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--responses",
+        help="保存済みの /nodes のレスポンス（{file_key}.json）のディレクトリ。"
+        "指定しない場合は node_id ごとに合成したツリーを返す",
+    )
+    parser.add_argument(
+        "--nodes", type=int, default=1000, help="合成する document のノード数"
+    )
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--text-ratio", type=float, default=0.3)
+    parser.add_argument("--instance-ratio", type=float, default=0.1)
+    parser.add_argument(
+        "--version", default="1", help="合成したレスポンスのファイルのバージョン"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=0, help="レスポンスまでの遅延（ミリ秒）"
+    )
+    parser.add_argument(
+        "--jitter-ms", type=float, default=0, help="遅延に加える乱数の上限（ミリ秒）"
+    )
+    parser.add_argument(
+        "--error-429-rate", type=float, default=0, help="429 を返す確率（0〜1）"
+    )
+    parser.add_argument(
+        "--error-5xx-rate", type=float, default=0, help="5xx を返す確率（0〜1）"
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=1.0, help="429 の Retry-After（秒）"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    mock = FigmaMock(
+        responses_dir=args.responses,
+        nodes=args.nodes,
+        fanout=args.fanout,
+        text_ratio=args.text_ratio,
+        instance_ratio=args.instance_ratio,
+        version=args.version,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_429_rate=args.error_429_rate,
+        error_5xx_rate=args.error_5xx_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    server.daemon_threads = True
+    base_url = f"http://{args.host}:{server.server_port}"
+    print(f"Figma API のモックサーバーを起動しました: {base_url}（Ctrl+C で終了）")
+    print(f"  例: FIGMA_API_BASE_URL={base_url} python main.py --no-cache ...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\nリクエスト統計: {json.dumps(mock.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+テスト共通の設定とフィクスチャ
+"""
+
+import sys
+import threading
+from collections.abc import Iterator
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# リポジトリ直下の main・benchmark・mock_figma_server を import できるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mock_figma_server import FigmaMock, make_handler  # noqa: E402
+
+
+class ScriptedFigmaMock(FigmaMock):
+    """
+    注入するエラーを乱数ではなく faults の順に返すモック（使い切った後は正常に応答する）
+    """
+
+    def __init__(self, faults: list[int] | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.faults = list(faults or [])
+
+    def fault(self) -> int | None:
+        with self._lock:
+            return self.faults.pop(0) if self.faults else None
+
+
+@pytest.fixture
+def figma_mock() -> Iterator[tuple[ScriptedFigmaMock, str]]:
+    """
+    スレッドで起動したモックサーバーと、そのベースURL
+    """
+    mock = ScriptedFigmaMock(nodes=50, retry_after=0.01)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(mock))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield mock, f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
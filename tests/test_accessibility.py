@@ -0,0 +1,251 @@
+"""
+ローカルのアクセシビリティ検査（コントラスト比・フォントサイズ・タッチターゲット）
+"""
+
+import random
+
+import pytest
+
+import main
+from benchmark import generate_text_frame
+
+
+def solid(r: float, g: float, b: float, a: float = 1, opacity: float = 1) -> dict:
+    return {
+        "type": "SOLID",
+        "color": {"r": r, "g": g, "b": b, "a": a},
+        "opacity": opacity,
+    }
+
+
+WHITE = solid(1, 1, 1)
+BLACK = solid(0, 0, 0)
+# 白背景とのコントラスト比が約4.48:1の灰色（#777777）
+GRAY = solid(0x77 / 255, 0x77 / 255, 0x77 / 255)
+
+
+def bbox(x: float, y: float, width: float, height: float) -> dict:
+    return {"x": x, "y": y, "width": width, "height": height}
+
+
+def text(
+    node_id: str,
+    fills: list,
+    font_size: float = 16,
+    font_weight: float = 400,
+    box: dict | None = None,
+) -> dict:
+    return {
+        "id": node_id,
+        "name": f"Text {node_id}",
+        "type": "TEXT",
+        "absoluteBoundingBox": box or bbox(10, 10, 100, 20),
+        "fills": fills,
+        "characters": "Hello",
+        "style": {"fontSize": font_size, "fontWeight": font_weight},
+    }
+
+
+def frame(children: list, fills: list | None = None, name: str = "Frame") -> dict:
+    return {
+        "id": "0:0",
+        "name": name,
+        "type": "FRAME",
+        "absoluteBoundingBox": bbox(0, 0, 400, 400),
+        "fills": [WHITE] if fills is None else fills,
+        "children": children,
+    }
+
+
+def contrast_findings(design: dict) -> dict:
+    return {
+        f.node_id: f
+        for f in main.run_accessibility_rules(design)
+        if f.rule == "contrast"
+    }
+
+
+def test_contrast_ratio_extremes():
+    assert main.contrast_ratio((0, 0, 0), (1, 1, 1)) == pytest.approx(21)
+    assert main.contrast_ratio((1, 1, 1), (0, 0, 0)) == pytest.approx(21)
+    assert main.contrast_ratio((0.5, 0.5, 0.5), (0.5, 0.5, 0.5)) == pytest.approx(1)
+
+
+def test_low_contrast_body_text_is_reported():
+    findings = contrast_findings(frame([text("1:1", [GRAY]), text("1:2", [BLACK])]))
+
+    assert set(findings) == {"1:1"}
+    assert not findings["1:1"].ambiguous
+    assert "4.48:1" in findings["1:1"].message
+    assert "#777777" in findings["1:1"].message
+
+
+@pytest.mark.parametrize(
+    ("font_size", "font_weight", "reported"),
+    [(16, 700, True), (18.66, 400, True), (18.66, 700, False), (24, 400, False)],
+)
+def test_large_text_uses_relaxed_threshold(font_size, font_weight, reported):
+    design = frame([text("1:1", [GRAY], font_size, font_weight)])
+    assert ("1:1" in contrast_findings(design)) is reported
+
+
+def test_semi_transparent_text_is_blended_with_background():
+    # 不透明度 40% の黒は白背景の上で薄い灰色になる
+    design = frame([text("1:1", [solid(0, 0, 0, opacity=0.4)])])
+    assert "1:1" in contrast_findings(design)
+
+
+def test_background_comes_from_covering_sibling():
+    card = {
+        "id": "1:0",
+        "name": "Card",
+        "type": "RECTANGLE",
+        "absoluteBoundingBox": bbox(0, 0, 200, 100),
+        "fills": [BLACK],
+    }
+    design = frame([card, text("1:1", [WHITE]), text("1:2", [BLACK])])
+
+    # 黒いカードの上の白い文字は問題なく、黒い文字は基準を満たさない
+    assert set(contrast_findings(design)) == {"1:2"}
+
+
+def test_background_behind_group_is_found_at_ancestor_level():
+    dark = {
+        "id": "1:0",
+        "name": "Dark",
+        "type": "RECTANGLE",
+        "absoluteBoundingBox": bbox(0, 0, 400, 200),
+        "fills": [BLACK],
+    }
+    group = {
+        "id": "1:1",
+        "name": "Group",
+        "type": "GROUP",
+        "absoluteBoundingBox": bbox(0, 0, 400, 200),
+        "children": [text("1:2", [BLACK]), text("1:3", [WHITE])],
+    }
+    pairs, ambiguous = main.collect_text_contrast_pairs(frame([dark, group]))
+
+    assert ambiguous == []
+    assert {node["id"]: background for node, _, background in pairs} == {
+        "1:2": (0, 0, 0, 1),
+        "1:3": (0, 0, 0, 1),
+    }
+
+
+def test_sibling_outside_text_bounds_is_not_background():
+    elsewhere = {
+        "id": "1:0",
+        "name": "Dark",
+        "type": "RECTANGLE",
+        "absoluteBoundingBox": bbox(300, 300, 50, 50),
+        "fills": [BLACK],
+    }
+    design = frame([elsewhere, text("1:1", [BLACK])])
+    assert contrast_findings(design) == {}
+
+
+def test_gradient_and_missing_backgrounds_are_ambiguous():
+    gradient = {"type": "GRADIENT_LINEAR", "gradientStops": []}
+    findings = contrast_findings(
+        frame(
+            [
+                text("1:1", [BLACK]),
+                {**frame([text("1:2", [BLACK])], fills=[]), "id": "2:0"},
+            ],
+            fills=[gradient],
+        )
+    )
+
+    assert set(findings) == {"1:1", "1:2"}
+    assert all(f.ambiguous for f in findings.values())
+
+    transparent = contrast_findings(frame([text("1:3", [BLACK])], fills=[]))
+    assert transparent["1:3"].ambiguous
+    assert "不透明な背景" in transparent["1:3"].message
+
+
+def test_small_font_size_is_reported():
+    findings = main.run_accessibility_rules(
+        frame([text("1:1", [BLACK], font_size=12), text("1:2", [BLACK], font_size=14)])
+    )
+    assert [(f.rule, f.node_id) for f in findings] == [("font_size", "1:1")]
+
+
+def test_touch_targets():
+    def node(node_id, name, node_type, width, height, children=()):
+        return {
+            "id": node_id,
+            "name": name,
+            "type": node_type,
+            "absoluteBoundingBox": bbox(0, 0, width, height),
+            "children": list(children),
+        }
+
+    design = frame(
+        [
+            node("1:1", "Submit Button", "FRAME", 100, 30),
+            node(
+                "1:2",
+                "IconButton",
+                "FRAME",
+                48,
+                48,
+                [node("1:3", "Icon", "INSTANCE", 24, 24)],
+            ),
+            node("1:4", "Avatar", "INSTANCE", 24, 24),
+            node("1:5", "Table header", "FRAME", 200, 20),
+            node("1:6", "Divider", "RECTANGLE", 200, 1),
+        ]
+    )
+    findings = {
+        f.node_id: f
+        for f in main.run_accessibility_rules(design)
+        if f.rule == "touch_target"
+    }
+
+    assert set(findings) == {"1:1", "1:4"}
+    assert not findings["1:1"].ambiguous
+    assert findings["1:4"].ambiguous
+
+
+@pytest.mark.parametrize(
+    ("name", "expected"),
+    [
+        ("IconButton", True),
+        ("btn_primary", True),
+        ("Sign-in link", True),
+        ("Table header", False),
+        ("Stable", False),
+    ],
+)
+def test_touch_target_names(name, expected):
+    assert main.is_touch_target_name(name) is expected
+
+
+def random_colors(rng, count: int) -> list[tuple]:
+    return [(rng.random(), rng.random(), rng.random(), 1.0) for _ in range(count)]
+
+
+def test_numpy_contrast_ratios_match_pure_python():
+    pytest.importorskip("numpy")
+    rng = random.Random(0)
+    # 線形化の境界（0.04045）の前後と、白黒の両端を含める
+    foregrounds = [(0.04045, 0.04, 0.0405, 1), (0, 0, 0, 1), *random_colors(rng, 500)]
+    backgrounds = [(1, 1, 1, 1), (1, 1, 1, 1), *random_colors(rng, 500)]
+
+    vectorized = main.contrast_ratios(foregrounds, backgrounds)
+    pure = main.contrast_ratios(foregrounds, backgrounds, use_numpy=False)
+
+    assert vectorized == pytest.approx(pure, rel=1e-12)
+    assert main.contrast_ratios([], []) == []
+
+
+def test_check_contrast_is_identical_without_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    design = generate_text_frame(2000, seed=1)
+    with_numpy = main.check_contrast(design)
+    assert with_numpy
+
+    monkeypatch.setattr(main, "_import_numpy", lambda: None)
+    assert main.check_contrast(design) == with_numpy
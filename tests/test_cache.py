@@ -0,0 +1,107 @@
+"""
+DiskCache と MemoryCache の有効期限と LRU による削除
+"""
+
+import os
+import time
+
+import main
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = main.DiskCache(str(tmp_path), max_bytes=1 << 20)
+    value = {"id": "1:2", "name": "日本語", "children": [{"x": 1.5}]}
+    cache.set("nodes", "key", value)
+
+    assert cache.get("nodes", "key") == value
+    assert cache.get("nodes", "missing") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disk_cache_expires_entries_after_ttl(tmp_path):
+    cache = main.DiskCache(str(tmp_path), max_bytes=1 << 20, ttl_seconds=60)
+    cache.set("nodes", "old", {"v": 1})
+    cache.set("nodes", "new", {"v": 2})
+    old_path = cache._path("nodes", "old")
+    created_at = time.time() - 120
+    os.utime(old_path, (created_at, created_at))
+
+    assert cache.get("nodes", "old") is None
+    assert not old_path.exists()
+    assert cache.get("nodes", "new") == {"v": 2}
+
+
+def test_disk_cache_evict_removes_expired_entries(tmp_path):
+    cache = main.DiskCache(str(tmp_path), max_bytes=1 << 20, ttl_seconds=60)
+    cache.set("nodes", "old", {"v": 1})
+    cache.set("nodes", "new", {"v": 2})
+    created_at = time.time() - 120
+    os.utime(cache._path("nodes", "old"), (created_at, created_at))
+
+    assert cache.evict() == 1
+    assert cache.get("nodes", "new") == {"v": 2}
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    value = {"data": "x" * 100}
+    cache = main.DiskCache(str(tmp_path), max_bytes=1 << 20)
+    for key in ("a", "b", "c"):
+        cache.set("nodes", key, value)
+    # 作成した順に古いアクセス日時を付け、a を読み直して最近使ったことにする
+    now = time.time()
+    for offset, key in enumerate(("a", "b", "c")):
+        path = cache._path("nodes", key)
+        os.utime(path, (now - 300 + offset, now - 300))
+    assert cache.get("nodes", "a") == value
+
+    entry_size = cache._path("nodes", "a").stat().st_size
+    cache.max_bytes = entry_size * 2
+    assert cache.evict() == 1
+
+    assert cache.get("nodes", "b") is None
+    assert cache.get("nodes", "a") == value
+    assert cache.get("nodes", "c") == value
+
+
+def test_disk_cache_clear_by_group(tmp_path):
+    cache = main.DiskCache(str(tmp_path), max_bytes=1 << 20)
+    cache.set("nodes", "key", 1)
+    cache.set("gemini", "key", 2)
+
+    assert cache.clear("nodes") == 1
+    assert cache.get("nodes", "key") is None
+    assert cache.get("gemini", "key") == 2
+
+
+def test_memory_cache_keeps_recent_entries_in_memory(tmp_path):
+    cache = main.MemoryCache(str(tmp_path), max_bytes=1 << 20, max_entries=2)
+    cache.set("nodes", "a", {"v": "a"})
+    cache.set("nodes", "b", {"v": "b"})
+    cache.get("nodes", "a")
+    cache.set("nodes", "c", {"v": "c"})
+
+    # ディスクだけを消すと、メモリに残っている a と c だけが返る
+    main.DiskCache(str(tmp_path), max_bytes=1 << 20).clear()
+    assert cache.get("nodes", "a") == {"v": "a"}
+    assert cache.get("nodes", "c") == {"v": "c"}
+    assert cache.get("nodes", "b") is None
+
+
+def test_memory_cache_reads_through_to_disk(tmp_path):
+    main.DiskCache(str(tmp_path), max_bytes=1 << 20).set("nodes", "a", [1, 2])
+    cache = main.MemoryCache(str(tmp_path), max_bytes=1 << 20)
+
+    assert cache.get("nodes", "a") == [1, 2]
+    main.DiskCache(str(tmp_path), max_bytes=1 << 20).clear()
+    assert cache.get("nodes", "a") == [1, 2]
+
+
+def test_memory_cache_expires_entries_after_ttl(tmp_path, monkeypatch):
+    cache = main.MemoryCache(str(tmp_path), max_bytes=1 << 20, ttl_seconds=60)
+    cache.set("nodes", "a", {"v": 1})
+    assert cache.get("nodes", "a") == {"v": 1}
+
+    later = time.time() + 120
+    monkeypatch.setattr(main.time, "time", lambda: later)
+    assert cache.get("nodes", "a") is None
+    assert not cache._path("nodes", "a").exists()
@@ -0,0 +1,98 @@
+"""
+トークン数の推定と、上限に収まるチャンクへの分割
+"""
+
+import json
+
+import pytest
+
+import main
+from benchmark import generate_figma_tree
+
+
+@pytest.fixture(scope="module")
+def design() -> dict:
+    return main.simplify_node_data(generate_figma_tree(3000, seed=0))
+
+
+def leaf_ids(node: dict) -> list:
+    children = node.get("children") or []
+    if not children:
+        return [node["id"]]
+    return [i for child in children for i in leaf_ids(child)]
+
+
+def test_count_tokens_ignores_indentation():
+    value = {"a": [1, 2, {"b": "text"}], "c": "日本語"}
+    indented = json.dumps(value, ensure_ascii=False, indent=2)
+    deeper = json.dumps(value, ensure_ascii=False, indent=8)
+
+    assert main.count_tokens(indented) == main.count_tokens(deeper)
+    assert main.count_tokens("日本語") == 3
+    assert main.count_tokens("abcdefgh") == 2
+
+
+def test_small_design_is_one_chunk(design):
+    assert main.plan_chunks(design, "json", 10**7) == [("全体", design)]
+
+
+@pytest.mark.parametrize("prompt_format", main.PROMPT_FORMATS)
+@pytest.mark.parametrize("token_budget", [2000, 8000])
+def test_chunks_fit_budget(design, prompt_format, token_budget):
+    chunks = main.plan_chunks(design, prompt_format, token_budget)
+
+    assert len(chunks) > 1
+    for _, chunk in chunks:
+        text = main.serialize_design(chunk, prompt_format)
+        # 祖先の殻を含めたチャンク全体が上限に収まる
+        assert main.count_tokens(text) <= token_budget
+    # すべての末端ノードが文書順にちょうど1回ずつ含まれる
+    assert [i for _, chunk in chunks for i in leaf_ids(chunk)] == leaf_ids(design)
+
+
+def test_oversized_leaf_is_its_own_chunk():
+    big_text = {"id": "1:2", "name": "Body", "type": "TEXT", "characters": "あ" * 500}
+    design = {
+        "id": "1:1",
+        "name": "Frame",
+        "type": "FRAME",
+        "children": [{"id": "1:0", "name": "Small", "type": "RECTANGLE"}, big_text],
+    }
+
+    chunks = main.plan_chunks(design, "json", 100)
+
+    assert [leaf_ids(chunk) for _, chunk in chunks] == [["1:0"], ["1:2"]]
+    assert chunks[1][1]["children"] == [big_text]
+
+
+def test_analyze_in_chunks_uses_one_call_when_measured_count_fits(design):
+    calls = []
+
+    def analyze(chunk):
+        calls.append(chunk)
+        return "# レポート"
+
+    report = main.analyze_design_in_chunks(
+        design, analyze, "compact", token_budget=8000, count=lambda text: 7000
+    )
+
+    assert report == "# レポート"
+    assert calls == [design]
+
+
+def test_analyze_in_chunks_replans_with_measured_count(design):
+    calls = []
+
+    def analyze(chunk):
+        calls.append(chunk)
+        return "# レポート"
+
+    estimated = main.count_tokens(main.serialize_design(design, "compact"))
+    planned = len(main.plan_chunks(design, "compact", 8000))
+    report = main.analyze_design_in_chunks(
+        design, analyze, "compact", token_budget=8000, count=lambda text: estimated * 2
+    )
+
+    # 実際のトークン数が推定の2倍なら、上限を半分に換算して分割し直す
+    assert len(calls) == len(main.plan_chunks(design, "compact", 4000)) > planned
+    assert report.startswith(f"# フレーム全体の分析（{len(calls)}分割）")
@@ -0,0 +1,97 @@
+"""
+FigmaClient のリトライと Retry-After の扱いを、モックサーバーに対して検証する
+"""
+
+import email.utils
+import time
+
+import pytest
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    # 5xx の指数バックオフでテストが遅くならないようにする
+    monkeypatch.setattr(main, "BACKOFF_BASE_SECONDS", 0.001)
+
+
+def make_client(base_url: str, **kwargs) -> main.FigmaClient:
+    return main.FigmaClient("token", base_url=base_url, rate_limit=0, **kwargs)
+
+
+def test_retries_429_after_retry_after(figma_mock):
+    mock, base_url = figma_mock
+    mock.faults = [429, 429]
+    with make_client(base_url) as client:
+        response = client.get("/v1/files/abc")
+
+    assert response.status_code == 200
+    assert response.json()["version"] == mock.version
+    assert mock.stats["429"] == 2
+    assert client.stats["requests"] == 3
+    assert client.stats["retries"] == 2
+    assert client.stats["rate_limited"] == 2
+    # Retry-After（0.01秒）に従って待機している
+    assert client.stats["throttled_seconds"] == pytest.approx(0.02)
+
+
+def test_retries_server_errors_with_backoff(figma_mock):
+    mock, base_url = figma_mock
+    mock.faults = [500, 503]
+    with make_client(base_url) as client:
+        response = client.get("/v1/files/abc")
+
+    assert response.status_code == 200
+    assert mock.stats["5xx"] == 2
+    assert client.stats["retries"] == 2
+    assert client.stats["rate_limited"] == 0
+
+
+def test_returns_last_response_after_max_retries(figma_mock):
+    mock, base_url = figma_mock
+    mock.faults = [502] * 10
+    with make_client(base_url, max_retries=2) as client:
+        response = client.get("/v1/files/abc")
+
+    assert response.status_code == 502
+    assert mock.stats["requests"] == 3
+    assert client.stats["retries"] == 2
+
+
+def test_does_not_wait_beyond_max_retry_after(figma_mock):
+    mock, base_url = figma_mock
+    mock.retry_after = 120
+    mock.faults = [429]
+    with make_client(base_url, max_retry_after=60) as client:
+        started_at = time.monotonic()
+        response = client.get("/v1/files/abc")
+
+    assert response.status_code == 429
+    assert time.monotonic() - started_at < 5
+    assert mock.stats["requests"] == 1
+    assert client.stats["retries"] == 0
+    assert client.stats["rate_limited"] == 1
+
+
+def test_fetch_figma_nodes_survives_injected_errors(figma_mock):
+    mock, base_url = figma_mock
+    mock.faults = [429, 500]
+    with make_client(base_url) as client:
+        nodes = main.fetch_figma_nodes("abc", ["1:2", "3:4"], client)
+
+    assert set(nodes) == {"1:2", "3:4"}
+    assert nodes["1:2"]["id"] == "1:2"
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [(None, None), ("", None), ("2.5", 2.5), ("-3", 0.0), ("soon", None)],
+)
+def test_parse_retry_after_seconds(value, expected):
+    assert main._parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    value = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert main._parse_retry_after(value) == pytest.approx(30, abs=2)
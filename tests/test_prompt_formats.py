@@ -0,0 +1,212 @@
+"""
+compact 形式・dedup 形式から元のデザインデータを復元できること
+"""
+
+import json
+
+import pytest
+
+import main
+from benchmark import generate_figma_tree, generate_instance_frame
+
+# 短縮名から元のキーへの対応
+EXPANDED_KEYS = {alias: key for key, alias in main.COMPACT_KEY_ALIASES.items()}
+
+WHITE = {"type": "SOLID", "color": {"r": 1, "g": 1, "b": 1, "a": 1}}
+
+
+def expand_compact(node: dict) -> dict:
+    """
+    compact 形式のノードを、キーと bbox を元の形式に戻す（塗りつぶしは色コードのまま）
+    """
+    expanded = {}
+    for alias, value in node.items():
+        key = EXPANDED_KEYS.get(alias, alias)
+        if key == "absoluteBoundingBox":
+            value = dict(zip(("x", "y", "width", "height"), value, strict=True))
+        elif key == "style":
+            value = {EXPANDED_KEYS.get(k, k): v for k, v in value.items()}
+        elif key == "children":
+            value = [expand_compact(child) for child in value]
+        expanded[key] = value
+    return expanded
+
+
+def normalize(node: dict) -> dict:
+    """
+    軽量化済みのノードを compact 形式と同じ精度にそろえる（null の除去・小数第1位への丸め・色コード化）
+    """
+    normalized = {}
+    for key, value in node.items():
+        if value is None:
+            continue
+        if key in ("absoluteBoundingBox", "style"):
+            value = {
+                k: round(v, 1) if isinstance(v, float) else v
+                for k, v in value.items()
+                if v is not None
+            }
+        elif key == "fills":
+            value = main._compact_fills(value)
+        elif key == "children":
+            value = [normalize(child) for child in value]
+        normalized[key] = value
+    return normalized
+
+
+def expand_dedup(node: dict, defs: dict, origin: list | None = None) -> dict:
+    """
+    dedup 形式のノードの参照を定義で置き換え、相対座標を絶対座標に戻した compact 形式にする
+    """
+    node = dict(node)
+    if origin is not None and "b" in node:
+        x, y, *size = node["b"]
+        node["b"] = [x + origin[0], y + origin[1], *size]
+    child_origin = origin
+    if "r" in node:
+        # 定義のルートには参照側の id・名前・位置を付ける
+        node = {**defs[node.pop("r")], **node}
+        child_origin = node["b"][:2]
+    if "ch" in node:
+        node["ch"] = [expand_dedup(child, defs, child_origin) for child in node["ch"]]
+    return node
+
+
+def without_ids(node: dict) -> dict:
+    # 定義の中のノードは id を持たないため、比較では id を除く
+    stripped = {k: v for k, v in node.items() if k not in ("i", "ch")}
+    if "ch" in node:
+        stripped["ch"] = [without_ids(child) for child in node["ch"]]
+    return stripped
+
+
+def node_ids(node: dict) -> list:
+    ids = [node["i"]] if "i" in node else []
+    for child in node.get("ch") or []:
+        ids += node_ids(child)
+    return ids
+
+
+def list_row(index: int, x: int, y: int) -> dict:
+    # 位置と id 以外は同じ構造の行
+    children = [
+        ("INSTANCE", "Icon", (16, 16, 40, 40)),
+        ("TEXT", "Title", (72, 14, 280, 24)),
+        ("TEXT", "Description", (72, 40, 280, 18)),
+    ]
+    return {
+        "id": f"{index}:0",
+        "name": "List Row",
+        "type": "INSTANCE",
+        "absoluteBoundingBox": {"x": x, "y": y, "width": 375, "height": 72},
+        "fills": [WHITE],
+        "children": [
+            {
+                "id": f"{index}:{i + 1}",
+                "name": name,
+                "type": node_type,
+                "absoluteBoundingBox": {
+                    "x": x + dx,
+                    "y": y + dy,
+                    "width": width,
+                    "height": height,
+                },
+            }
+            for i, (node_type, name, (dx, dy, width, height)) in enumerate(children)
+        ],
+    }
+
+
+def nested_frame() -> dict:
+    # 行を2つずつ含むセクション3つと、セクションの外にある行2つ（定義の中に参照ができる）
+    sections = [
+        {
+            "id": f"S:{s}",
+            "name": "Section",
+            "type": "FRAME",
+            "absoluteBoundingBox": {"x": 0, "y": s * 200, "width": 375, "height": 144},
+            "children": [list_row(s * 10 + r, 0, s * 200 + r * 72) for r in range(2)],
+        }
+        for s in range(3)
+    ]
+    rows = [list_row(100 + r, 400, r * 72) for r in range(2)]
+    return {
+        "id": "0:0",
+        "name": "Screen",
+        "type": "FRAME",
+        "absoluteBoundingBox": {"x": 0, "y": 0, "width": 800, "height": 600},
+        "fills": [WHITE],
+        "children": [*sections, *rows],
+    }
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_compact_round_trip(seed):
+    design = main.simplify_node_data(
+        generate_figma_tree(500, text_ratio=0.4, seed=seed)
+    )
+    compacted = main.compact_design_json(design)
+    assert expand_compact(compacted) == normalize(design)
+
+
+def test_compact_colors():
+    fills = [
+        {"type": "SOLID", "color": {"r": 1, "g": 0.5, "b": 0, "a": 1}},
+        {"type": "SOLID", "color": {"r": 0, "g": 0, "b": 0, "a": 1}, "opacity": 0.5},
+        {"type": "SOLID", "color": {"r": 0, "g": 0, "b": 1}, "visible": False},
+        {
+            "type": "GRADIENT_LINEAR",
+            "gradientStops": [
+                {"color": {"r": 1, "g": 1, "b": 1, "a": 1}},
+                {"color": {"r": 0, "g": 0, "b": 0, "a": 1}},
+            ],
+        },
+        {"type": "IMAGE"},
+    ]
+    assert main._compact_fills(fills) == [
+        "#FF8000",
+        "#00000080",
+        "GRADIENT_LINEAR(#FFFFFF,#000000)",
+        "IMAGE",
+    ]
+
+
+@pytest.mark.parametrize(
+    "design",
+    [
+        nested_frame(),
+        generate_instance_frame(20),
+        main.simplify_node_data(generate_figma_tree(300, seed=3)),
+    ],
+    ids=["nested", "instances", "synthetic"],
+)
+def test_dedup_round_trip(design):
+    compacted = main.compact_design_json(design)
+    deduped = main.dedup_design_json(design)
+
+    expanded = expand_dedup(deduped["tree"], deduped["defs"])
+    assert without_ids(expanded) == without_ids(compacted)
+    # 参照の外のノードと参照自身は id を保つ
+    assert set(node_ids(expanded)) <= set(node_ids(compacted))
+
+
+def test_dedup_shrinks_repeated_subtrees():
+    design = nested_frame()
+    deduped = main.dedup_design_json(design)
+
+    # セクションと行がそれぞれ1回だけ定義され、行の定義はセクションの定義からも参照される
+    assert len(deduped["defs"]) == 2
+    section, row = (deduped["defs"][name] for name in sorted(deduped["defs"]))
+    assert [child["r"] for child in section["ch"]] == ["D1", "D1"]
+    assert len(row["ch"]) == 3
+    assert len(main.serialize_design(design, "dedup")) < len(
+        main.serialize_design(design, "compact")
+    )
+
+
+def test_dedup_without_repeats_matches_compact():
+    design = main.simplify_node_data(list_row(1, 0, 0))
+    deduped = main.dedup_design_json(design)
+
+    assert deduped == {"defs": {}, "tree": main.compact_design_json(design)}
+    assert json.loads(main.serialize_design(design, "dedup")) == deduped
@@ -0,0 +1,150 @@
+"""
+サーバーモードのリクエストの検証（不正なリクエストは 400 を返す）
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+import main
+from benchmark import generate_deep_tree
+
+VALID_DESIGN = {
+    "id": "1:1",
+    "name": "Frame",
+    "type": "FRAME",
+    "absoluteBoundingBox": {"x": 0, "y": 0, "width": 375, "height": 812},
+    "fills": [{"type": "SOLID", "color": {"r": 1, "g": 1, "b": 1, "a": 1}}],
+    "children": [
+        {
+            "id": "1:2",
+            "name": "Title",
+            "type": "TEXT",
+            "characters": "Hello",
+            "style": {"fontFamily": "Inter", "fontSize": 16, "fontWeight": 700},
+        }
+    ],
+}
+
+
+@pytest.fixture(scope="module")
+def server_url() -> str:
+    """
+    スレッドで起動した serve() のURL（分析はデザインの id を返すだけ）
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    service = main.AnalysisService(
+        main.FigmaClient("token", base_url="http://127.0.0.1:9", rate_limit=0),
+        analyze=lambda design: f"# report {design.get('id')}",
+    )
+    thread = threading.Thread(
+        target=main.serve,
+        args=(service,),
+        kwargs={"port": port, "workers": 2},
+        daemon=True,
+    )
+    thread.start()
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            requests.get(f"{url}/health", timeout=1)
+            return url
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def post(url: str, data: bytes | str) -> requests.Response:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return requests.post(url, data=data, timeout=10)
+
+
+def with_child(**fields) -> dict:
+    child = {**VALID_DESIGN["children"][0], **fields}
+    return {**VALID_DESIGN, "children": [child]}
+
+
+def test_analyze_accepts_valid_design(server_url):
+    response = requests.post(
+        f"{server_url}/analyze", json={"design": VALID_DESIGN}, timeout=10
+    )
+    assert response.status_code == 200
+    assert response.json()["report"] == "# report 1:1"
+
+
+def test_analyze_accepts_deep_design(server_url):
+    design = main.simplify_node_data(generate_deep_tree(3000))
+    body = main.dumps_json({"design": design})
+    response = post(f"{server_url}/analyze", body)
+    assert response.status_code == 200
+
+
+def test_simplify_returns_simplified_node(server_url):
+    node = {**VALID_DESIGN, "visible": True, "effects": []}
+    response = requests.post(f"{server_url}/simplify", json={"node": node}, timeout=10)
+    assert response.status_code == 200
+    assert response.json()["design"] == main.simplify_node_data(node)
+
+
+@pytest.mark.parametrize(
+    ("body", "message"),
+    [
+        ("{", "line 1 column 2"),
+        ("[]", "JSONオブジェクト"),
+        ("{}", "file_key と node_id"),
+        ('{"file_key": 1, "node_id": "1:2"}', "file_key と node_id"),
+        ('{"design": []}', "design はオブジェクト"),
+        ('{"design": {"children": {}}}', "design.children は配列"),
+        ('{"design": {"id": 12}}', "design.id は文字列"),
+        (
+            '{"design": {"absoluteBoundingBox": {"x": "0"}}}',
+            "design.absoluteBoundingBox.x は数値",
+        ),
+        (
+            '{"design": {"absoluteBoundingBox": {"width": true}}}',
+            "design.absoluteBoundingBox.width は数値",
+        ),
+        ('{"design": {"absoluteBoundingBox": {"y": NaN}}}', "absoluteBoundingBox.y"),
+        ('{"design": {"fills": [1]}}', "design.fills[0] はオブジェクト"),
+        (
+            '{"design": {"fills": [{"color": {"r": "1"}}]}}',
+            "design.fills[0].color.r は数値",
+        ),
+    ],
+)
+def test_analyze_rejects_invalid_requests(server_url, body, message):
+    response = post(f"{server_url}/analyze", body)
+    assert response.status_code == 400
+    assert message in response.json()["error"]
+
+
+def test_analyze_reports_path_of_nested_error(server_url):
+    design = with_child(style={"fontSize": "16"})
+    response = requests.post(
+        f"{server_url}/analyze", json={"design": design}, timeout=10
+    )
+    assert response.status_code == 400
+    assert response.json()["error"] == (
+        "design.children[0].style.fontSize は数値で指定してください"
+    )
+
+
+def test_unknown_path_is_404(server_url):
+    assert requests.get(f"{server_url}/missing", timeout=10).status_code == 404
+    assert post(f"{server_url}/missing", "{}").status_code == 404
+
+
+def test_validate_accepts_nulls_and_deep_trees():
+    main.validate_node_tree(
+        {"id": None, "absoluteBoundingBox": {"x": None}, "fills": None}, "design"
+    )
+    main.validate_node_tree(generate_deep_tree(3000), "node")
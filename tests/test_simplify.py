@@ -0,0 +1,131 @@
+"""
+simplify_node_data と深さに依存しないJSONのデコード・エンコード
+"""
+
+import json
+
+import pytest
+
+import main
+from benchmark import (
+    generate_deep_tree,
+    generate_figma_tree,
+    simplify_node_data_recursive,
+)
+
+# 標準の json モジュールと再帰版では RecursionError になる深さ
+DEEP_TREE_DEPTH = 3000
+
+SAMPLE_VALUE = {
+    "name": '日本語 "quoted" \\ \n',
+    "numbers": [0, -1, 1.5, 1e-7, 2**53],
+    "flags": [True, False, None],
+    "empty": [{}, [], ""],
+    "nested": {"b": {"c": [1, {"d": []}]}, "a": 2},
+}
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_simplify_matches_recursive_version(seed):
+    tree = generate_figma_tree(2000, text_ratio=0.4, instance_ratio=0.2, seed=seed)
+    assert main.simplify_node_data(tree) == simplify_node_data_recursive(tree)
+
+
+def test_simplify_keeps_only_known_keys():
+    node = {
+        "id": "1:1",
+        "type": "FRAME",
+        "visible": True,
+        "children": [
+            {
+                "id": "1:2",
+                "type": "TEXT",
+                "characters": "Hello",
+                "style": {"fontSize": 12, "textCase": "UPPER"},
+                "absoluteBoundingBox": {"x": 0, "y": 0, "width": 10, "height": 5},
+                "effects": [],
+            },
+            {"id": "1:3", "type": "RECTANGLE", "characters": "ignored"},
+        ],
+    }
+    assert main.simplify_node_data(node) == {
+        "id": "1:1",
+        "type": "FRAME",
+        "children": [
+            {
+                "id": "1:2",
+                "type": "TEXT",
+                "absoluteBoundingBox": {"x": 0, "y": 0, "width": 10, "height": 5},
+                "characters": "Hello",
+                "style": {
+                    "fontFamily": None,
+                    "fontWeight": None,
+                    "fontSize": 12,
+                    "letterSpacing": None,
+                    "lineHeightPx": None,
+                },
+            },
+            {"id": "1:3", "type": "RECTANGLE"},
+        ],
+    }
+
+
+def test_simplify_handles_deep_trees():
+    tree = generate_deep_tree(DEEP_TREE_DEPTH)
+    with pytest.raises(RecursionError):
+        simplify_node_data_recursive(tree)
+
+    node = main.simplify_node_data(tree)
+    depth = 1
+    while node.get("children"):
+        node = node["children"][0]
+        depth += 1
+    assert depth == DEEP_TREE_DEPTH
+
+
+def test_deep_tree_survives_decode_serialize_and_cache_key():
+    raw = main.dumps_json(generate_deep_tree(DEEP_TREE_DEPTH)).encode("utf-8")
+    with pytest.raises(RecursionError):
+        json.loads(raw)
+
+    design = main.simplify_node_data(main.loads_json(raw))
+    for prompt_format in main.PROMPT_FORMATS:
+        text = main.serialize_design(design, prompt_format)
+        assert text.startswith("{")
+        main.loads_json(text)
+    assert main.analysis_cache_key(design, "json", True) == main.analysis_cache_key(
+        main.loads_json(main.dumps_json(design)), "json", True
+    )
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"indent": 2},
+        {"separators": (",", ":")},
+        {"indent": 2, "sort_keys": True},
+    ],
+)
+def test_dumps_json_fallback_matches_json_dumps(monkeypatch, kwargs):
+    expected = json.dumps(SAMPLE_VALUE, ensure_ascii=False, **kwargs)
+
+    def too_deep(*args, **kwargs):
+        raise RecursionError
+
+    monkeypatch.setattr(main.json, "dumps", too_deep)
+    assert main.dumps_json(SAMPLE_VALUE, **kwargs) == expected
+
+
+def test_loads_json_fallback_matches_json_loads(monkeypatch):
+    text = json.dumps(SAMPLE_VALUE, ensure_ascii=False)
+    expected = json.loads(text)
+
+    def too_deep(*args, **kwargs):
+        raise RecursionError
+
+    monkeypatch.setattr(main.json, "loads", too_deep)
+    assert main.loads_json(text) == expected
+    assert main.loads_json(text.encode("utf-8")) == expected
+    with pytest.raises(ValueError):
+        main.loads_json(text + "[")
@@ -0,0 +1,80 @@
+"""
+ストリーミングパース（parse_simplified_nodes）が全体をパースした結果と一致すること
+"""
+
+import io
+import json
+
+import main
+from benchmark import generate_figma_tree
+
+
+def make_response(documents: dict[str, dict | None]) -> dict:
+    nodes = {
+        node_id: None
+        if document is None
+        else {
+            "document": document,
+            "components": {"9:9": {"name": "Button", "description": ""}},
+            "styles": {"S:1": {"name": "Primary", "styleType": "FILL"}},
+            "schemaVersion": 0,
+        }
+        for node_id, document in documents.items()
+    }
+    return {
+        "name": "ファイル",
+        "lastModified": "2024-01-01T00:00:00Z",
+        "nodes": nodes,
+        "version": "12345",
+        "thumbnailUrl": "https://example.com/t.png",
+    }
+
+
+def test_stream_parse_matches_full_parse():
+    response = make_response(
+        {
+            "1:1": generate_figma_tree(1500, text_ratio=0.4, seed=1),
+            "1:2": generate_figma_tree(300, instance_ratio=0.3, seed=2),
+            "1:3": None,
+        }
+    )
+    raw = json.dumps(response, ensure_ascii=False).encode("utf-8")
+
+    documents, version = main.parse_simplified_nodes(io.BytesIO(raw))
+
+    full = json.loads(raw)
+    assert version == "12345"
+    assert documents == {
+        node_id: None if entry is None else main.simplify_node_data(entry["document"])
+        for node_id, entry in full["nodes"].items()
+    }
+
+
+def test_stream_parse_keeps_only_simplified_keys():
+    document = {
+        "id": "1:1",
+        "type": "TEXT",
+        "characters": "A",
+        "style": {"fontSize": 16.5, "fontFamily": "Inter", "textCase": "UPPER"},
+        "fills": [{"type": "SOLID", "color": {"r": 1, "g": 0, "b": 0, "a": 1}}],
+        "absoluteBoundingBox": {"x": 1, "y": 2, "width": 3, "height": 4, "r": 0},
+        "effects": [{"type": "DROP_SHADOW", "radius": 4}],
+        "children": [],
+    }
+    raw = json.dumps(make_response({"1:1": document})).encode("utf-8")
+
+    documents, _ = main.parse_simplified_nodes(io.BytesIO(raw))
+
+    assert documents["1:1"] == main.simplify_node_data(document)
+
+
+def test_fetch_with_stream_matches_non_stream(figma_mock):
+    _, base_url = figma_mock
+    node_ids = ["1:2", "3:4"]
+    with main.FigmaClient("token", base_url=base_url, rate_limit=0) as client:
+        streamed = main.fetch_figma_nodes("abc", node_ids, client, stream=True)
+        full = main.fetch_figma_nodes("abc", node_ids, client)
+
+    assert streamed == {
+        node_id: main.simplify_node_data(full[node_id]) for node_id in node_ids
+    }